@@ -4,15 +4,24 @@ import datetime
 from datetime import timedelta
 import uuid
 import secrets
-import csv
 import io
+import json
+import base64
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_file, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
 from werkzeug.middleware.proxy_fix import ProxyFix
-from PIL import Image, UnidentifiedImageError
+from werkzeug.security import safe_join
 from config import config
-from auth import User, OIDCAuth, init_auth_db, create_or_update_user, auth_required
+from auth import User, OIDCAuth, create_or_update_user, auth_required, get_user_cache
+import db
+import search as tool_search
+import reports
+import assets
+import http_cache
+import loans
+import images
+import migrations
 
 # Get configuration
 config_name = os.environ.get('FLASK_ENV', 'default')
@@ -23,6 +32,10 @@ app.config.from_object(app_config)
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 
 csrf = CSRFProtect(app)
+db.init_app(app)
+images.init_app(app)
+assets.init_app(app)
+http_cache.init_app(app)
 
 # Configure ProxyFix for reverse proxy support
 # This helps Flask understand the original request scheme when behind a reverse proxy
@@ -57,14 +70,8 @@ def make_session_permanent():
 
 # Initialize databases
 def get_conn():
-    # Ensure the directory for the database exists
-    db_dir = os.path.dirname(app.config['TOOLTRACKER_DB'])
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
-    
-    conn = sqlite3.connect(app.config['TOOLTRACKER_DB'])
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Pooled connection for the current request, returned to the pool at teardown
+    return db.get_db()
 
 def init_db():
     # Ensure the upload folder exists and has proper permissions
@@ -77,96 +84,14 @@ def init_db():
         app.logger.warning(f"Upload folder {app.config['UPLOAD_FOLDER']} is not writable")
     
     with get_conn() as conn:
-        c = conn.cursor()
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS tools (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                value REAL,
-                image_path TEXT,
-                brand TEXT,
-                model_number TEXT,
-                serial_number TEXT,
-                acquisition_date TEXT,
-                created_by TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(created_by) REFERENCES users(id)
-            )
-            """
-        )
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS people (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact_info TEXT,
-                created_by TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(created_by) REFERENCES users(id),
-                UNIQUE(name, created_by)
-            )
-            """
-        )
-        # Ensure contact_info column exists for older databases
-        try:
-            c.execute("ALTER TABLE people ADD COLUMN contact_info TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        # Ensure created_by columns exist for older databases
-        try:
-            c.execute("ALTER TABLE tools ADD COLUMN created_by TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE people ADD COLUMN created_by TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        # Add new tool fields for existing databases
-        try:
-            c.execute("ALTER TABLE tools ADD COLUMN brand TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tools ADD COLUMN model_number TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tools ADD COLUMN serial_number TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tools ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
-        
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS loans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tool_id INTEGER NOT NULL,
-                person_id INTEGER NOT NULL,
-                lent_on TEXT NOT NULL,
-                returned_on TEXT,
-                lent_by TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(tool_id) REFERENCES tools(id),
-                FOREIGN KEY(person_id) REFERENCES people(id),
-                FOREIGN KEY(lent_by) REFERENCES users(id)
-            )
-            """
-        )
-        
-        # Ensure lent_by column exists for older databases
-        try:
-            c.execute("ALTER TABLE loans ADD COLUMN lent_by TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        conn.commit()
+        journal_mode = db.apply_storage_profile(conn, db.storage_profile())
+        app.logger.info(f"SQLite storage profile '{app.config['SQLITE_STORAGE_PROFILE']}' (journal_mode={journal_mode})")
+
+        # Tables, indexes, search index, report summaries and image tables are
+        # all versioned; when the schema is current this is one PRAGMA read
+        applied = migrations.migrate(conn, app.config['TOOLTRACKER_DB'])
+        if applied:
+            app.logger.info(f"Database migrated to version {applied[-1]}")
 
 def test_people_constraint():
     """Test that the people table constraint is working correctly"""
@@ -208,74 +133,27 @@ def test_people_constraint():
         print(f"Error testing constraint: {e}")
         return False
 
-def migrate_tools_table():
-    """Migrate existing tools table to include new fields"""
-    try:
+def tools_has_created_at():
+    """Whether tools has the created_at column, checked once per process"""
+    has_created_at = app.extensions.get('tools_has_created_at')
+    if has_created_at is None:
         with get_conn() as conn:
-            c = conn.cursor()
-            
-            # Check if new columns already exist
-            c.execute("PRAGMA table_info(tools)")
-            columns = [col[1] for col in c.fetchall()]
-            
-            migrations_applied = []
-            
-            # Add brand column if it doesn't exist
-            if 'brand' not in columns:
-                try:
-                    c.execute("ALTER TABLE tools ADD COLUMN brand TEXT")
-                    migrations_applied.append("brand")
-                    app.logger.info("Added brand column to tools table")
-                except sqlite3.OperationalError as e:
-                    app.logger.error(f"Error adding brand column: {e}")
-            
-            # Add model_number column if it doesn't exist
-            if 'model_number' not in columns:
-                try:
-                    c.execute("ALTER TABLE tools ADD COLUMN model_number TEXT")
-                    migrations_applied.append("model_number")
-                    app.logger.info("Added model_number column to tools table")
-                except sqlite3.OperationalError as e:
-                    app.logger.error(f"Error adding model_number column: {e}")
-            
-            # Add serial_number column if it doesn't exist
-            if 'serial_number' not in columns:
-                try:
-                    c.execute("ALTER TABLE tools ADD COLUMN serial_number TEXT")
-                    migrations_applied.append("serial_number")
-                    app.logger.info("Added serial_number column to tools table")
-                except sqlite3.OperationalError as e:
-                    app.logger.error(f"Error adding serial_number column: {e}")
-            
-            # Add created_at column if it doesn't exist
-            if 'created_at' not in columns:
-                try:
-                    c.execute("ALTER TABLE tools ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                    migrations_applied.append("created_at")
-                    app.logger.info("Added created_at column to tools table")
-                except sqlite3.OperationalError as e:
-                    app.logger.error(f"Error adding created_at column: {e}")
-            
-            # Add acquisition_date column if it doesn't exist
-            if 'acquisition_date' not in columns:
-                try:
-                    c.execute("ALTER TABLE tools ADD COLUMN acquisition_date TEXT")
-                    migrations_applied.append("acquisition_date")
-                    app.logger.info("Added acquisition_date column to tools table")
-                except sqlite3.OperationalError as e:
-                    app.logger.error(f"Error adding acquisition_date column: {e}")
-            
-            if migrations_applied:
-                conn.commit()
-                app.logger.info(f"Migration completed. Added columns: {', '.join(migrations_applied)}")
-            else:
-                app.logger.info("No migration needed - all columns already exist")
-                
-            return True
-                
-    except Exception as e:
-        app.logger.error(f"Error during migration: {e}")
-        return False
+            columns = [col[1] for col in conn.execute("PRAGMA table_info(tools)")]
+        has_created_at = app.extensions['tools_has_created_at'] = 'created_at' in columns
+    return has_created_at
+
+def tool_search_uses_fts():
+    """Whether tool search goes through tools_fts, checked once per process"""
+    use_fts = app.extensions.get('tool_search_fts')
+    if use_fts is None:
+        use_fts = app.config['TOOL_SEARCH_BACKEND'] == 'fts'
+        if use_fts:
+            with get_conn() as conn:
+                use_fts = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tools_fts'"
+                ).fetchone() is not None
+        app.extensions['tool_search_fts'] = use_fts
+    return use_fts
 
 # Database initialization will be done in app context
 
@@ -303,73 +181,6 @@ def generate_unique_filename(original_filename):
     
     return new_filename
 
-def optimize_image(image_file):
-    """
-    Optimize uploaded image by resizing and compressing
-    Returns the optimized image as bytes and the file extension
-    """
-    try:
-        # Open the image
-        img = Image.open(image_file)
-        
-        # Convert to RGB if necessary (for JPEG compatibility)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        
-        # Get original dimensions
-        original_width, original_height = img.size
-        
-        # Calculate new dimensions while maintaining aspect ratio
-        if original_width > app.config['MAX_IMAGE_DIMENSION'] or original_height > app.config['MAX_IMAGE_DIMENSION']:
-            if original_width > original_height:
-                new_width = app.config['MAX_IMAGE_DIMENSION']
-                new_height = int(original_height * (app.config['MAX_IMAGE_DIMENSION'] / original_width))
-            else:
-                new_height = app.config['MAX_IMAGE_DIMENSION']
-                new_width = int(original_width * (app.config['MAX_IMAGE_DIMENSION'] / original_height))
-            
-            # Resize the image
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            app.logger.debug(f"Resized image from {original_width}x{original_height} to {new_width}x{new_height}")
-        
-        # Save optimized image to bytes
-        output = io.BytesIO()
-        
-        # Determine output format and save with optimization
-        if img.format in ('JPEG', 'JPG') or img.mode == 'RGB':
-            # Save as JPEG with compression
-            img.save(output, format='JPEG', quality=app.config['JPEG_QUALITY'], optimize=True)
-            extension = '.jpg'
-        else:
-            # Save as PNG for transparency support
-            img.save(output, format='PNG', optimize=True)
-            extension = '.png'
-        
-        output.seek(0)
-        return output, extension
-        
-    except (IOError, OSError, UnidentifiedImageError) as e:
-        app.logger.error(f"Error optimizing image: {e}")
-        return None, None
-
-def generate_thumbnail(image_path):
-    """Generate a thumbnail version of an image, saved alongside as <name>_thumb.<ext>"""
-    try:
-        img = Image.open(image_path)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        dim = app.config.get('THUMBNAIL_DIMENSION', 200)
-        img.thumbnail((dim, dim), Image.Resampling.LANCZOS)
-        base, ext = os.path.splitext(image_path)
-        thumb_path = f"{base}_thumb{ext}"
-        fmt = 'JPEG' if ext.lower() in ('.jpg', '.jpeg') else 'PNG'
-        img.save(thumb_path, format=fmt, quality=app.config['JPEG_QUALITY'], optimize=True)
-        return thumb_path
-    except (IOError, OSError, UnidentifiedImageError) as e:
-        app.logger.error(f"Error generating thumbnail: {e}")
-        return None
-
-
 def validate_image_file(image_file):
     """
     Validate image file size and type
@@ -406,14 +217,22 @@ def login():
     # Generate state for CSRF protection
     state = secrets.token_urlsafe(32)
     session['oauth_state'] = state
+    nonce = secrets.token_urlsafe(32)
+    session['oauth_nonce'] = nonce
     
     # Get authorization URL - use configured redirect URI
     redirect_uri = app.config['OIDC_REDIRECT_URI']
     app.logger.info(f'Using redirect_uri: {redirect_uri}')
 
-    auth_url = oidc_auth.get_authorization_url(redirect_uri, state)
+    auth_url = oidc_auth.get_authorization_url(redirect_uri, state, nonce)
     
     if not auth_url:
+        if oidc_auth.discovery_pending:
+            # The metadata refresher is still contacting the identity provider
+            response = app.make_response((render_template(
+                'login.html', error='Sign-in is starting up. Please try again in a few seconds.'), 503))
+            response.headers['Retry-After'] = '5'
+            return response
         return render_template('login.html', error='Authentication not configured'), 500
     
     return redirect(auth_url)
@@ -429,6 +248,7 @@ def oidc_callback():
     
     # Clear state from session
     session.pop('oauth_state', None)
+    nonce = session.pop('oauth_nonce', None)
     
     # Handle authorization response
     try:
@@ -446,8 +266,8 @@ def oidc_callback():
         
         app.logger.info('Successfully obtained access token')
         
-        # Get user information
-        userinfo = oidc_auth.get_userinfo(token_data['access_token'])
+        # Get user information, from the ID token if it verifies
+        userinfo = oidc_auth.get_user_claims(token_data, nonce)
         if not userinfo:
             app.logger.error('Failed to get user information from OIDC provider')
             flash('Failed to get user information')
@@ -491,7 +311,13 @@ def health():
             conn.execute('SELECT 1')
     except Exception:
         return jsonify({'status': 'unhealthy', 'service': 'tooltracker'}), 500
-    return jsonify({'status': 'healthy', 'service': 'tooltracker'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'tooltracker',
+        'db_pool': db.get_pool().stats(),
+        'user_cache': get_user_cache().stats(),
+        'oidc_metadata': oidc_auth.metadata.stats() if oidc_auth.metadata else None,
+    }), 200
 
 @app.route('/')
 @auth_required
@@ -509,9 +335,34 @@ def people():
     return render_template('people.html', people=people)
 
 
+def encode_cursor(state):
+    """Encode keyset pagination state as an opaque URL-safe token"""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    """Decode a token from encode_cursor; an empty token means the first page.
+
+    Raises ValueError if the token is malformed.
+    """
+    if not token:
+        return {}
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"malformed cursor: {e}")
+    if not isinstance(state, dict) or type(state.get('id')) is not int:
+        raise ValueError("malformed cursor")
+    if 'total' in state and type(state['total']) is not int:
+        raise ValueError("malformed cursor")
+    return state
+
+
 @app.route('/api/tools', methods=['GET', 'POST'])
 @auth_required
 @csrf.exempt
+@http_cache.conditional
 def api_tools():
     if request.method == 'POST':
         data = request.get_json()
@@ -540,16 +391,27 @@ def api_tools():
     per_page = request.args.get('per_page', 20, type=int)
     search = request.args.get('search', '').strip()
     brand = request.args.get('brand', '').strip()
+    # Keyset mode when a cursor is passed (empty for the first page)
+    cursor = request.args.get('cursor')
     
     # Ensure reasonable limits
     per_page = min(max(per_page, 10), 100)
     page = max(page, 1)
     offset = (page - 1) * per_page
 
+    after = {}
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'invalid cursor'}), 400
+
     with get_conn() as conn:
         c = conn.cursor()
         
         # Build the base query with filters
+        match = tool_search.match_query(search) if search and tool_search_uses_fts() else ''
+        order_by = "t.id"
         base_query = """
             FROM tools t
             LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
@@ -557,25 +419,77 @@ def api_tools():
             WHERE t.created_by = ?
         """
         params = [current_user.id]
-        
-        # Add search filter
-        if search:
-            search_conditions = [
-                "t.name LIKE ?",
-                "t.description LIKE ?", 
-                "t.brand LIKE ?",
-                "t.model_number LIKE ?",
-                "t.serial_number LIKE ?",
-                "p.name LIKE ?"
-            ]
-            search_param = f"%{search}%"
-            base_query += " AND (" + " OR ".join(search_conditions) + ")"
-            params.extend([search_param] * 6)
+        if match:
+            # Full-text prefix matches on every word, best first, then the tools
+            # that only contain the text inside a word (FTS5 only matches word
+            # starts, so '001' needs LIKE to find 'HM001')
+            like_sql, like_params = tool_search.like_filter(search)
+            base_query = f"""
+                FROM tools t
+                LEFT JOIN (
+                    SELECT rowid, {tool_search.bm25_rank()} AS rank FROM tools_fts WHERE tools_fts MATCH ?
+                ) f ON f.rowid = t.id
+                LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+                LEFT JOIN people p ON l.person_id = p.id
+                WHERE t.created_by = ? AND (f.rowid IS NOT NULL OR {like_sql})
+            """
+            params = [match, current_user.id] + like_params
+            order_by = "f.rank IS NULL, f.rank, t.id"
+        elif search:
+            # LIKE fallback when FTS5 is unavailable
+            like_sql, like_params = tool_search.like_filter(search)
+            base_query += " AND " + like_sql
+            params.extend(like_params)
         
         # Add brand filter
         if brand:
             base_query += " AND t.brand = ?"
             params.append(brand)
+
+        columns = "t.id, t.name, t.description, t.value, t.image_path, t.brand, t.model_number, t.serial_number, t.acquisition_date, p.name AS borrower, l.lent_on"
+
+        if cursor is not None:
+            # Seek past the last row of the previous page instead of OFFSET, so
+            # every page costs the same. The total is only counted on request
+            # and then carried forward in the cursor.
+            # Search results are paged in id order too: bm25() scores depend on
+            # statistics over every user's rows, so any write anywhere would
+            # move a stored rank and make the next page skip or repeat tools.
+            # Clients wanting results best-first page searches with ?page=.
+            seek_query = base_query
+            seek_params = list(params)
+            if after:
+                seek_query += " AND t.id > ?"
+                seek_params.append(after['id'])
+
+            c.execute(
+                f"SELECT {columns} {seek_query} ORDER BY t.id LIMIT ?",
+                seek_params + [per_page + 1],
+            )
+            tools = [dict(row) for row in c.fetchall()]
+            has_next = len(tools) > per_page
+            tools = tools[:per_page]
+
+            total_count = after.get('total')
+            if total_count is None and request.args.get('include_total') == '1':
+                c.execute(f"SELECT COUNT(*) {base_query}", params)
+                total_count = c.fetchone()[0]
+
+            next_cursor = None
+            if has_next:
+                state = {'id': tools[-1]['id']}
+                if total_count is not None:
+                    state['total'] = total_count
+                next_cursor = encode_cursor(state)
+
+            pagination = {
+                'per_page': per_page,
+                'has_next': has_next,
+                'next_cursor': next_cursor,
+            }
+            if total_count is not None:
+                pagination['total_count'] = total_count
+            return jsonify({'tools': tools, 'pagination': pagination})
         
         # Get total count for pagination
         count_query = f"SELECT COUNT(*) {base_query}"
@@ -584,9 +498,9 @@ def api_tools():
         
         # Get paginated results
         tools_query = f"""
-            SELECT t.id, t.name, t.description, t.value, t.image_path, t.brand, t.model_number, t.serial_number, t.acquisition_date, p.name AS borrower, l.lent_on
+            SELECT {columns}
             {base_query}
-            ORDER BY t.id
+            ORDER BY {order_by}
             LIMIT ? OFFSET ?
         """
         params.extend([per_page, offset])
@@ -613,6 +527,7 @@ def api_tools():
 
 @app.route('/api/brands', methods=['GET'])
 @auth_required
+@http_cache.conditional
 def api_brands():
     """Get all unique brands for the current user's tools"""
     with get_conn() as conn:
@@ -654,31 +569,22 @@ def add_tool():
                 flash(error_message)
                 return render_template('add_tool.html')
 
+            if not images.check_image(image_file):
+                flash('Error processing image. Please try again.')
+                return render_template('add_tool.html')
+
             try:
                 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-                # Optimize the image
-                optimized_image, extension = optimize_image(image_file)
-                if not optimized_image:
-                    flash('Error processing image. Please try again.')
-                    return render_template('add_tool.html')
-
-                # Generate unique filename with correct extension
-                unique_filename = generate_unique_filename(f"image{extension}")
-                save_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-                # Save the optimized image
-                with open(save_path, 'wb') as f:
-                    f.write(optimized_image.getvalue())
-
-                # Generate thumbnail for list views
-                generate_thumbnail(save_path)
+                # Store the original now; resizing and the variants are done in the background
+                unique_filename = images.original_filename(generate_unique_filename(image_file.filename))
+                images.save_original(image_file, os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
 
                 # Store relative path for database
                 image_path = os.path.join('images', unique_filename)
-                app.logger.debug(f"Optimized image uploaded successfully: {unique_filename}")
+                app.logger.debug(f"Image uploaded, queued for processing: {unique_filename}")
 
-            except (IOError, OSError, UnidentifiedImageError) as e:
+            except (IOError, OSError) as e:
                 app.logger.error(f"Error uploading image: {e}")
                 image_path = None
                 flash('Error uploading image. Please try again.')
@@ -693,7 +599,11 @@ def add_tool():
                 "INSERT INTO tools (name, description, value, image_path, brand, model_number, serial_number, acquisition_date, created_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
                 (name, description, value, image_path, brand, model_number, serial_number, acquisition_date, current_user.id),
             )
+            if image_path:
+                job_id = images.enqueue(conn, c.lastrowid, unique_filename)
             conn.commit()
+        if image_path:
+            images.submit(app, job_id)
         return redirect(url_for('index'))
     return render_template('add_tool.html')
 
@@ -728,14 +638,10 @@ def add_person():
 
 
 def delete_tool_image(image_path):
-    """Delete the image file if it exists"""
+    """Delete the image files once no tool references them (call after commit)"""
     if image_path:
         try:
-            # Convert relative path to absolute path
-            full_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(image_path))
-            if os.path.exists(full_path):
-                os.remove(full_path)
-                app.logger.debug(f"Deleted image file: {full_path}")
+            images.release_image(get_conn(), app.config['UPLOAD_FOLDER'], image_path)
         except (IOError, OSError) as e:
             app.logger.error(f"Error deleting image file: {e}")
 
@@ -762,16 +668,18 @@ def delete_tool(tool_id):
             # Get the image path before deleting the tool
             c.execute("SELECT image_path FROM tools WHERE id=?", (tool_id,))
             tool = c.fetchone()
-            if tool and tool['image_path']:
-                delete_tool_image(tool['image_path'])
-            
+
             c.execute("DELETE FROM tools WHERE id=?", (tool_id,))
             conn.commit()
+            # Other tools may share the same (deduplicated) image
+            if tool and tool['image_path']:
+                delete_tool_image(tool['image_path'])
     return redirect(url_for('index'))
 
 
 @app.route('/lend/<int:tool_id>', methods=['GET', 'POST'])
 @auth_required
+@db.busy_retry
 def lend_tool(tool_id):
     if request.method == 'POST':
         person_id = request.form.get('person_id')
@@ -827,6 +735,7 @@ def lend_tool(tool_id):
 
 @app.route('/return/<int:tool_id>', methods=['POST'])
 @auth_required
+@db.busy_retry
 def return_tool(tool_id):
     with get_conn() as conn:
         c = conn.cursor()
@@ -853,6 +762,40 @@ def return_tool(tool_id):
     return redirect(url_for('index'))
 
 
+def _loan_batch(apply, *defaults):
+    """Run a loans.py batch from the JSON body and answer with its per-item results"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON body required'}), 400
+    with get_conn() as conn:
+        try:
+            results = apply(conn, current_user.id, data.get('items'), *(data.get(name) for name in defaults))
+        except loans.BatchError as e:
+            return jsonify({'error': str(e)}), 400
+        if conn.in_transaction:
+            conn.commit()
+    applied = sum(1 for result in results if result['ok'])
+    return jsonify({'applied': applied, 'failed': len(results) - applied, 'results': results})
+
+
+@app.route('/api/loans/batch/lend', methods=['POST'])
+@auth_required
+@csrf.exempt
+@db.busy_retry
+def api_lend_batch():
+    """Lend many tools in one transaction: {"person_id", "lent_date", "items": [{"tool_id"}, ...]}"""
+    return _loan_batch(loans.lend_tools, 'person_id', 'lent_date')
+
+
+@app.route('/api/loans/batch/return', methods=['POST'])
+@auth_required
+@csrf.exempt
+@db.busy_retry
+def api_return_batch():
+    """Return many tools in one transaction: {"returned_date", "items": [{"tool_id"}, ...]}"""
+    return _loan_batch(loans.return_tools, 'returned_date')
+
+
 @app.route('/edit_loan/<int:loan_id>', methods=['GET', 'POST'])
 @auth_required
 def edit_loan(loan_id):
@@ -1092,80 +1035,13 @@ def overdue_report():
 @auth_required
 def financial_report():
     with get_conn() as conn:
-        c = conn.cursor()
-        
-        # Get total inventory value
-        c.execute(
-            """
-            SELECT COUNT(*) as total_tools, 
-                   COALESCE(SUM(value), 0) as total_value,
-                   COALESCE(AVG(value), 0) as avg_value
-            FROM tools 
-            WHERE created_by = ?
-            """,
-            (current_user.id,)
-        )
-        inventory_stats = c.fetchone()
-        
-        # Get value of tools currently lent out
-        c.execute(
-            """
-            SELECT COUNT(*) as tools_lent_out,
-                   COALESCE(SUM(t.value), 0) as value_lent_out
-            FROM tools t
-            JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
-            WHERE t.created_by = ?
-            """,
-            (current_user.id,)
-        )
-        lent_stats = c.fetchone()
+        # Totals and value ranges come from the trigger-maintained summary tables
+        inventory_stats, lent_stats, value_distribution = reports.financial_summary(conn, current_user.id)
         
         # Get value of tools available (not lent out)
         available_value = inventory_stats['total_value'] - lent_stats['value_lent_out']
         available_tools = inventory_stats['total_tools'] - lent_stats['tools_lent_out']
         
-        # Get tools by value ranges for distribution analysis
-        c.execute(
-            """
-            SELECT 
-                CASE 
-                    WHEN value IS NULL OR value = 0 THEN 'No Value Set'
-                    WHEN value <= 50 THEN '$0 - $50'
-                    WHEN value <= 100 THEN '$51 - $100'
-                    WHEN value <= 250 THEN '$101 - $250'
-                    WHEN value <= 500 THEN '$251 - $500'
-                    WHEN value <= 1000 THEN '$501 - $1000'
-                    ELSE '$1000+'
-                END as value_range,
-                COUNT(*) as count,
-                COALESCE(SUM(value), 0) as total_value
-            FROM tools 
-            WHERE created_by = ?
-            GROUP BY 
-                CASE 
-                    WHEN value IS NULL OR value = 0 THEN 'No Value Set'
-                    WHEN value <= 50 THEN '$0 - $50'
-                    WHEN value <= 100 THEN '$51 - $100'
-                    WHEN value <= 250 THEN '$101 - $250'
-                    WHEN value <= 500 THEN '$251 - $500'
-                    WHEN value <= 1000 THEN '$501 - $1000'
-                    ELSE '$1000+'
-                END
-            ORDER BY 
-                CASE value_range
-                    WHEN 'No Value Set' THEN 0
-                    WHEN '$0 - $50' THEN 1
-                    WHEN '$51 - $100' THEN 2
-                    WHEN '$101 - $250' THEN 3
-                    WHEN '$251 - $500' THEN 4
-                    WHEN '$501 - $1000' THEN 5
-                    ELSE 6
-                END
-            """,
-            (current_user.id,)
-        )
-        value_distribution = c.fetchall()
-        
     return render_template('financial_report.html',
                          inventory_stats=inventory_stats,
                          lent_stats=lent_stats,
@@ -1179,24 +1055,8 @@ def financial_report():
 def brand_report():
     """Show brand breakdown report"""
     with get_conn() as conn:
-        c = conn.cursor()
-        
-        # Get brand breakdown data
-        c.execute(
-            """
-            SELECT 
-                brand,
-                COUNT(*) as tool_count,
-                COALESCE(SUM(value), 0) as total_value,
-                COALESCE(AVG(value), 0) as avg_value
-            FROM tools 
-            WHERE created_by = ? AND brand IS NOT NULL AND brand != ''
-            GROUP BY brand
-            ORDER BY total_value DESC
-            """,
-            (current_user.id,)
-        )
-        brand_data = c.fetchall()
+        # Get brand breakdown data from the trigger-maintained summary table
+        brand_data = reports.brand_summary(conn, current_user.id)
         
         # Calculate totals and percentages
         total_value = sum(brand['total_value'] for brand in brand_data)
@@ -1336,6 +1196,10 @@ def edit_tool(tool_id):
                     flash(error_message)
                     return redirect(url_for('edit_tool', tool_id=tool_id))
 
+                if not images.check_image(image_file):
+                    flash('Error processing image. Please try again.')
+                    return redirect(url_for('edit_tool', tool_id=tool_id))
+
                 try:
                     # Get the old image path before updating
                     c.execute("SELECT image_path FROM tools WHERE id=?", (tool_id,))
@@ -1344,41 +1208,32 @@ def edit_tool(tool_id):
 
                     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-                    # Optimize the image
-                    optimized_image, extension = optimize_image(image_file)
-                    if not optimized_image:
-                        flash('Error processing image. Please try again.')
-                        return redirect(url_for('edit_tool', tool_id=tool_id))
-
-                    # Generate unique filename with correct extension
-                    unique_filename = generate_unique_filename(f"image{extension}")
-                    save_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-                    # Save the optimized image
-                    with open(save_path, 'wb') as f:
-                        f.write(optimized_image.getvalue())
-
-                    # Generate thumbnail for list views
-                    generate_thumbnail(save_path)
+                    # Store the original now; resizing and the variants are done in the background
+                    unique_filename = images.original_filename(generate_unique_filename(image_file.filename))
+                    images.save_original(image_file, os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
 
                     # Store relative path for database
                     image_path = os.path.join('images', unique_filename)
-                    app.logger.debug(f"Optimized image updated successfully: {unique_filename}")
+                    app.logger.debug(f"Image updated, queued for processing: {unique_filename}")
 
-                except (IOError, OSError, UnidentifiedImageError) as e:
+                except (IOError, OSError) as e:
                     app.logger.error(f"Error updating image: {e}")
                     image_path = None
                     flash('Error updating image. Please try again.')
                 c.execute(
-                    "UPDATE tools SET name=?, description=?, value=?, image_path=?, brand=?, model_number=?, serial_number=?, acquisition_date=? WHERE id=?",
+                    "UPDATE tools SET name=?, description=?, value=?, image_path=?, image_status=NULL, brand=?, model_number=?, serial_number=?, acquisition_date=? WHERE id=?",
                     (name, description, value, image_path, brand, model_number, serial_number, acquisition_date, tool_id),
                 )
+                if image_path:
+                    job_id = images.enqueue(conn, tool_id, unique_filename)
             else:
                 c.execute(
                     "UPDATE tools SET name=?, description=?, value=?, brand=?, model_number=?, serial_number=?, acquisition_date=? WHERE id=?",
                     (name, description, value, brand, model_number, serial_number, acquisition_date, tool_id),
                 )
             conn.commit()
+            if image_file and image_file.filename and image_path:
+                images.submit(app, job_id)
             # Delete old image only after successful DB commit
             if old_image_path:
                 delete_tool_image(old_image_path)
@@ -1391,18 +1246,48 @@ def edit_tool(tool_id):
     return render_template('edit_tool.html', tool=tool)
 
 
-@app.route('/data/images/<filename>')
+@app.route('/data/images/<path:filename>')
 @auth_required
 def serve_image(filename):
-    """Serve images from the data directory, with optional thumbnail support"""
-    from flask import send_from_directory
+    """Serve an image variant sized by ?w= (or ?thumb=1) in the best format the client accepts"""
     if request.args.get('thumb') == '1':
-        base, ext = os.path.splitext(filename)
-        thumb_filename = f"{base}_thumb{ext}"
-        thumb_path = os.path.join(app.config['UPLOAD_FOLDER'], thumb_filename)
-        if os.path.isfile(thumb_path):
-            return send_from_directory(app.config['UPLOAD_FOLDER'], thumb_filename)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        width = app.config.get('THUMBNAIL_DIMENSION', 200)
+    else:
+        width = request.args.get('w', app.config['MAX_IMAGE_DIMENSION'], type=int)
+    # Only formats named explicitly: image/* from older browsers doesn't mean WebP works
+    accepted_types = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+    accepted = {name for name, (_, mimetype) in images.FORMATS.items() if mimetype in accepted_types}
+    candidates = images.variant_candidates(filename, width, accepted, app.config)
+
+    # The best candidate never changes once it exists: if the client already
+    # holds it there is nothing to look up on disk. Unprocessed originals are
+    # replaced by a new name, so clients revalidate those instead.
+    best = None if images.is_original(filename) else candidates[0]
+    if best and request.if_none_match.contains(images.etag(best)):
+        return images.not_modified(best, final=True)
+
+    folder = app.config['UPLOAD_FOLDER']
+    if best and images.can_generate(filename):
+        # Variants of images stored before they existed, or evicted from the
+        # cache budget, are rendered on first request
+        best_path = safe_join(folder, best)
+        main_path = safe_join(folder, filename)
+        if best_path and main_path and not os.path.isfile(best_path) and os.path.isfile(main_path):
+            try:
+                images.ensure_variants(app, filename)
+            except OSError as e:  # includes UnidentifiedImageError
+                app.logger.warning(f"Could not build variants of {filename}: {e}")
+
+    for candidate in candidates:
+        path = safe_join(folder, candidate)
+        if path and os.path.isfile(path):
+            final = candidate == best
+            if candidate != filename:
+                images.touch_variant(app, candidate)
+            if request.if_none_match.contains(images.etag(candidate)):
+                return images.not_modified(candidate, final)
+            return images.send_image(folder, candidate, final)
+    abort(404)
 
 
 @app.route('/user/settings')
@@ -1416,85 +1301,51 @@ def user_settings():
 @auth_required
 def export_tools():
     """Export user's tools as CSV"""
+    import csv_io  # CSV support is only loaded by the routes that use it
+
+    user_id = current_user.id
+
+    def generate():
+        # The body is sent after the request's teardown has returned its
+        # connection, and at the client's pace, so the stream reads from a
+        # connection of its own outside the pool
+        try:
+            with db.dedicated_connection(app) as conn:
+                yield from csv_io.export_tools_csv(conn, user_id, tools_has_created_at())
+        except Exception as e:
+            # Too late for a flash: re-raising aborts the response before its
+            # final chunk, so the client sees a failed download, not a short file
+            app.logger.error(f"CSV export for {user_id} failed mid-stream: {e}")
+            raise
+
+    chunks = generate()
     try:
-        with get_conn() as conn:
-            c = conn.cursor()
-            
-            # Check if created_at column exists
-            c.execute("PRAGMA table_info(tools)")
-            columns = [col[1] for col in c.fetchall()]
-            has_created_at = 'created_at' in columns
-            
-            if has_created_at:
-                c.execute("""
-                    SELECT name, description, value, brand, model_number, serial_number, acquisition_date, created_at
-                    FROM tools 
-                    WHERE created_by = ?
-                    ORDER BY name
-                """, (current_user.id,))
-            else:
-                c.execute("""
-                    SELECT name, description, value, brand, model_number, serial_number, acquisition_date
-                    FROM tools 
-                    WHERE created_by = ?
-                    ORDER BY name
-                """, (current_user.id,))
-            
-            tools = c.fetchall()
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        if has_created_at:
-            writer.writerow(['Name', 'Description', 'Value', 'Brand', 'Model Number', 'Serial Number', 'Acquisition Date', 'Created At'])
-        else:
-            writer.writerow(['Name', 'Description', 'Value', 'Brand', 'Model Number', 'Serial Number', 'Acquisition Date'])
-        
-        # Write data
-        for tool in tools:
-            if has_created_at:
-                writer.writerow([
-                    tool['name'] or '',
-                    tool['description'] or '',
-                    tool['value'] or '',
-                    tool['brand'] or '',
-                    tool['model_number'] or '',
-                    tool['serial_number'] or '',
-                    tool['acquisition_date'] or '',
-                    tool['created_at'] or ''
-                ])
-            else:
-                writer.writerow([
-                    tool['name'] or '',
-                    tool['description'] or '',
-                    tool['value'] or '',
-                    tool['brand'] or '',
-                    tool['model_number'] or '',
-                    tool['serial_number'] or '',
-                    tool['acquisition_date'] or ''
-                ])
-        
-        output.seek(0)
-        
-        # Create response with CSV file
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'tools_export_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-        
+        # Runs the query, so database errors are reported like before streaming
+        header = next(chunks)
     except Exception as e:
+        app.logger.error(f"CSV export for {user_id} failed: {e}")
         flash(f'Error exporting tools: {str(e)}')
         return redirect(url_for('user_settings'))
 
+    def stream():
+        yield header
+        yield from chunks
+
+    filename = f'tools_export_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return app.response_class(
+        stream(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
 
 @app.route('/user/import/tools', methods=['GET', 'POST'])
 @auth_required
+@db.busy_retry
 def import_tools():
     """Import tools from CSV file"""
+    import csv_io
+
     if request.method == 'POST':
         if 'csv_file' not in request.files:
             flash('No file selected')
@@ -1510,93 +1361,35 @@ def import_tools():
             return redirect(url_for('user_settings'))
         
         try:
-            # Read CSV file
-            try:
-                stream = io.StringIO(file.stream.read().decode('utf-8'))
-            except UnicodeDecodeError:
-                flash('CSV file must be UTF-8 encoded. Please check your file and try again.')
-                return redirect(url_for('user_settings'))
-
-            reader = csv.DictReader(stream)
-
+            # A busy retry reads the upload again from the start
+            file.stream.seek(0)
             with get_conn() as conn:
-                c = conn.cursor()
-
-                # Check if created_at column exists in database
-                c.execute("PRAGMA table_info(tools)")
-                columns = [col[1] for col in c.fetchall()]
-                has_created_at = 'created_at' in columns
-
-                # Validate headers based on database schema
-                if has_created_at:
-                    expected_headers = ['Name', 'Description', 'Value', 'Brand', 'Model Number', 'Serial Number', 'Acquisition Date', 'Created At']
-                else:
-                    expected_headers = ['Name', 'Description', 'Value', 'Brand', 'Model Number', 'Serial Number', 'Acquisition Date']
-
-                if not all(header in reader.fieldnames for header in expected_headers):
-                    flash('Invalid CSV format. Please use the template provided.')
+                try:
+                    result = csv_io.import_tools_csv(conn, file.stream, current_user.id, tools_has_created_at())
+                except csv_io.CSVImportError as e:
+                    conn.rollback()
+                    flash(str(e))
                     return redirect(url_for('user_settings'))
 
-                imported_count = 0
-                errors = []
-
-                for row_num, row in enumerate(reader, start=2):  # Start at 2 because row 1 is header
-                    # Validate required fields
-                    if not row['Name'].strip():
-                        errors.append(f'Row {row_num}: Name is required')
-                        continue
-
-                    # Parse value
-                    value = 0.0
-                    if row['Value'].strip():
-                        try:
-                            value = float(row['Value'])
-                        except ValueError:
-                            errors.append(f'Row {row_num}: Invalid value format')
-                            continue
-
-                    # Insert tool based on available columns
-                    if has_created_at:
-                        c.execute("""
-                            INSERT INTO tools (name, description, value, brand, model_number, serial_number, acquisition_date, created_by, created_at)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            row['Name'].strip(),
-                            row['Description'].strip() if row['Description'] else '',
-                            value,
-                            row['Brand'].strip() if row['Brand'] else '',
-                            row['Model Number'].strip() if row['Model Number'] else '',
-                            row['Serial Number'].strip() if row['Serial Number'] else '',
-                            row['Acquisition Date'].strip() if row['Acquisition Date'] else '',
-                            current_user.id,
-                            row['Created At'] if row['Created At'] else datetime.datetime.now().isoformat()
-                        ))
-                    else:
-                        c.execute("""
-                            INSERT INTO tools (name, description, value, brand, model_number, serial_number, acquisition_date, created_by)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            row['Name'].strip(),
-                            row['Description'].strip() if row['Description'] else '',
-                            value,
-                            row['Brand'].strip() if row['Brand'] else '',
-                            row['Model Number'].strip() if row['Model Number'] else '',
-                            row['Serial Number'].strip() if row['Serial Number'] else '',
-                            row['Acquisition Date'].strip() if row['Acquisition Date'] else '',
-                            current_user.id
-                        ))
-                    imported_count += 1
-
-                if errors:
+                app.logger.info(
+                    f"CSV import: {result.rows} rows in {result.seconds:.2f}s "
+                    f"({result.rows_per_second:.0f} rows/s), {result.error_count} error(s)"
+                )
+                if result.error_count:
                     # Roll back the entire import — don't leave partial state
                     conn.rollback()
-                    flash(f'Import failed with {len(errors)} error(s). No tools were imported.')
-                    for error in errors[:5]:  # Show first 5 errors
+                    flash(f'Import failed with {result.error_count} error(s). No tools were imported.')
+                    for error in result.errors:  # Show first 5 errors
                         flash(f'Error: {error}')
                 else:
                     conn.commit()
-                    flash(f'Successfully imported {imported_count} tools!')
+                    flash(f'Successfully imported {result.imported} tools!')
 
+        except sqlite3.OperationalError as e:
+            if db.is_busy_error(e):
+                raise  # for busy_retry
+            app.logger.error(f"Error importing tools: {e}")
+            flash('Error importing tools. Please check the file and try again.')
         except Exception as e:
             app.logger.error(f"Error importing tools: {e}")
             flash('Error importing tools. Please check the file and try again.')
@@ -1610,14 +1403,11 @@ def import_tools():
 @auth_required
 def download_template():
     """Download CSV template for tool import"""
+    import csv
+
     try:
-        # Check if created_at column exists in database
-        with get_conn() as conn:
-            c = conn.cursor()
-            c.execute("PRAGMA table_info(tools)")
-            columns = [col[1] for col in c.fetchall()]
-            has_created_at = 'created_at' in columns
-        
+        has_created_at = tools_has_created_at()
+
         # Create CSV template in memory
         output = io.StringIO()
         writer = csv.writer(output)
@@ -1655,9 +1445,9 @@ def download_template():
 
 # Initialize databases at module level so gunicorn workers also run migrations
 with app.app_context():
-    init_auth_db(app)
     init_db()
-    migrate_tools_table()
+# Don't let connections opened during startup be inherited by forked workers
+db.get_pool(app).close_all()
 
 
 @app.errorhandler(404)
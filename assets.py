@@ -0,0 +1,167 @@
+"""
+Static files: fingerprinted frontend bundles, versioned URLs and precompressed copies.
+
+`npm run build` (see frontend/build.mjs) writes minified, content-hashed files
+to static/dist together with a manifest mapping each logical name ('app.js',
+'tailwind.css', ...) to its hashed file. Templates ask for bundles with
+asset_url(name); it returns None when there is no build (a checkout without
+Node), and the templates then fall back to the CDN scripts and in-browser
+JSX transform.
+
+Every other url_for('static', ...) gets ?v=<content hash>, so any static URL
+can be cached for good: a request whose version matches the file, like
+anything under static/dist, is answered with Cache-Control: immutable, and a
+changed file gets a new URL. Copies compressed at build time (name.br,
+name.gz; frontend/compress.mjs) are sent to clients that accept them, so
+workers never compress static files themselves.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+MANIFEST_DIR = 'dist'  # under the static folder
+
+# Precompressed copies looked for next to a static file, preferred first
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+class AssetManifest:
+    """The build manifest, re-read when the file changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._entries = {}
+
+    def entries(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._mtime, self._entries = None, {}
+            return self._entries
+        if mtime != self._mtime:
+            try:
+                with open(self.path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            self._mtime, self._entries = mtime, entries if isinstance(entries, dict) else {}
+        return self._entries
+
+    def get(self, name):
+        return self.entries().get(name)
+
+
+def asset_url(name):
+    """URL of the built bundle ``name``, or None when the frontend hasn't been built"""
+    filename = current_app.extensions['assets'].get(name)
+    if not filename:
+        return None
+    return url_for('static', filename=f"{MANIFEST_DIR}/{filename}")
+
+
+class StaticHashes:
+    """Content hashes of files in the static folder, recomputed when a file changes"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._hashes = {}  # filename -> (mtime, size, hash)
+
+    def get(self, filename):
+        path = safe_join(self.folder, filename)
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            st = None
+        if st is None:
+            return None
+        cached = self._hashes.get(filename)
+        if cached and cached[:2] == (st.st_mtime, st.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()[:12]
+        self._hashes[filename] = (st.st_mtime, st.st_size, value)
+        return value
+
+
+def _version_static_urls(endpoint, values):
+    """url_defaults hook: url_for('static', filename=...) gains ?v=<content hash>"""
+    if endpoint != 'static' or 'v' in values or not values.get('filename'):
+        return
+    filename = values['filename']
+    if filename.startswith(MANIFEST_DIR + '/'):
+        return  # already fingerprinted by name
+    version = current_app.extensions['static_hashes'].get(filename)
+    if version:
+        values['v'] = version
+
+
+def _precompressed(folder, filename):
+    """(encoding, filename) of the best up-to-date precompressed copy the client accepts"""
+    source = safe_join(folder, filename)
+    if not source:
+        return None
+    try:
+        source_mtime = os.path.getmtime(source)
+    except OSError:
+        return None
+    for encoding, suffix in PRECOMPRESSED:
+        if not request.accept_encodings[encoding]:
+            continue
+        try:
+            # A copy older than the file (edited since the build) is ignored
+            if os.path.getmtime(source + suffix) >= source_mtime:
+                return encoding, filename + suffix
+        except OSError:
+            continue
+    return None
+
+
+def has_precompressed(folder, filename):
+    source = safe_join(folder, filename)
+    return bool(source) and any(os.path.isfile(source + suffix) for _, suffix in PRECOMPRESSED)
+
+
+def send_static(filename):
+    """The static view: precompressed when possible, immutable when the URL is versioned"""
+    app = current_app
+    folder = app.static_folder
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    compressed = _precompressed(folder, filename)
+    if compressed:
+        encoding, name = compressed
+        response = send_from_directory(folder, name, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(folder, filename, mimetype=mimetype)
+    if compressed or has_precompressed(folder, filename):
+        response.vary.add('Accept-Encoding')
+
+    version = request.args.get('v')
+    if filename.startswith(MANIFEST_DIR + '/') or (
+        version and version == app.extensions['static_hashes'].get(filename)
+    ):
+        max_age = app.config.get('STATIC_CACHE_MAX_AGE', 31536000)
+        response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+    else:
+        # Unversioned or stale URL: usable, but revalidated every time
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def init_app(app):
+    path = app.config.get('ASSET_MANIFEST') or os.path.join(app.static_folder, MANIFEST_DIR, 'manifest.json')
+    app.extensions['assets'] = AssetManifest(path)
+    app.extensions['static_hashes'] = StaticHashes(app.static_folder)
+    app.add_template_global(asset_url, 'asset_url')
+    app.url_defaults(_version_static_urls)
+    app.view_functions['static'] = send_static
+    return app.extensions['assets']
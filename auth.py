@@ -1,141 +1,286 @@
 import os
-import sqlite3
+import threading
 import time
+from collections import OrderedDict
 from functools import wraps
 from flask import Flask, request, redirect, url_for, session, flash, current_app
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from oauthlib.oauth2 import WebApplicationClient
-import requests
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import json
 from config import Config
+from db import get_db
+from id_token import IDTokenError, UnknownKeyError, verify_id_token
+from oidc_metadata import REQUIRED_ENDPOINTS, ProviderMetadata
+
+class User:
+    """User model for Flask-Login.
+
+    Implements the Flask-Login user interface itself rather than inheriting
+    UserMixin, whose lack of __slots__ would give every instance a __dict__.
+    """
+
+    __slots__ = ('id', 'email', 'name', 'picture')
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
 
-class User(UserMixin):
-    """User model for Flask-Login"""
-    
     def __init__(self, user_id, email, name, picture=None):
         self.id = user_id
         self.email = email
         self.name = name
         self.picture = picture
-    
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<User {self.id}>"
+
     @staticmethod
     def get(user_id):
-        """Get user by ID from database"""
+        """Get user by ID, from this process's cache or the database"""
+        cache = get_user_cache()
+        user = cache.get(user_id)
+        if user is not None:
+            return user
         with get_auth_conn() as conn:
             c = conn.cursor()
-            c.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+            c.execute("SELECT id, email, name, picture FROM users WHERE id = ?", (user_id,))
             user_data = c.fetchone()
             if user_data:
-                return User(
+                user = User(
                     user_id=user_data['id'],
                     email=user_data['email'],
                     name=user_data['name'],
                     picture=user_data['picture']
                 )
+                cache.put(user)
+                return user
         return None
 
+
+class UserCache:
+    """Bounded LRU of User objects by id, each kept for at most ``ttl`` seconds.
+
+    Per process: create_or_update_user invalidates the entry in the worker
+    that handled the login, other workers pick up the change within ``ttl``.
+    Unknown ids are not cached, so a new user is visible at once.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (expires_at, user)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_user_cache(app=None):
+    """The app's UserCache, created from USER_CACHE_SIZE/USER_CACHE_TTL on first use"""
+    if app is None:
+        app = current_app
+    cache = app.extensions.get('user_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('user_cache', UserCache(
+            maxsize=app.config.get('USER_CACHE_SIZE', 1024),
+            ttl=app.config.get('USER_CACHE_TTL', 60),
+        ))
+    return cache
+
 def get_auth_conn(app=None):
     """Get database connection for authentication"""
     if app is None:
         app = current_app
-    db_path = app.config.get('TOOLTRACKER_DB', 'tooltracker.db')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_auth_db(app=None):
-    """Initialize authentication database tables"""
-    with get_auth_conn(app) as conn:
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                picture TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+    return get_db(app)
+
+OIDC_HTTP_TIMEOUT = 10  # seconds per attempt for token and userinfo calls
+
+# Claims create_or_update_user needs; an ID token lacking any of them means a userinfo call
+REQUIRED_CLAIMS = ('sub', 'email')
 
-OIDC_DISCOVERY_TIMEOUT = 5  # seconds
-OIDC_RETRY_COOLDOWN = 60    # seconds between retry attempts after failure
+
+def build_http_session(config):
+    """A requests.Session for talking to the IdP: pooled keep-alive connections, retries with backoff.
+
+    Connect errors and 5xx answers are retried (OIDC_HTTP_RETRIES times,
+    backing off from OIDC_HTTP_BACKOFF seconds). Read timeouts are not, so a
+    token exchange the IdP may already have processed isn't sent twice.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = config.get('OIDC_HTTP_RETRIES', 2)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=config.get('OIDC_HTTP_BACKOFF', 0.2),
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'POST'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.get('OIDC_HTTP_POOL_SIZE', 10), max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept'] = 'application/json'
+    return session
 
 
 class OIDCAuth:
-    """OIDC Authentication handler"""
+    """OIDC Authentication handler.
+
+    Nothing is fetched at construction or during a request: with
+    OIDC_DISCOVERY_URL set, the discovery document and JWKS come from an
+    oidc_metadata.ProviderMetadata cache (on disk at OIDC_DISCOVERY_CACHE)
+    that a background thread in each worker keeps fresh. Until a discovery
+    document is available the custom OIDC_*_ENDPOINT settings are used, if
+    complete.
+
+    Calls to the IdP share one keep-alive session per worker process (see
+    build_http_session) and log their latency. With OIDC_VERIFY_ID_TOKEN the
+    user's claims come from the ID token in the token response, verified
+    against the cached JWKS, and userinfo is only asked when that fails.
+    """
 
     def __init__(self, app):
         self.app = app
         self.client = None
-        self.oidc_config = None
-        self._last_setup_attempt = 0
-        self.setup_oidc()
-    
-    def setup_oidc(self):
-        """Setup OIDC client and configuration"""
-        self._last_setup_attempt = time.monotonic()
-        if not self.app.config.get('OIDC_CLIENT_ID'):
-            self.app.logger.warning("OIDC_CLIENT_ID not configured, authentication disabled")
-            return
-        
-        if not self.app.config.get('OIDC_REDIRECT_URI'):
-            self.app.logger.error("OIDC_REDIRECT_URI not configured, authentication disabled")
-            return
-        
-        self.app.logger.info(f"Setting up OIDC with client_id: {self.app.config['OIDC_CLIENT_ID']}")
-        self.app.logger.info(f"Client secret configured: {'Yes' if self.app.config.get('OIDC_CLIENT_SECRET') else 'No'}")
-        
-        self.client = WebApplicationClient(self.app.config['OIDC_CLIENT_ID'])
-        
-        # Try to discover OIDC configuration
-        if self.app.config.get('OIDC_DISCOVERY_URL'):
-            try:
-                self.app.logger.info(f"Attempting OIDC discovery at: {self.app.config['OIDC_DISCOVERY_URL']}")
-                resp = requests.get(self.app.config['OIDC_DISCOVERY_URL'], timeout=OIDC_DISCOVERY_TIMEOUT)
-                resp.raise_for_status()
-                self.oidc_config = resp.json()
-                self.app.logger.info("OIDC configuration discovered successfully")
-                self.app.logger.info(f"Token endpoint: {self.oidc_config.get('token_endpoint')}")
-            except Exception as e:
-                self.app.logger.error(f"Failed to discover OIDC configuration: {e}")
-                self.oidc_config = None
-        
-        # Use custom endpoints if discovery failed or not configured
-        if not self.oidc_config:
-            self.app.logger.info("Using custom OIDC endpoints")
-            self.oidc_config = {
-                'authorization_endpoint': self.app.config.get('OIDC_AUTHORIZATION_ENDPOINT'),
-                'token_endpoint': self.app.config.get('OIDC_TOKEN_ENDPOINT'),
-                'userinfo_endpoint': self.app.config.get('OIDC_USERINFO_ENDPOINT'),
-                'issuer': self.app.config.get('OIDC_ISSUER')
-            }
-            self.app.logger.info(f"Custom token endpoint: {self.oidc_config.get('token_endpoint')}")
-
-        # Validate that required endpoints are present
-        required = ('authorization_endpoint', 'token_endpoint', 'userinfo_endpoint')
-        if not all(self.oidc_config.get(k) for k in required):
-            missing = [k for k in required if not self.oidc_config.get(k)]
+        self.metadata = None
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._custom_config = self._custom_endpoints()
+        if app.config.get('OIDC_CLIENT_ID') and app.config.get('OIDC_DISCOVERY_URL'):
+            self.metadata = ProviderMetadata(
+                app.config['OIDC_DISCOVERY_URL'],
+                cache_path=app.config.get('OIDC_DISCOVERY_CACHE'),
+                max_ttl=app.config.get('OIDC_DISCOVERY_CACHE_TTL', 86400),
+                get=lambda url, **kwargs: self.request('GET', url, 'metadata', **kwargs),
+            )
+            # Started from the first request so each forked worker runs its own
+            app.before_request(self.metadata.start)
+
+    @property
+    def session(self):
+        """The HTTP session for this process; connections aren't shared across a fork"""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    self._session = build_http_session(self.app.config)
+                    self._session_pid = pid
+        return self._session
+
+    def request(self, method, url, purpose, **kwargs):
+        """Send a request to the IdP through the pooled session, logging how long it took"""
+        kwargs.setdefault('timeout', OIDC_HTTP_TIMEOUT)
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except Exception as e:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.app.logger.warning(f"OIDC {purpose} request to {url} failed after {elapsed:.0f} ms: {e}")
+            raise
+        elapsed = (time.perf_counter() - start) * 1000
+        self.app.logger.info(f"OIDC {purpose}: {method} {url} -> {resp.status_code} in {elapsed:.0f} ms")
+        return resp
+
+    def _custom_endpoints(self):
+        config = {
+            'authorization_endpoint': self.app.config.get('OIDC_AUTHORIZATION_ENDPOINT'),
+            'token_endpoint': self.app.config.get('OIDC_TOKEN_ENDPOINT'),
+            'userinfo_endpoint': self.app.config.get('OIDC_USERINFO_ENDPOINT'),
+            'issuer': self.app.config.get('OIDC_ISSUER')
+        }
+        return config if all(config.get(k) for k in REQUIRED_ENDPOINTS) else None
+
+    @property
+    def oidc_config(self):
+        """Provider endpoints: the discovery document if cached, else the custom endpoints"""
+        document = self.metadata.discovery() if self.metadata else None
+        return document or self._custom_config
+
+    @property
+    def discovery_pending(self):
+        """True while discovery is configured but no document has been fetched yet"""
+        return bool(self.metadata) and self.metadata.discovery() is None and not self._custom_config
+
+    def ensure_setup(self):
+        """Create the OAuth client on first use; True once endpoints are known"""
+        if self.client is None:
+            if not self.app.config.get('OIDC_CLIENT_ID'):
+                self.app.logger.warning("OIDC_CLIENT_ID not configured, authentication disabled")
+                return False
+            if not self.app.config.get('OIDC_REDIRECT_URI'):
+                self.app.logger.error("OIDC_REDIRECT_URI not configured, authentication disabled")
+                return False
+            from oauthlib.oauth2 import WebApplicationClient
+
+            self.app.logger.info(f"Setting up OIDC with client_id: {self.app.config['OIDC_CLIENT_ID']}")
+            self.client = WebApplicationClient(self.app.config['OIDC_CLIENT_ID'])
+        if self.metadata:
+            self.metadata.start()
+
+        if self.oidc_config:
+            return True
+        if self.discovery_pending:
+            self.app.logger.warning("OIDC discovery document not fetched yet")
+        else:
             self.app.logger.error(
-                f"OIDC configuration incomplete — missing endpoints: {missing}. "
+                "OIDC configuration incomplete — missing endpoints. "
                 "Set OIDC_DISCOVERY_URL or individual OIDC_*_ENDPOINT vars."
             )
-            self.oidc_config = None
-    
-    def get_authorization_url(self, redirect_uri, state):
-        """Get authorization URL for OIDC login"""
-        # Retry OIDC setup if a previous attempt failed, but at most once per cooldown period
-        if not self.oidc_config and self.app.config.get('OIDC_DISCOVERY_URL'):
-            elapsed = time.monotonic() - self._last_setup_attempt
-            if elapsed >= OIDC_RETRY_COOLDOWN:
-                self.app.logger.info("Retrying OIDC discovery after previous failure")
-                self.setup_oidc()
-            else:
-                self.app.logger.warning(
-                    f"OIDC not configured — retry in {int(OIDC_RETRY_COOLDOWN - elapsed)}s"
-                )
+        return False
 
+    def get_authorization_url(self, redirect_uri, state, nonce=None):
+        """Get authorization URL for OIDC login"""
+        self.ensure_setup()
         endpoint = self.oidc_config.get('authorization_endpoint') if self.oidc_config else None
         if not self.client or not endpoint:
             self.app.logger.error("OIDC authorization endpoint not configured")
@@ -151,7 +296,8 @@ class OIDCAuth:
             endpoint,
             redirect_uri=redirect_uri,
             scope=scopes,
-            state=state
+            state=state,
+            **({'nonce': nonce} if nonce else {})
         )
         
         self.app.logger.info(f'OIDC generated auth URL: {auth_url}')
@@ -159,8 +305,9 @@ class OIDCAuth:
     
     def get_token(self, authorization_response, redirect_uri):
         """Exchange authorization code for tokens"""
-        if not self.client or not self.oidc_config:
+        if not self.ensure_setup():
             return None
+        import requests
         
         # Extract the authorization code from the response URL
         from urllib.parse import urlparse, parse_qs
@@ -191,9 +338,7 @@ class OIDCAuth:
         self.app.logger.info(f"Token exchange request to: {token_url}")
         
         try:
-            resp = requests.post(token_url, data=token_data, headers=headers, timeout=10)
-            self.app.logger.info(f"Token exchange response status: {resp.status_code}")
-            self.app.logger.info(f"Token exchange response headers: {dict(resp.headers)}")
+            resp = self.request('POST', token_url, 'token exchange', data=token_data, headers=headers)
 
             if resp.status_code != 200:
                 self.app.logger.error(f"Token exchange failed with status {resp.status_code}")
@@ -211,18 +356,58 @@ class OIDCAuth:
     
     def get_userinfo(self, access_token):
         """Get user information from OIDC provider"""
+        import requests
+
+        self.ensure_setup()
         if not self.oidc_config or not self.oidc_config.get('userinfo_endpoint'):
             return None
 
         headers = {'Authorization': f'Bearer {access_token}'}
         try:
-            resp = requests.get(self.oidc_config['userinfo_endpoint'], headers=headers, timeout=10)
+            resp = self.request('GET', self.oidc_config['userinfo_endpoint'], 'userinfo', headers=headers)
             resp.raise_for_status()
             return resp.json()
         except requests.exceptions.RequestException as e:
             self.app.logger.error(f"Userinfo fetch failed: {e}")
             raise
 
+    def verify_id_token(self, id_token, nonce=None):
+        """Claims of a locally verified ID token; raises IDTokenError if it can't be trusted"""
+        config = self.oidc_config or {}
+        if not config.get('issuer'):
+            raise IDTokenError("provider issuer unknown")
+        jwks = self.metadata.jwks() if self.metadata else None
+        try:
+            return verify_id_token(
+                id_token,
+                jwks,
+                issuer=config['issuer'],
+                audience=self.app.config['OIDC_CLIENT_ID'],
+                nonce=nonce,
+                client_secret=self.app.config.get('OIDC_CLIENT_SECRET'),
+            )
+        except UnknownKeyError:
+            if self.metadata:
+                # Signed with a key we haven't seen: the provider may have rotated
+                self.metadata.request_refresh('jwks')
+            raise
+
+    def get_user_claims(self, token_data, nonce=None):
+        """The signed-in user's claims: from the ID token when it verifies and has them, else userinfo"""
+        id_token = token_data.get('id_token')
+        if id_token and self.app.config.get('OIDC_VERIFY_ID_TOKEN', True):
+            try:
+                claims = self.verify_id_token(id_token, nonce)
+            except IDTokenError as e:
+                self.app.logger.warning(f"ID token not used, asking userinfo instead: {e}")
+            else:
+                missing = [name for name in REQUIRED_CLAIMS if not claims.get(name)]
+                if not missing:
+                    self.app.logger.info("User claims taken from the verified ID token")
+                    return claims
+                self.app.logger.info(f"ID token lacks {', '.join(missing)}; asking userinfo")
+        return self.get_userinfo(token_data['access_token'])
+
 def create_or_update_user(userinfo):
     """Create or update user in database"""
     user_id = userinfo.get('sub') or userinfo.get('id')
@@ -240,6 +425,7 @@ def create_or_update_user(userinfo):
             VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
         """, (user_id, email, name, picture))
         conn.commit()
+    get_user_cache().invalidate(user_id)
     
     return User(user_id, email, name, picture)
 
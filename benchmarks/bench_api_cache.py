@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+/api/tools and /api/brands as the home page requests them: response bytes
+with and without compression, and the cost of a full response against a
+304 revalidation of unchanged data (time and SQL statements run).
+Usage: python benchmarks/bench_api_cache.py [--tools 1000] [--requests 200]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from common import BENCH_USER, app_config, create_inventory, report
+
+statements = []
+
+
+class Cursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        statements.append(sql)
+        return super().execute(sql, *args)
+
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+
+def measure(client, url, n, headers=None):
+    times, counts = [], []
+    for _ in range(n):
+        del statements[:]
+        start = time.perf_counter()
+        resp = client.get(url, headers=headers or {})
+        times.append((time.perf_counter() - start) * 1000)
+        counts.append(len(statements))
+    return resp, statistics.median(times), statistics.median(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tools', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-api-cache-')
+    os.environ.update(TOOLTRACKER_DB=os.path.join(tmpdir, 'tooltracker.db'),
+                      UPLOAD_FOLDER=os.path.join(tmpdir, 'images'), OIDC_CLIENT_ID='', IMAGE_WORKERS='0')
+    app_config()
+    _connect = sqlite3.connect
+    sqlite3.connect = lambda *a, **kw: _connect(*a, factory=Connection, **kw)
+    from app import app
+
+    with app.app_context():
+        from db import get_db
+        create_inventory(get_db(), args.tools)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = BENCH_USER
+        sess['_fresh'] = True
+
+    rows = []
+    for url in ('/api/tools?per_page=100', '/api/brands'):
+        plain, full_ms, full_sql = measure(client, url, args.requests)
+        gzipped, gzip_ms, _ = measure(client, url, args.requests, {'Accept-Encoding': 'gzip'})
+        tag = plain.headers['ETag']
+        not_modified, revalidate_ms, revalidate_sql = measure(client, url, args.requests, {'If-None-Match': tag})
+        assert not_modified.status_code == 304
+        rows.append([url, len(plain.get_data()), len(gzipped.get_data()), f"{full_ms:.2f}", f"{gzip_ms:.2f}",
+                     f"{revalidate_ms:.2f}", f"{full_sql:.0f}", f"{revalidate_sql:.0f}"])
+
+    shutil.rmtree(tmpdir)
+    report(f'JSON API, {args.tools} tools (median of {args.requests} requests)', rows,
+           ['', 'bytes', 'gzip bytes', '200 ms', '200 gzip ms', '304 ms', '200 SQL', '304 SQL'])
+
+
+if __name__ == '__main__':
+    main()
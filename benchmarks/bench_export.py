@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the CSV export: the old fetchall/StringIO/BytesIO build versus
+the streamed csv_io.export_tools_csv generator.
+
+Each variant runs in a fresh interpreter, so ru_maxrss is the peak of that
+export alone. The streamed body is consumed chunk by chunk, as the WSGI
+server would write it to the socket.
+Usage: python benchmarks/bench_export.py [--tools 100000]
+"""
+
+import argparse
+import csv
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BENCH_USER, connect, create_inventory, report
+import csv_io
+import db
+
+VARIANTS = ('buffered', 'streamed')
+
+
+def export_buffered(conn):
+    """The export as it was: every row, the text and the bytes all in memory at once"""
+    rows = conn.execute(
+        "SELECT name, description, value, brand, model_number, serial_number, acquisition_date, created_at "
+        "FROM tools WHERE created_by = ? ORDER BY name", (BENCH_USER,)
+    ).fetchall()
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(csv_io.tool_headers(True))
+    for row in rows:
+        writer.writerow([value or '' for value in row])
+    body = io.BytesIO(output.getvalue().encode('utf-8'))
+    return len(body.getvalue())
+
+
+def export_streamed(conn):
+    return sum(len(chunk) for chunk in csv_io.export_tools_csv(conn, BENCH_USER, True))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(variant, path):
+    conn = connect(path)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    size = export_buffered(conn) if variant == 'buffered' else export_streamed(conn)
+    elapsed = time.perf_counter() - start
+    print(f"{size} {elapsed:.3f} {baseline:.1f} {peak_rss_mb():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tools', type=int, default=100000)
+    parser.add_argument('--child', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.db)
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = connect(path)
+        create_inventory(conn, args.tools)
+        db.ensure_indexes(conn)
+        conn.commit()
+        conn.close()
+        for variant in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', variant, '--db', path],
+                check=True, capture_output=True, text=True,
+            ).stdout.split()
+            size, elapsed, baseline, peak = int(out[0]), float(out[1]), float(out[2]), float(out[3])
+            rows.append([variant, f"{size / 1e6:.1f}", f"{elapsed:.2f}", f"{peak:.1f}", f"{peak - baseline:.1f}"])
+
+    report(f'CSV export of {args.tools:,} tools', rows,
+           ['variant', 'MB written', 'seconds', 'peak RSS MB', 'growth MB'])
+
+
+if __name__ == '__main__':
+    main()
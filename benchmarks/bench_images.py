@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Milliseconds per upload for the image pipeline: the old optimize-then-reopen
+thumbnail path versus images.render_derivatives (one decode, JPEG draft mode),
+and bytes per variant of the responsive set against the JPEG-only output.
+
+Inputs are synthetic photos: noise over a gradient, which compresses roughly
+like a real camera JPEG.
+Usage: python benchmarks/bench_images.py [--repeat 10]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from PIL import Image
+
+from common import app_config, report
+import images
+
+MAX_DIMENSION = 1024
+THUMBNAIL_DIMENSION = 200
+QUALITY = 85
+
+SOURCES = [
+    ('12MP JPEG', (4032, 3024), 'JPEG'),
+    ('3MP JPEG', (2048, 1536), 'JPEG'),
+    ('2MP PNG', (1600, 1200), 'PNG'),
+]
+
+
+def make_source(size, fmt):
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 40)
+    img = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    output = io.BytesIO()
+    img.save(output, format=fmt, quality=92)
+    return output.getvalue()
+
+
+def old_pipeline(data, folder):
+    """optimize_image + generate_thumbnail as they were before the single-decode pipeline"""
+    img = Image.open(io.BytesIO(data))
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    width, height = img.size
+    if width > MAX_DIMENSION or height > MAX_DIMENSION:
+        if width > height:
+            size = (MAX_DIMENSION, int(height * (MAX_DIMENSION / width)))
+        else:
+            size = (int(width * (MAX_DIMENSION / height)), MAX_DIMENSION)
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=QUALITY, optimize=True)
+    path = os.path.join(folder, 'old.jpg')
+    with open(path, 'wb') as f:
+        f.write(output.getvalue())
+
+    thumb = Image.open(path)
+    thumb.thumbnail((THUMBNAIL_DIMENSION, THUMBNAIL_DIMENSION), Image.Resampling.LANCZOS)
+    thumb.save(os.path.join(folder, 'old_thumb.jpg'), format='JPEG', quality=QUALITY, optimize=True)
+
+
+def new_pipeline(data, folder):
+    sizes = [('', MAX_DIMENSION), ('_thumb', THUMBNAIL_DIMENSION)]
+    extension, outputs = images.render_derivatives(io.BytesIO(data), sizes, QUALITY)
+    for name in sorted(outputs, key=lambda name: name == extension):
+        images.write_atomic(os.path.join(folder, 'new' + name), outputs[name])
+
+
+def variant_bytes(data, config):
+    """{width: {extension name: bytes}} for the registry's variants of one upload"""
+    sizes = images.derivative_sizes(config)
+    extension, outputs = images.render_derivatives(
+        io.BytesIO(data), sizes, QUALITY, images.variant_formats(config))
+    return {
+        width: {name[len(suffix) + 1:]: len(body) for name, body in outputs.items()
+                if name.rsplit('.', 1)[0] == suffix}
+        for suffix, width in sizes
+    }
+
+
+def time_pipeline(pipeline, data, folder, repeat):
+    pipeline(data, folder)  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pipeline(data, folder)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for label, size, fmt in SOURCES:
+            data = make_source(size, fmt)
+            old_ms = time_pipeline(old_pipeline, data, folder, args.repeat)
+            new_ms = time_pipeline(new_pipeline, data, folder, args.repeat)
+            rows.append([label, f"{len(data) / 1e6:.1f}", f"{old_ms:.1f}", f"{new_ms:.1f}", f"{old_ms / new_ms:.1f}x"])
+
+    report('Median ms per upload (main image + thumbnail)', rows,
+           ['source', 'MB', 'old ms', 'single-decode ms', 'speedup'])
+
+    config = vars(app_config())
+    formats = list(images.variant_formats(config))
+    data = make_source(*SOURCES[0][1:])
+    rows = []
+    for width, sizes in variant_bytes(data, config).items():
+        row = [width, f"{sizes['jpg'] / 1024:.1f}"]
+        for name in formats:
+            row += [f"{sizes[name] / 1024:.1f}", f"{100 * (1 - sizes[name] / sizes['jpg']):.0f}%"]
+        rows.append(row)
+    headers = ['max px', 'JPEG KiB']
+    for name in formats:
+        headers += [f'{name} KiB', f'{name} saving']
+    report(f'Bytes per variant of the {SOURCES[0][0]} source (JPEG-only was {MAX_DIMENSION}px + {THUMBNAIL_DIMENSION}px)',
+           rows, headers)
+
+
+if __name__ == '__main__':
+    main()
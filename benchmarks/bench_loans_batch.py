@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Lending and returning a kit of tools: one form post per tool to
+/lend/<tool_id> and /return/<tool_id> against a single request to
+/api/loans/batch/lend and /api/loans/batch/return (time per kit and SQL
+statements run).
+Usage: python benchmarks/bench_loans_batch.py [--tools 1000] [--kits 1,15,100] [--rounds 20]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from common import BENCH_USER, app_config, create_inventory, report
+
+statements = []
+
+
+class Cursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        statements.append(sql)
+        return super().execute(sql, *args)
+
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+
+def per_tool(kit, person_id):
+    lend = [(f'/lend/{tool_id}', {'data': {'person_id': person_id, 'lent_date': '2024-05-01'}}) for tool_id in kit]
+    give_back = [(f'/return/{tool_id}', {}) for tool_id in kit]
+    return lend, give_back
+
+
+def batched(kit, person_id):
+    items = [{'tool_id': tool_id} for tool_id in kit]
+    lend = [('/api/loans/batch/lend', {'json': {'person_id': person_id, 'lent_date': '2024-05-01', 'items': items}})]
+    give_back = [('/api/loans/batch/return', {'json': {'items': items}})]
+    return lend, give_back
+
+
+def post_all(client, posts):
+    """Total ms and statements for the posts, dropping flashes between them as a browser would"""
+    elapsed, count = 0.0, 0
+    for url, kwargs in posts:
+        del statements[:]
+        start = time.perf_counter()
+        resp = client.post(url, **kwargs)
+        elapsed += (time.perf_counter() - start) * 1000
+        count += len(statements)
+        assert resp.status_code in (200, 302)
+        with client.session_transaction() as sess:
+            sess.pop('_flashes', None)
+    return elapsed, count
+
+
+def measure(client, lend, give_back, rounds):
+    """Median ms and statements to lend the kit, then to return it"""
+    runs = [[post_all(client, posts) for posts in (lend, give_back)] for _ in range(rounds)]
+    lend_ms, lend_sql = (statistics.median(run[0][i] for run in runs) for i in (0, 1))
+    return_ms, return_sql = (statistics.median(run[1][i] for run in runs) for i in (0, 1))
+    return lend_ms, return_ms, lend_sql, return_sql
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tools', type=int, default=1000)
+    parser.add_argument('--kits', default='1,15,100')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-loans-batch-')
+    os.environ.update(TOOLTRACKER_DB=os.path.join(tmpdir, 'tooltracker.db'),
+                      UPLOAD_FOLDER=os.path.join(tmpdir, 'images'), OIDC_CLIENT_ID='', IMAGE_WORKERS='0')
+    app_config()
+    _connect = sqlite3.connect
+    sqlite3.connect = lambda *a, **kw: _connect(*a, factory=Connection, **kw)
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        _, person_ids = create_inventory(conn, args.tools)
+        available = [row[0] for row in conn.execute(
+            "SELECT id FROM tools t WHERE created_by = ? AND NOT EXISTS "
+            "(SELECT 1 FROM loans l WHERE l.tool_id = t.id AND l.returned_on IS NULL) ORDER BY id",
+            (BENCH_USER,))]
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = BENCH_USER
+        sess['_fresh'] = True
+
+    rows = []
+    for size in (int(k) for k in args.kits.split(',')):
+        kit = available[:size]
+        for label, posts in (('per-tool posts', per_tool), ('batch API', batched)):
+            lend_ms, return_ms, lend_sql, return_sql = measure(client, *posts(kit, person_ids[0]), args.rounds)
+            rows.append([size, label, f"{lend_ms:.2f}", f"{return_ms:.2f}", f"{lend_sql:.0f}", f"{return_sql:.0f}"])
+
+    shutil.rmtree(tmpdir)
+    report(f'Lending kits, {args.tools} tools (median of {args.rounds} rounds)', rows,
+           ['kit', '', 'lend ms', 'return ms', 'lend SQL', 'return SQL'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+The /oidc/callback path against a local stand-in IdP (stub_idp.StubIdP):
+the token exchange and userinfo call a sign-in makes, with a fresh HTTP
+connection per call (plain requests.post/get, as before), with the pooled
+keep-alive session, and with the user taken from the locally verified ID
+token so that userinfo isn't called at all.
+
+The stub answers in microseconds, so --connect-ms charges every new
+connection a handshake delay (TCP plus TLS to a provider across a network
+costs a few round trips) and --latency-ms adds server time per request.
+Usage: python benchmarks/bench_oidc_callback.py [--logins 50] [--connect-ms 30] [--latency-ms 10]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from common import ROOT, app_config, report
+
+from stub_idp import StubIdP
+
+
+class OneShotSession:
+    """A connection per call, like module-level requests.post/get"""
+
+    def request(self, method, url, **kwargs):
+        import requests
+
+        return requests.request(method, url, **kwargs)
+
+
+def sign_in(client):
+    with client.session_transaction() as sess:
+        sess['oauth_state'] = 'bench-state'
+        sess['oauth_nonce'] = 'bench-nonce'
+    start = time.perf_counter()
+    resp = client.get('/oidc/callback?code=bench-code&state=bench-state')
+    elapsed = (time.perf_counter() - start) * 1000
+    assert resp.status_code == 302 and resp.location.endswith('/'), resp.location
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--connect-ms', type=float, default=30, help='delay charged to each new connection')
+    parser.add_argument('--latency-ms', type=float, default=10, help='delay added to each response')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-oidc-')
+    idp = StubIdP(latency=args.latency_ms / 1000, connect_latency=args.connect_ms / 1000).start()
+    os.environ.update(TOOLTRACKER_DB=os.path.join(tmpdir, 'tooltracker.db'),
+                      UPLOAD_FOLDER=os.path.join(tmpdir, 'images'), IMAGE_WORKERS='0',
+                      OIDC_CLIENT_ID='bench', OIDC_DISCOVERY_URL=idp.discovery_url,
+                      OIDC_DISCOVERY_CACHE='', OAUTHLIB_INSECURE_TRANSPORT='1')
+    app_config()
+    os.chdir(ROOT)
+    from app import app, oidc_auth
+
+    app.logger.setLevel(logging.WARNING)
+    idp.client_id = 'bench'
+    idp.tokens['id_token'] = idp.id_token(nonce='bench-nonce', exp=int(time.time()) + 3600)
+    oidc_auth.metadata.refresh_due()
+    client = app.test_client()
+
+    rows = []
+    try:
+        modes = (
+            ('connection per call', OneShotSession(), False),
+            ('pooled session', None, False),
+            ('pooled + ID token', None, True),
+        )
+        for label, session, verify in modes:
+            app.config['OIDC_VERIFY_ID_TOKEN'] = verify
+            oidc_auth._session = session
+            oidc_auth._session_pid = os.getpid() if session else None
+            sign_in(client)  # warm up (and open the pooled connection)
+            connections, requests = idp.connections, len(idp.requests)
+            times = [sign_in(client) for _ in range(args.logins)]
+            rows.append([label, f"{statistics.median(times):.1f}", f"{statistics.quantiles(times, n=20)[-1]:.1f}",
+                         f"{(len(idp.requests) - requests) / args.logins:g}", idp.connections - connections])
+    finally:
+        idp.stop()
+        shutil.rmtree(tmpdir)
+
+    report(f'/oidc/callback, {args.logins} sign-ins '
+           f'({args.connect_ms:g} ms per new connection, {args.latency_ms:g} ms per response)',
+           rows, ['', 'median ms', 'p95 ms', 'IdP calls per sign-in', 'new connections'])
+
+
+if __name__ == '__main__':
+    main()
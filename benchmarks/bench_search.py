@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+/api/tools?search= latency: the LIKE '%term%' fallback, the FTS5 index alone,
+and what the endpoint runs, FTS5 prefix matches merged with LIKE substring matches.
+
+Each run builds a synthetic inventory, then times the page query plus the
+COUNT(*) the endpoint issues, for a handful of typical search terms.
+Usage: python benchmarks/bench_search.py [--sizes 10000,100000,1000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from common import BENCH_USER, connect, create_inventory, report
+import db
+import search
+
+TERMS = ['dri', 'dewalt', 'brushless sander', 'SN0000', 'person 7']
+
+JOINS = """
+    LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+    LEFT JOIN people p ON l.person_id = p.id
+"""
+
+
+def fts_queries(term):
+    base = "FROM tools_fts CROSS JOIN tools t ON t.id = tools_fts.rowid" + JOINS + \
+           "WHERE tools_fts MATCH ? AND t.created_by = ?"
+    params = [search.match_query(term), BENCH_USER]
+    return base, params, f"{search.bm25_rank()}, t.id"
+
+
+def like_queries(term):
+    like_sql, like_params = search.like_filter(term)
+    base = "FROM tools t" + JOINS + "WHERE t.created_by = ? AND " + like_sql
+    return base, [BENCH_USER] + like_params, "t.id"
+
+
+def merged_queries(term):
+    like_sql, like_params = search.like_filter(term)
+    base = ("FROM tools t LEFT JOIN (SELECT rowid, " + search.bm25_rank() + " AS rank FROM tools_fts "
+            "WHERE tools_fts MATCH ?) f ON f.rowid = t.id" + JOINS +
+            "WHERE t.created_by = ? AND (f.rowid IS NOT NULL OR " + like_sql + ")")
+    return base, [search.match_query(term), BENCH_USER] + like_params, "f.rank IS NULL, f.rank, t.id"
+
+
+def time_search(conn, build, term, repeat):
+    base, params, order_by = build(term)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()
+        conn.execute(
+            f"SELECT t.id, t.name, p.name AS borrower {base} ORDER BY {order_by} LIMIT 20 OFFSET 0",
+            params,
+        ).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = connect(os.path.join(tmp, 'bench.db'), {'cache_size': -65536})
+            create_inventory(conn, size)
+            db.ensure_indexes(conn)
+            start = time.perf_counter()
+            if not search.ensure_search_index(conn):
+                raise SystemExit('SQLite was built without FTS5')
+            conn.commit()
+            build_s = time.perf_counter() - start
+            for term in TERMS:
+                like_ms = time_search(conn, like_queries, term, args.repeat)
+                fts_ms = time_search(conn, fts_queries, term, args.repeat)
+                merged_ms = time_search(conn, merged_queries, term, args.repeat)
+                rows.append([f"{size:,}", term, f"{like_ms:.2f}", f"{fts_ms:.2f}", f"{like_ms / fts_ms:.1f}x",
+                             f"{merged_ms:.2f}"])
+            conn.close()
+        print(f"{size:,} tools: FTS index built in {build_s:.1f}s")
+
+    print()
+    report('Median ms per search request (COUNT + first page)', rows,
+           ['tools', 'term', 'LIKE ms', 'FTS5 ms', 'speedup', 'FTS5 + LIKE ms'])
+
+
+if __name__ == '__main__':
+    main()
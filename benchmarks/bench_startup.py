@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Worker cold start: time from interpreter launch to the first /health
+response, against a database whose schema is already current.
+
+Each run starts a fresh interpreter that imports app and serves /health
+through the test client. sqlite3.connect is wrapped so every statement the
+process attempts during startup is counted. With --slow-idp, OIDC discovery
+points at a socket that accepts connections but never answers, as an
+identity provider that is down would. --importtime writes the slowest
+imports (python -X importtime, cumulative) to a report file.
+Usage: python benchmarks/bench_startup.py [--runs 10] [--slow-idp] [--importtime report.txt]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, report
+
+CHILD = r"""
+import json, sqlite3, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+statements = []
+
+class Cursor(sqlite3.Cursor):
+    # Counted before running, so statements that fail (e.g. a duplicate ALTER) count too
+    def execute(self, sql, *args):
+        statements.append(sql)
+        return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        statements.append(sql)
+        return super().executemany(sql, *args)
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+_connect = sqlite3.connect
+sqlite3.connect = lambda *args, **kwargs: _connect(*args, factory=Connection, **kwargs)
+import app
+imported = time.perf_counter()
+booted = len(statements)
+assert app.app.test_client().get('/health').status_code == 200
+print(json.dumps({{'import': imported - start, 'health': time.perf_counter() - start, 'statements': booted,
+                  'alters': sum(s.lstrip().upper().startswith('ALTER') for s in statements[:booted])}}))
+"""
+
+
+def run_once(env, extra_args=()):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *extra_args, '-c', CHILD.format(root=ROOT)],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats['wall'] = time.perf_counter() - start
+    return stats, result.stderr
+
+
+def write_importtime(stderr, path, top=40):
+    """Keep the ``top`` imports by cumulative time from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    with open(path, 'w') as f:
+        f.write(f"{'cumulative ms':>14}  {'self ms':>8}  module\n")
+        for cumulative_us, self_us, name in rows[:top]:
+            f.write(f"{cumulative_us / 1000:>14.1f}  {self_us / 1000:>8.1f}  {name}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--slow-idp', action='store_true', help='point OIDC discovery at an unresponsive server')
+    parser.add_argument('--importtime', metavar='PATH', help='write an import time report to PATH')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(os.environ, TOOLTRACKER_DB=os.path.join(tmpdir, 'tooltracker.db'),
+               UPLOAD_FOLDER=os.path.join(tmpdir, 'images'), OIDC_CLIENT_ID='', IMAGE_WORKERS='0',
+               OIDC_REDIRECT_URI='http://localhost:5000/oidc/callback', SECRET_KEY='bench')
+    idp = None
+    if args.slow_idp:
+        # The kernel completes the handshake for queued connections; nothing ever replies
+        idp = socket.socket()
+        idp.bind(('127.0.0.1', 0))
+        idp.listen(64)
+        env.update(OIDC_CLIENT_ID='bench', OIDC_DISCOVERY_URL=f'http://127.0.0.1:{idp.getsockname()[1]}/')
+    try:
+        first, _ = run_once(env)  # creates the schema
+        runs = [run_once(env)[0] for _ in range(args.runs)]
+        if args.importtime:
+            _, stderr = run_once(env, ['-X', 'importtime'])
+            write_importtime(stderr, args.importtime)
+    finally:
+        shutil.rmtree(tmpdir)
+        if idp:
+            idp.close()
+
+    def row(label, results):
+        def median(key):
+            return statistics.median(r[key] for r in results)
+        return [
+            label,
+            f"{median('wall') * 1000:.1f}",
+            f"{median('import') * 1000:.1f}",
+            f"{median('health') * 1000:.1f}",
+            int(median('statements')),
+            int(median('alters')),
+        ]
+
+    report(f'worker cold start ({args.runs} runs, median)',
+           [row('empty database', [first]), row('schema current', runs)],
+           ['boot', 'launch to /health ms', 'import app ms', 'import to /health ms', 'statements', 'ALTER TABLE'])
+    if args.importtime:
+        print(f"import time report written to {args.importtime}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Read throughput of the /api/tools query while a writer is active, for each
+SQLite storage profile in config.py.
+
+Readers and the writer run in separate processes, like gunicorn workers.
+Usage: python benchmarks/bench_storage.py [--tools 20000] [--seconds 5] [--readers 2]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from common import BENCH_USER, app_config, connect, create_inventory, report
+
+LIST_QUERY = """
+    SELECT t.id, t.name, t.description, t.value, t.image_path, t.brand, p.name AS borrower, l.lent_on
+    FROM tools t
+    LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+    LEFT JOIN people p ON l.person_id = p.id
+    WHERE t.created_by = ?
+    ORDER BY t.id
+    LIMIT 20 OFFSET ?
+"""
+
+
+def reader(path, pragmas, stop_at, result):
+    conn = connect(path, pragmas)
+    reads = errors = 0
+    offset = 0
+    while time.monotonic() < stop_at:
+        try:
+            conn.execute(LIST_QUERY, (BENCH_USER, offset)).fetchall()
+            reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        offset = (offset + 20) % 2000
+    result.put(('read', reads, errors))
+
+
+def writer(path, pragmas, stop_at, person_ids, result):
+    # Mimics lend_tool/return_tool: small transactions back to back
+    conn = connect(path, pragmas)
+    writes = errors = 0
+    while time.monotonic() < stop_at:
+        try:
+            c = conn.cursor()
+            c.execute(
+                "INSERT INTO tools (name, description, value, created_by) VALUES ('Bench', '', 1, ?)",
+                (BENCH_USER,),
+            )
+            c.execute(
+                "INSERT INTO loans (tool_id, person_id, lent_on, lent_by) VALUES (?, ?, '2024-05-01', ?)",
+                (c.lastrowid, person_ids[writes % len(person_ids)], BENCH_USER),
+            )
+            conn.commit()
+            writes += 1
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors += 1
+    result.put(('write', writes, errors))
+
+
+def run_profile(name, profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = connect(path)
+        if profile.get('journal_mode'):
+            conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+        _, person_ids = create_inventory(conn, args.tools)
+        conn.close()
+
+        pragmas = {k: v for k, v in profile.items() if k != 'journal_mode'}
+        result = multiprocessing.Queue()
+        stop_at = time.monotonic() + 0.5 + args.seconds
+        procs = [multiprocessing.Process(target=reader, args=(path, pragmas, stop_at, result))
+                 for _ in range(args.readers)]
+        procs.append(multiprocessing.Process(target=writer, args=(path, pragmas, stop_at, person_ids, result)))
+        for p in procs:
+            p.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in procs:
+            kind, count, errors = result.get()
+            totals[kind][0] += count
+            totals[kind][1] += errors
+        for p in procs:
+            p.join()
+
+    return [
+        name,
+        profile.get('journal_mode', '-'),
+        f"{totals['read'][0] / args.seconds:,.0f}",
+        totals['read'][1],
+        f"{totals['write'][0] / args.seconds:,.0f}",
+        totals['write'][1],
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tools', type=int, default=20000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=2)
+    args = parser.parse_args()
+
+    rows = [run_profile(name, profile, args) for name, profile in app_config().SQLITE_STORAGE_PROFILES.items()]
+    report(
+        f"{args.readers} reader(s) + 1 writer, {args.tools:,} tools, {args.seconds}s per profile",
+        rows,
+        ['profile', 'journal', 'reads/s', 'read errors', 'writes/s', 'write errors'],
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+SQL statements per page load with and without the per-worker user cache.
+
+A page load is what the browser does for the tool grid: GET /, the
+/api/tools call its script makes, and one /data/images request per
+thumbnail. Every statement run on a pooled connection is counted; the
+users lookups are the ones Flask-Login's user_loader makes.
+Usage: python benchmarks/bench_user_cache.py [--tools 20] [--loads 20]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from common import app_config, report
+
+statements = []
+
+
+class Cursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        statements.append(sql)
+        return super().execute(sql, *args)
+
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+
+def page_load(client, image_urls):
+    client.get('/')
+    client.get('/api/tools')
+    for url in image_urls:
+        client.get(url, headers={'Accept': 'image/webp'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tools', type=int, default=20, help='thumbnails on the page')
+    parser.add_argument('--loads', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-user-cache-')
+    os.environ.update(TOOLTRACKER_DB=os.path.join(tmpdir, 'tooltracker.db'),
+                      UPLOAD_FOLDER=os.path.join(tmpdir, 'images'), OIDC_CLIENT_ID='', IMAGE_WORKERS='0')
+    app_config()
+    _connect = sqlite3.connect
+    sqlite3.connect = lambda *a, **kw: _connect(*a, factory=Connection, **kw)
+    from PIL import Image
+    from app import app
+    import auth
+
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        conn.execute("INSERT INTO users (id, email, name) VALUES ('bench-user', 'bench@example.com', 'Bench')")
+        image_urls = []
+        for i in range(args.tools):
+            buf = io.BytesIO()
+            Image.new('RGB', (400, 300), (i, 100, 200)).save(buf, 'JPEG')
+            with open(os.path.join(app.config['UPLOAD_FOLDER'], f'bench_{i}.jpg'), 'wb') as f:
+                f.write(buf.getvalue())
+            conn.execute("INSERT INTO tools (name, image_path, created_by) VALUES (?, ?, 'bench-user')",
+                         (f'Tool {i}', f'images/bench_{i}.jpg'))
+            image_urls.append(f'/data/images/bench_{i}.jpg?w=96')
+        conn.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = 'bench-user'
+        sess['_fresh'] = True
+    page_load(client, image_urls)  # builds the variants
+
+    rows = []
+    for label, size in (('no cache', 0), ('user cache', app.config['USER_CACHE_SIZE'])):
+        app.extensions['user_cache'] = auth.UserCache(size, app.config['USER_CACHE_TTL'])
+        counts, user_counts, times = [], [], []
+        for _ in range(args.loads):
+            del statements[:]
+            start = time.perf_counter()
+            page_load(client, image_urls)
+            times.append((time.perf_counter() - start) * 1000)
+            counts.append(len(statements))
+            user_counts.append(sum('FROM users' in sql for sql in statements))
+        stats = app.extensions['user_cache'].stats()
+        rows.append([label, f"{statistics.median(counts):.0f}", f"{statistics.median(user_counts):.0f}",
+                     f"{statistics.median(times):.1f}", f"{stats['hits']}/{stats['misses']}"])
+
+    shutil.rmtree(tmpdir)
+    report(f'page load: /, /api/tools and {args.tools} thumbnails (median of {args.loads})', rows,
+           ['', 'statements', 'users lookups', 'ms', 'cache hits/misses'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Shared helpers for the benchmark scripts: a schema matching migrations.py and a
+synthetic inventory generator.
+"""
+
+import os
+import random
+import sqlite3
+import sys
+
+# Make the application modules importable when run as `python benchmarks/<script>.py`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+BENCH_USER = 'bench-user'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    picture TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS tools (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    description TEXT,
+    value REAL,
+    image_path TEXT,
+    brand TEXT,
+    model_number TEXT,
+    serial_number TEXT,
+    acquisition_date TEXT,
+    created_by TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS people (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    contact_info TEXT,
+    created_by TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(name, created_by)
+);
+CREATE TABLE IF NOT EXISTS loans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tool_id INTEGER NOT NULL,
+    person_id INTEGER NOT NULL,
+    lent_on TEXT NOT NULL,
+    returned_on TEXT,
+    lent_by TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+BRANDS = ['DeWalt', 'Makita', 'Milwaukee', 'Bosch', 'Stanley', 'Ryobi', 'Craftsman', 'Festool', 'Hilti', 'Klein']
+KINDS = ['Drill', 'Hammer', 'Saw', 'Wrench', 'Sander', 'Level', 'Screwdriver', 'Grinder', 'Router', 'Clamp']
+WORDS = ['cordless', 'heavy', 'duty', 'compact', 'brushless', 'steel', 'magnetic', 'precision', 'folding', 'garage']
+
+
+def app_config():
+    """The application's Config class, importable without a .env file"""
+    os.environ.setdefault('OIDC_REDIRECT_URI', 'http://localhost:5000/oidc/callback')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    from config import Config
+    return Config
+
+
+def connect(path, pragmas=None):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for name, value in (pragmas or {}).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def create_inventory(conn, n_tools, n_people=50, lent_fraction=0.2, user_id=BENCH_USER, seed=42):
+    """Create the schema and fill it with ``n_tools`` tools for ``user_id``"""
+    rng = random.Random(seed)
+    conn.executescript(SCHEMA)
+    conn.execute(
+        "INSERT OR IGNORE INTO users (id, email, name) VALUES (?, ?, ?)",
+        (user_id, f"{user_id}@example.com", 'Bench User'),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO people (name, contact_info, created_by) VALUES (?, ?, ?)",
+        ((f"Person {i}", f"person{i}@example.com", user_id) for i in range(n_people)),
+    )
+    person_ids = [r[0] for r in conn.execute("SELECT id FROM people WHERE created_by = ?", (user_id,))]
+
+    def tools():
+        for i in range(n_tools):
+            kind = rng.choice(KINDS)
+            brand = rng.choice(BRANDS)
+            yield (
+                f"{brand} {kind} {i}",
+                ' '.join(rng.sample(WORDS, 4)),
+                round(rng.uniform(0, 1500), 2),
+                brand,
+                f"{kind[:3].upper()}{rng.randint(100, 999)}",
+                f"SN{i:08d}",
+                '2024-01-15',
+                user_id,
+            )
+
+    conn.executemany(
+        """
+        INSERT INTO tools (name, description, value, brand, model_number, serial_number, acquisition_date, created_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        tools(),
+    )
+    tool_ids = [r[0] for r in conn.execute("SELECT id FROM tools WHERE created_by = ?", (user_id,))]
+    lent = rng.sample(tool_ids, int(len(tool_ids) * lent_fraction))
+    conn.executemany(
+        "INSERT INTO loans (tool_id, person_id, lent_on, lent_by) VALUES (?, ?, ?, ?)",
+        ((tool_id, rng.choice(person_ids), '2024-03-01', user_id) for tool_id in lent),
+    )
+    conn.commit()
+    return tool_ids, person_ids
+
+
+def report(title, rows, headers):
+    """Print a small aligned table"""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print(title)
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
+    print()
@@ -19,6 +19,40 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     TOOLTRACKER_DB = os.environ.get('TOOLTRACKER_DB', 'tooltracker.db')
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join('static', 'images'))
+
+    # SQLite connection pool (per gunicorn worker)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+
+    # SQLite storage profiles. journal_mode is persistent and applied by init_db;
+    # the remaining PRAGMAs are applied to every pooled connection when it opens.
+    SQLITE_STORAGE_PROFILES = {
+        'wal': {
+            'busy_timeout': 5000,           # ms to wait on a locked database
+            'journal_mode': 'WAL',          # readers don't block on the writer
+            'synchronous': 'NORMAL',        # durable across app crashes in WAL mode
+            'mmap_size': 64 * 1024 * 1024,  # bytes
+            'cache_size': -16000,           # negative = KiB
+            'temp_store': 'MEMORY',
+        },
+        'rollback': {
+            'busy_timeout': 5000,
+            'journal_mode': 'DELETE',
+            'synchronous': 'FULL',
+        },
+    }
+    SQLITE_STORAGE_PROFILE = os.environ.get('SQLITE_STORAGE_PROFILE', 'wal')
+
+    # Tool search: 'fts' uses the SQLite FTS5 index (falls back to 'like' if unavailable)
+    TOOL_SEARCH_BACKEND = os.environ.get('TOOL_SEARCH_BACKEND', 'fts')
+
+    # Retries for writes that still hit SQLITE_BUSY after busy_timeout
+    SQLITE_BUSY_RETRIES = int(os.environ.get('SQLITE_BUSY_RETRIES', 3))
+    SQLITE_BUSY_BACKOFF = float(os.environ.get('SQLITE_BUSY_BACKOFF', 0.05))  # seconds, doubled per retry
+
+    # Per-worker cache of logged-in users for Flask-Login's user_loader
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))  # seconds
     
     # OIDC Configuration
     OIDC_CLIENT_ID = os.environ.get('OIDC_CLIENT_ID')
@@ -26,6 +60,23 @@ class Config:
     OIDC_DISCOVERY_URL = os.environ.get('OIDC_DISCOVERY_URL')
     OIDC_ISSUER = os.environ.get('OIDC_ISSUER')
     OIDC_SCOPES = os.environ.get('OIDC_SCOPES', 'openid profile email')
+
+    # Discovery document and JWKS cache shared by workers and restarts ('' = memory only),
+    # refreshed in the background within the provider's cache headers and at most this TTL
+    OIDC_DISCOVERY_CACHE = os.environ.get(
+        'OIDC_DISCOVERY_CACHE',
+        os.path.join(os.path.dirname(os.path.abspath(TOOLTRACKER_DB)), 'oidc-discovery.json'),
+    )
+    OIDC_DISCOVERY_CACHE_TTL = int(os.environ.get('OIDC_DISCOVERY_CACHE_TTL', 86400))  # seconds
+
+    # Take the user's claims from the ID token, verified against the cached JWKS (or the
+    # client secret for HS256), instead of calling userinfo on every sign-in
+    OIDC_VERIFY_ID_TOKEN = os.environ.get('OIDC_VERIFY_ID_TOKEN', 'true').lower() == 'true'
+
+    # HTTP connections to the identity provider (token exchange, userinfo, metadata)
+    OIDC_HTTP_POOL_SIZE = int(os.environ.get('OIDC_HTTP_POOL_SIZE', 10))  # keep-alive connections per worker
+    OIDC_HTTP_RETRIES = int(os.environ.get('OIDC_HTTP_RETRIES', 2))  # on connect errors and 5xx
+    OIDC_HTTP_BACKOFF = float(os.environ.get('OIDC_HTTP_BACKOFF', 0.2))  # seconds, doubled per retry
     
     # Custom OIDC endpoints (if not using discovery)
     OIDC_AUTHORIZATION_ENDPOINT = os.environ.get('OIDC_AUTHORIZATION_ENDPOINT')
@@ -47,6 +98,45 @@ class Config:
     JPEG_QUALITY = 85
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
+    # Responsive variants built at upload: max dimensions (MAX_IMAGE_DIMENSION is
+    # the main image) and extra encodings with their quality. Encodings the
+    # installed Pillow can't write (AVIF needs libavif) are skipped.
+    IMAGE_VARIANT_WIDTHS = (96, 200, 480, 1024)
+    IMAGE_VARIANT_FORMATS = {'webp': 80, 'avif': 60}
+
+    # Browser caching of /data/images responses, and optional offload of the
+    # file transfer to the web server: '' | 'x-accel' (nginx) | 'x-sendfile'
+    IMAGE_CACHE_MAX_AGE = 31536000
+    IMAGE_SENDFILE = os.environ.get('IMAGE_SENDFILE', '')
+    IMAGE_X_ACCEL_PREFIX = os.environ.get('IMAGE_X_ACCEL_PREFIX', '/protected-images/')
+
+    # Disk budget for variants (0 = unlimited). Least recently served variants
+    # are evicted past it and regenerated from the main image on request.
+    IMAGE_VARIANT_CACHE_BYTES = int(os.environ.get('IMAGE_VARIANT_CACHE_BYTES', 0))
+    IMAGE_VARIANT_CACHE_CHECK_INTERVAL = 60  # seconds between budget checks per process
+    IMAGE_VARIANT_CACHE_TOUCH_INTERVAL = 3600  # seconds between last-used updates per variant
+
+    # JSON API responses at least this large are compressed (gzip, or Brotli
+    # when the brotli package is installed) for clients that accept it
+    JSON_COMPRESS_MIN_BYTES = int(os.environ.get('JSON_COMPRESS_MIN_BYTES', 1024))
+    JSON_GZIP_LEVEL = 6
+    JSON_BROTLI_QUALITY = 5
+
+    # Browser caching of /static files requested with their current ?v= content hash
+    STATIC_CACHE_MAX_AGE = 31536000
+
+    # Manifest of the fingerprinted frontend bundles written by `npm run build`
+    # (default static/dist/manifest.json); without one, templates use the CDN scripts
+    ASSET_MANIFEST = os.environ.get('ASSET_MANIFEST', '')
+
+    # Background image processing: worker threads per process (0 = process
+    # uploads inline in the request), retry policy for failed jobs
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 1))
+    IMAGE_WORKER_POLL_INTERVAL = 2.0
+    IMAGE_JOB_MAX_ATTEMPTS = 3
+    IMAGE_JOB_RETRY_DELAY = 5  # seconds, doubled after each failed attempt
+    IMAGE_JOB_TIMEOUT = 300  # seconds before a job left 'running' is picked up again
+
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
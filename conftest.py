@@ -0,0 +1,47 @@
+import os
+import tempfile
+import uuid
+import pytest
+
+# app.py reads its configuration and initializes the database at import time,
+# so point it at a throwaway directory before any test imports it.
+_tmpdir = tempfile.mkdtemp(prefix='tooltracker-test-')
+os.environ['TOOLTRACKER_DB'] = os.path.join(_tmpdir, 'tooltracker.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_tmpdir, 'images')
+os.environ['OIDC_CLIENT_ID'] = ''
+# Process uploaded images inline so tests can assert on the results
+os.environ['IMAGE_WORKERS'] = '0'
+os.environ.setdefault('OIDC_REDIRECT_URI', 'http://localhost:5000/oidc/callback')
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
+
+
+@pytest.fixture
+def user_id(app):
+    """A fresh user so each test sees an empty inventory"""
+    uid = f"test-{uuid.uuid4().hex[:12]}"
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        conn.execute(
+            "INSERT INTO users (id, email, name) VALUES (?, ?, ?)",
+            (uid, f"{uid}@example.com", 'Test User'),
+        )
+        conn.commit()
+    return uid
+
+
+@pytest.fixture
+def client(app, user_id):
+    """Test client logged in as ``user_id``"""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = user_id
+        sess['_fresh'] = True
+    return client
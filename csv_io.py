@@ -0,0 +1,163 @@
+import csv
+import datetime
+import io
+import time
+
+# Column headers of the tools CSV, in file order
+TOOL_HEADERS = ['Name', 'Description', 'Value', 'Brand', 'Model Number', 'Serial Number', 'Acquisition Date']
+CREATED_AT_HEADER = 'Created At'
+
+# Rows inserted per executemany() call during an import
+IMPORT_BATCH_SIZE = 500
+
+# Rows fetched from the cursor per chunk of a streamed export
+EXPORT_CHUNK_SIZE = 500
+
+# Number of row errors kept for display; the rest are only counted
+MAX_REPORTED_ERRORS = 5
+
+
+class CSVImportError(ValueError):
+    """The upload can't be imported at all (bad encoding or headers)"""
+
+
+class ImportResult:
+    """Outcome of import_tools_csv"""
+
+    def __init__(self):
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []  # first MAX_REPORTED_ERRORS messages
+        self.rows = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def add_error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+def tool_headers(has_created_at):
+    return TOOL_HEADERS + [CREATED_AT_HEADER] if has_created_at else list(TOOL_HEADERS)
+
+
+def _clean(value):
+    return value.strip() if value else ''
+
+
+def import_tools_csv(conn, stream, user_id, has_created_at, batch_size=IMPORT_BATCH_SIZE):
+    """Stream tools from a binary CSV upload into the tools table.
+
+    The upload is decoded incrementally and inserted with executemany() in
+    batches, so memory use doesn't grow with file size. All inserts happen in
+    the caller's transaction: once any row fails validation no further rows
+    are inserted, but the rest of the file is still validated so every error
+    is counted. The caller commits or rolls back based on ``error_count``.
+
+    Raises CSVImportError for a file that isn't UTF-8 or lacks the expected
+    headers.
+    """
+    result = ImportResult()
+    start = time.perf_counter()
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    try:
+        reader = csv.DictReader(text)
+        expected = tool_headers(has_created_at)
+        if not reader.fieldnames or not all(h in reader.fieldnames for h in expected):
+            raise CSVImportError('Invalid CSV format. Please use the template provided.')
+
+        columns = "name, description, value, brand, model_number, serial_number, acquisition_date, created_by"
+        if has_created_at:
+            columns += ", created_at"
+        sql = f"INSERT INTO tools ({columns}) VALUES ({', '.join('?' * len(columns.split(', ')))})"
+
+        batch = []
+        for row_num, row in enumerate(reader, start=2):  # Start at 2 because row 1 is header
+            result.rows += 1
+            name = _clean(row['Name'])
+            if not name:
+                result.add_error(f'Row {row_num}: Name is required')
+                continue
+
+            value = 0.0
+            raw_value = _clean(row['Value'])
+            if raw_value:
+                try:
+                    value = float(raw_value)
+                except ValueError:
+                    result.add_error(f'Row {row_num}: Invalid value format')
+                    continue
+
+            if result.error_count:
+                # The import will be rolled back; keep validating but stop writing
+                continue
+
+            record = (
+                name,
+                _clean(row['Description']),
+                value,
+                _clean(row['Brand']),
+                _clean(row['Model Number']),
+                _clean(row['Serial Number']),
+                _clean(row['Acquisition Date']),
+                user_id,
+            )
+            if has_created_at:
+                record += (row[CREATED_AT_HEADER] or datetime.datetime.now().isoformat(),)
+            batch.append(record)
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                result.imported += len(batch)
+                batch = []
+
+        if batch and not result.error_count:
+            conn.executemany(sql, batch)
+            result.imported += len(batch)
+    except UnicodeDecodeError:
+        raise CSVImportError('CSV file must be UTF-8 encoded. Please check your file and try again.')
+    finally:
+        # Don't let the wrapper close the upload stream when it is collected
+        text.detach()
+        result.seconds = time.perf_counter() - start
+    return result
+
+
+def export_tools_csv(conn, user_id, has_created_at, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a user's tools as UTF-8 encoded CSV, one chunk per fetchmany() batch.
+
+    Only ``chunk_size`` rows are held at a time, so memory use is flat
+    whatever the size of the inventory. The query runs before the first
+    chunk (the header) is yielded, so callers can pull that chunk to surface
+    database errors before a response starts.
+    """
+    columns = "name, description, value, brand, model_number, serial_number, acquisition_date"
+    if has_created_at:
+        columns += ", created_at"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data.encode('utf-8')
+
+    cursor = conn.execute(
+        f"SELECT {columns} FROM tools WHERE created_by = ? ORDER BY name", (user_id,)
+    )
+    try:
+        writer.writerow(tool_headers(has_created_at))
+        yield drain()
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.writerows([value or '' for value in row] for row in rows)
+            yield drain()
+    finally:
+        cursor.close()
@@ -0,0 +1,84 @@
+"""
+Per-user data version stamps.
+
+user_data_version holds a counter per user that triggers bump in the same
+transaction as every insert, update or delete of that user's tools, people
+or loans (loans count for the owner of the tool). A response built from a
+user's data is therefore unchanged for as long as their version is, which
+makes one primary-key lookup enough to validate anything cached under it.
+
+Every write path is covered this way, routes and background jobs alike,
+without any of them having to remember to bump. Caches key their entries
+with versioned_key() (or current_key() in a request) and never need
+invalidating: a write makes every older key unreachable.
+"""
+
+from flask_login import current_user
+
+import db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data_version (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def _bump(user, condition=None):
+    """Trigger statement adding one to ``user``'s version (an SQL expression)"""
+    where = f"{user} IS NOT NULL" + (f" AND {condition}" if condition else "")
+    # INSERT ... SELECT needs its WHERE clause for SQLite to parse the upsert
+    return f"""
+            INSERT INTO user_data_version (user_id, version) SELECT {user}, 1 WHERE {where}
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;"""
+
+
+def _tool_owner(ref):
+    return f"(SELECT created_by FROM tools WHERE id = {ref}.tool_id)"
+
+
+TRIGGERS = {}
+for _table, _owner in (('tools', lambda ref: f"{ref}.created_by"),
+                       ('people', lambda ref: f"{ref}.created_by"),
+                       ('loans', _tool_owner)):
+    TRIGGERS[f'data_version_{_table}_insert'] = f"""
+        CREATE TRIGGER IF NOT EXISTS data_version_{_table}_insert AFTER INSERT ON {_table} BEGIN
+            {_bump(_owner('new'))}
+        END
+    """
+    TRIGGERS[f'data_version_{_table}_update'] = f"""
+        CREATE TRIGGER IF NOT EXISTS data_version_{_table}_update AFTER UPDATE ON {_table} BEGIN
+            {_bump(_owner('new'))}
+            {_bump(_owner('old'), f"{_owner('old')} IS NOT {_owner('new')}")}
+        END
+    """
+    TRIGGERS[f'data_version_{_table}_delete'] = f"""
+        CREATE TRIGGER IF NOT EXISTS data_version_{_table}_delete AFTER DELETE ON {_table} BEGIN
+            {_bump(_owner('old'))}
+        END
+    """
+del _table, _owner
+
+
+def ensure_data_version_tables(conn):
+    """Create the version table and the triggers that maintain it"""
+    conn.execute(SCHEMA)
+    for sql in TRIGGERS.values():
+        conn.execute(sql)
+
+
+def current(conn, user_id):
+    """``user_id``'s data version: 0 until their data first changes"""
+    row = conn.execute("SELECT version FROM user_data_version WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def versioned_key(conn, user_id, *parts):
+    """Cache key for something derived from ``user_id``'s data, e.g. ('api', url)"""
+    return ':'.join(str(part) for part in (user_id, f"v{current(conn, user_id)}", *parts))
+
+
+def current_key(*parts):
+    """versioned_key() for the logged-in user, on the request's pooled connection"""
+    return versioned_key(db.get_db(), current_user.id, *parts)
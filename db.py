@@ -0,0 +1,422 @@
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, current_app
+
+# PRAGMAs that are stored in the database file rather than per connection
+DATABASE_PRAGMAS = ('journal_mode',)
+
+# Secondary indexes for the hot query shapes, created and verified by init_db
+INDEXES = {
+    # Inventory list/count/report queries: WHERE created_by = ? ORDER BY id
+    'idx_tools_owner': "CREATE INDEX IF NOT EXISTS idx_tools_owner ON tools(created_by)",
+    # Brand filter, /api/brands and the brand report
+    'idx_tools_owner_brand': "CREATE INDEX IF NOT EXISTS idx_tools_owner_brand ON tools(created_by, brand)",
+    # CSV export streams a user's tools in name order without a temp sort
+    'idx_tools_owner_name': "CREATE INDEX IF NOT EXISTS idx_tools_owner_name ON tools(created_by, name)",
+    # The "currently lent out" join used almost everywhere
+    'idx_loans_active_tool': (
+        "CREATE INDEX IF NOT EXISTS idx_loans_active_tool ON loans(tool_id) WHERE returned_on IS NULL"
+    ),
+    # Lending history on the tool detail page
+    'idx_loans_tool': "CREATE INDEX IF NOT EXISTS idx_loans_tool ON loans(tool_id, lent_on)",
+    # Person detail, delete_person and the borrower report
+    'idx_loans_person': "CREATE INDEX IF NOT EXISTS idx_loans_person ON loans(person_id, lent_on)",
+    # People list ordered by name
+    'idx_people_owner_name': "CREATE INDEX IF NOT EXISTS idx_people_owner_name ON people(created_by, name)",
+}
+
+# Representative shapes of the queries the routes run on every page view.
+# The test suite runs EXPLAIN QUERY PLAN on each and fails on a full table scan.
+HOT_QUERIES = {
+    'api_tools': ("""
+        SELECT t.id, t.name, t.description, t.value, t.image_path, p.name AS borrower, l.lent_on
+        FROM tools t
+        LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+        LEFT JOIN people p ON l.person_id = p.id
+        WHERE t.created_by = ?
+        ORDER BY t.id
+        LIMIT ? OFFSET ?
+    """, ('user', 20, 0)),
+    'api_tools_brand': ("""
+        SELECT t.id, t.name, p.name AS borrower, l.lent_on
+        FROM tools t
+        LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+        LEFT JOIN people p ON l.person_id = p.id
+        WHERE t.created_by = ? AND t.brand = ?
+        ORDER BY t.id
+        LIMIT ? OFFSET ?
+    """, ('user', 'DeWalt', 20, 0)),
+    'api_tools_keyset': ("""
+        SELECT t.id, t.name, p.name AS borrower, l.lent_on
+        FROM tools t
+        LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+        LEFT JOIN people p ON l.person_id = p.id
+        WHERE t.created_by = ? AND t.brand = ? AND t.id > ?
+        ORDER BY t.id
+        LIMIT ?
+    """, ('user', 'DeWalt', 100, 21)),
+    'api_brands': ("""
+        SELECT DISTINCT brand FROM tools
+        WHERE created_by = ? AND brand IS NOT NULL AND brand != ''
+        ORDER BY brand
+    """, ('user',)),
+    'export_tools': ("""
+        SELECT name, description, value, brand, model_number, serial_number, acquisition_date, created_at
+        FROM tools
+        WHERE created_by = ?
+        ORDER BY name
+    """, ('user',)),
+    'people': ("SELECT id, name, contact_info FROM people WHERE created_by = ? ORDER BY name", ('user',)),
+    'tool_detail': ("""
+        SELECT t.id, t.name, p.name AS borrower, l.lent_on
+        FROM tools t
+        LEFT JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+        LEFT JOIN people p ON l.person_id = p.id
+        WHERE t.id = ? AND t.created_by = ?
+    """, (1, 'user')),
+    'tool_history': ("""
+        SELECT l.id, l.lent_on, l.returned_on, p.name AS person_name
+        FROM loans l
+        JOIN people p ON l.person_id = p.id
+        WHERE l.tool_id = ?
+        ORDER BY l.lent_on DESC
+    """, (1,)),
+    'active_loan': ("SELECT id FROM loans WHERE tool_id = ? AND returned_on IS NULL", (1,)),
+    'person_loans': ("""
+        SELECT t.name AS tool_name, l.lent_on, l.returned_on
+        FROM loans l
+        JOIN tools t ON l.tool_id = t.id
+        WHERE l.person_id = ?
+        ORDER BY l.lent_on DESC
+    """, (1,)),
+    'person_loan_count': ("SELECT COUNT(*) FROM loans WHERE person_id = ?", (1,)),
+    'borrower_report': ("""
+        SELECT p.id AS person_id, p.name, COUNT(l.id) AS count
+        FROM people p
+        JOIN loans l ON p.id = l.person_id AND l.returned_on IS NULL
+        WHERE p.created_by = ?
+        GROUP BY p.id, p.name
+        ORDER BY p.name
+    """, ('user',)),
+    'overdue_report': ("""
+        SELECT t.id, t.name, p.name AS borrower, l.lent_on
+        FROM tools t
+        JOIN loans l ON t.id = l.tool_id AND l.returned_on IS NULL
+        JOIN people p ON l.person_id = p.id
+        WHERE t.created_by = ? AND (julianday('now') - julianday(l.lent_on)) > 30
+    """, ('user',)),
+    'report_totals': ("SELECT * FROM report_totals WHERE user_id = ?", ('user',)),
+    'report_value_buckets': (
+        "SELECT bucket, count, total_value FROM report_value_buckets WHERE user_id = ?", ('user',)
+    ),
+    'report_brands': ("""
+        SELECT brand, tool_count, total_value, valued_count
+        FROM report_brands
+        WHERE user_id = ?
+        ORDER BY total_value DESC
+    """, ('user',)),
+}
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+class PoolExhausted(RuntimeError):
+    """Raised when no pooled connection becomes free within the pool timeout"""
+
+
+class ConnectionPool:
+    """Bounded pool of warm SQLite connections for a single worker process.
+
+    Connections are opened lazily up to ``size``, have their PRAGMAs applied
+    once at open time and are handed back to the pool instead of being closed.
+    The pool is fork-aware: connections opened before a fork (gunicorn
+    --preload) are never reused by the child.
+    """
+
+    def __init__(self, db_path, size=4, timeout=10.0, pragmas=None):
+        self.db_path = db_path
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self._cond = threading.Condition()
+        self._idle = []
+        self._open_count = 0
+        self._pid = os.getpid()
+        self._dir_ready = False
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {'checkouts': 0, 'waits': 0, 'opens': 0, 'closes': 0, 'timeouts': 0}
+
+    def _check_fork(self):
+        # Never share a SQLite handle with the parent process: drop anything
+        # inherited across fork() and start counting afresh.
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._idle = []
+            self._open_count = 0
+            self._stats = self._empty_stats()
+
+    def _open(self):
+        if not self._dir_ready:
+            # Ensure the directory for the database exists (once per pool)
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._dir_ready = True
+
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def connect(self):
+        """Open a connection with the pool's PRAGMAs that the pool doesn't count or keep"""
+        return self._open()
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool is not full"""
+        deadline = time.monotonic() + self.timeout
+        conn = None
+        with self._cond:
+            self._check_fork()
+            waited = False
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open_count < self.size:
+                    self._open_count += 1
+                    break
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhausted(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                self._cond.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._open_count -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['opens'] += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                # Checked out before a fork; it is not ours to keep
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn):
+        """Close a broken connection and free its slot"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            if self._pid == os.getpid():
+                self._open_count -= 1
+                self._stats['closes'] += 1
+                self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (e.g. before gunicorn forks workers)"""
+        with self._cond:
+            self._check_fork()
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._stats['closes'] += len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Snapshot of pool counters for sizing and health reporting"""
+        with self._cond:
+            self._check_fork()
+            stats = dict(self._stats)
+            stats.update(
+                size=self.size,
+                open=self._open_count,
+                idle=len(self._idle),
+                in_use=self._open_count - len(self._idle),
+            )
+        return stats
+
+
+def storage_profile(app=None):
+    """Return the configured SQLite storage profile as a dict of PRAGMAs"""
+    if app is None:
+        app = current_app
+    profiles = app.config.get('SQLITE_STORAGE_PROFILES', {})
+    name = app.config.get('SQLITE_STORAGE_PROFILE', 'wal')
+    if name not in profiles:
+        raise ValueError(f"Unknown SQLITE_STORAGE_PROFILE {name!r}; choose from {sorted(profiles)}")
+    return dict(profiles[name])
+
+
+def connection_pragmas(profile):
+    """PRAGMAs from ``profile`` that must be set on every new connection"""
+    return {k: v for k, v in profile.items() if k not in DATABASE_PRAGMAS}
+
+
+def apply_storage_profile(conn, profile):
+    """Apply the database-level PRAGMAs of ``profile`` (run once from init_db).
+
+    Returns the journal mode SQLite actually selected, which can differ from
+    the requested one (e.g. WAL is unavailable on some network filesystems).
+    WAL mode is stored in the database file, so once it is set later boots
+    only read it.
+    """
+    mode = profile.get('journal_mode')
+    if not mode:
+        return None
+    current = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if current.lower() == mode.lower():
+        return current
+    return conn.execute(f"PRAGMA journal_mode = {mode}").fetchone()[0]
+
+
+def ensure_indexes(conn):
+    """Create the managed index set and return the names of any still missing"""
+    for sql in INDEXES.values():
+        conn.execute(sql)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    return [name for name in INDEXES if name not in existing]
+
+
+def full_table_scans(conn, sql, params=()):
+    """Return the tables EXPLAIN QUERY PLAN would read with a full scan"""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [m.group(1) for m in (_FULL_SCAN.match(row[3]) for row in plan) if m]
+
+
+def is_busy_error(exc):
+    """True for the OperationalErrors SQLite raises on SQLITE_BUSY/SQLITE_LOCKED"""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def busy_retry(f):
+    """Re-run a write view when SQLite reports the database as busy.
+
+    busy_timeout already makes each statement wait for the lock; this covers
+    the cases it can't (e.g. a read transaction upgrading to a write after
+    another worker committed). The request's connection is rolled back before
+    each retry, with exponential backoff and jitter between attempts.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        retries = current_app.config.get('SQLITE_BUSY_RETRIES', 3)
+        delay = current_app.config.get('SQLITE_BUSY_BACKOFF', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return f(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == retries:
+                    raise
+                conn = g.get('db_conn')
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                current_app.logger.warning(
+                    f"Database busy in {f.__name__}, retry {attempt + 1}/{retries}"
+                )
+                time.sleep(delay * (2 ** attempt) * (0.5 + random.random()))
+    return decorated_function
+
+
+def init_app(app):
+    """Create the connection pool for ``app`` and release connections at teardown"""
+    pool = ConnectionPool(
+        app.config['TOOLTRACKER_DB'],
+        size=app.config.get('DB_POOL_SIZE', 4),
+        timeout=app.config.get('DB_POOL_TIMEOUT', 10.0),
+        pragmas=connection_pragmas(storage_profile(app)),
+    )
+    app.extensions['sqlite_pool'] = pool
+    app.teardown_appcontext(_release_db)
+    return pool
+
+
+def get_pool(app=None):
+    if app is None:
+        app = current_app
+    return app.extensions['sqlite_pool']
+
+
+def get_db(app=None):
+    """Get the connection bound to the current app context.
+
+    The same connection is reused for the rest of the request and returned
+    to the pool when the app context is torn down.
+    """
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = get_pool(app).acquire()
+        g.db_conn = conn
+    return conn
+
+
+@contextmanager
+def pooled_connection(app=None):
+    """Check out a connection that is not tied to the app context.
+
+    For work with a lifetime of its own, such as an image job.
+    """
+    pool = get_pool(app)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def dedicated_connection(app=None):
+    """Open a connection outside the pool, closed on exit.
+
+    For work paced by the client, such as a streamed download: a slow reader
+    holding a pooled connection would keep it from every other request.
+    """
+    conn = get_pool(app).connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _release_db(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().release(conn)
@@ -0,0 +1,72 @@
+// Production build of the browser assets into static/dist:
+//   app-<hash>.js          static/js/app.js with its JSX precompiled, bundled with React's production build
+//   lend-<hash>.js, brand-logos-<hash>.js   the plain scripts, minified
+//   tailwind-<hash>.css    frontend/build/tailwind.css from `npm run build:css`
+//   manifest.json          { "app.js": "app-<hash>.js", ... }, read by assets.py
+// Usage: npm run build (runs build:css first)
+
+import * as esbuild from 'esbuild';
+import { createHash } from 'node:crypto';
+import { existsSync, mkdirSync, readFileSync, rmSync, writeFileSync } from 'node:fs';
+import path from 'node:path';
+import { fileURLToPath } from 'node:url';
+
+const root = path.dirname(path.dirname(fileURLToPath(import.meta.url)));
+const outdir = path.join(root, 'static', 'dist');
+const css = path.join(root, 'frontend', 'build', 'tailwind.css');
+
+const common = {
+  absWorkingDir: root,
+  outdir,
+  entryNames: '[name]-[hash]',
+  minify: true,
+  target: ['es2018'],
+  metafile: true,
+  logLevel: 'info',
+};
+
+function manifestEntries(result) {
+  const entries = {};
+  for (const [output, meta] of Object.entries(result.metafile.outputs)) {
+    if (meta.entryPoint && output.endsWith('.js')) {
+      entries[path.basename(meta.entryPoint)] = path.basename(output);
+    }
+  }
+  return entries;
+}
+
+rmSync(outdir, { recursive: true, force: true });
+mkdirSync(outdir, { recursive: true });
+
+// The React app: JSX -> React.createElement, React/ReactDOM from node_modules instead of the UMD globals
+const app = await esbuild.build({
+  ...common,
+  entryPoints: ['static/js/app.js'],
+  bundle: true,
+  format: 'iife',
+  loader: { '.js': 'jsx' },
+  inject: ['frontend/react-shim.js'],
+  define: { 'process.env.NODE_ENV': '"production"' },
+  sourcemap: 'linked',
+});
+
+// Classic scripts share top-level names with inline scripts (e.g. BRAND_LOGOS),
+// so they are minified without bundling, which keeps their globals
+const scripts = await esbuild.build({
+  ...common,
+  entryPoints: ['static/js/lend.js', 'static/js/brand-logos.js'],
+});
+
+const manifest = { ...manifestEntries(app), ...manifestEntries(scripts) };
+
+if (existsSync(css)) {
+  const content = readFileSync(css);
+  const name = `tailwind-${createHash('sha256').update(content).digest('hex').slice(0, 10)}.css`;
+  writeFileSync(path.join(outdir, name), content);
+  manifest['tailwind.css'] = name;
+} else {
+  console.warn(`${path.relative(root, css)} missing (run npm run build:css); pages keep the Tailwind CDN`);
+}
+
+writeFileSync(path.join(outdir, 'manifest.json'), JSON.stringify(manifest, null, 2) + '\n');
+console.log(manifest);
@@ -0,0 +1,32 @@
+// Check the build output against what assets.py expects: manifest.json maps every
+// bundle the templates ask for to a fingerprinted file that exists in static/dist.
+// Usage: npm run check (after npm run build; the Docker build runs it)
+
+import { existsSync, readFileSync } from 'node:fs';
+import path from 'node:path';
+import { fileURLToPath } from 'node:url';
+
+const root = path.dirname(path.dirname(fileURLToPath(import.meta.url)));
+const outdir = path.join(root, 'static', 'dist');
+// The asset_url() names used in templates/
+const REQUIRED = ['app.js', 'lend.js', 'brand-logos.js', 'tailwind.css'];
+
+const manifest = JSON.parse(readFileSync(path.join(outdir, 'manifest.json'), 'utf8'));
+const problems = [];
+for (const name of REQUIRED) {
+  const file = manifest[name];
+  const { name: stem, ext } = path.parse(name);
+  if (!file) {
+    problems.push(`${name}: missing from manifest.json`);
+  } else if (!new RegExp(`^${stem}-[\\w-]{8,}\\${ext}$`).test(file)) {
+    problems.push(`${name}: ${file} is not fingerprinted`);
+  } else if (!existsSync(path.join(outdir, file))) {
+    problems.push(`${name}: ${file} does not exist`);
+  }
+}
+
+if (problems.length) {
+  console.error(`static/dist is incomplete:\n  ${problems.join('\n  ')}`);
+  process.exit(1);
+}
+console.log(`static/dist: ${REQUIRED.length} fingerprinted bundles`);
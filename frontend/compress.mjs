@@ -0,0 +1,57 @@
+// Precompress the text assets under static/ into name.br and name.gz next to
+// each file, for assets.py to send to clients that accept them. Copies that
+// aren't at least 10% smaller are not kept. Written after their source, so
+// they are never older than it (assets.py ignores copies that are).
+// Usage: npm run compress (part of npm run build)
+
+import { readdirSync, readFileSync, rmSync, writeFileSync } from 'node:fs';
+import path from 'node:path';
+import { fileURLToPath } from 'node:url';
+import { brotliCompressSync, constants, gzipSync } from 'node:zlib';
+
+const root = path.dirname(path.dirname(fileURLToPath(import.meta.url)));
+const staticDir = path.join(root, 'static');
+const EXTENSIONS = new Set(['.js', '.css', '.html', '.json', '.map', '.svg', '.ico', '.txt']);
+const SKIP_DIRS = new Set(['images']); // the default upload folder
+
+const ENCODERS = {
+  '.br': (data) => brotliCompressSync(data, {
+    params: {
+      [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+      [constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+    },
+  }),
+  '.gz': (data) => gzipSync(data, { level: 9 }),
+};
+
+function* files(dir) {
+  for (const entry of readdirSync(dir, { withFileTypes: true })) {
+    const full = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      if (!SKIP_DIRS.has(entry.name) || dir !== staticDir) yield* files(full);
+    } else if (EXTENSIONS.has(path.extname(entry.name))) {
+      yield full;
+    }
+  }
+}
+
+let original = 0;
+const written = { '.br': 0, '.gz': 0 };
+for (const file of files(staticDir)) {
+  const data = readFileSync(file);
+  original += data.length;
+  for (const [suffix, encode] of Object.entries(ENCODERS)) {
+    const target = file + suffix;
+    const compressed = encode(data);
+    if (compressed.length <= data.length * 0.9) {
+      writeFileSync(target, compressed);
+      written[suffix] += compressed.length;
+    } else {
+      rmSync(target, { force: true });
+      written[suffix] += data.length;
+    }
+  }
+}
+
+const kb = (n) => `${(n / 1024).toFixed(1)} KB`;
+console.log(`static assets: ${kb(original)}, brotli ${kb(written['.br'])}, gzip ${kb(written['.gz'])}`);
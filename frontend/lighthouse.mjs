@@ -0,0 +1,68 @@
+// Lighthouse timings for a page, median of several runs with mobile throttling,
+// to compare the CDN/in-browser-Babel pages with the built bundles.
+// Usage: npm run lighthouse -- <url> [--runs 5] [--cookie 'session=...'] [--out report.json]
+// Needs Chrome and `npm install --no-save lighthouse chrome-launcher` (kept out of
+// package.json so the image build doesn't download them).
+// The tool list needs a signed-in session: copy the session cookie from the browser.
+// For the "before" numbers, move static/dist/manifest.json aside (the pages then
+// fall back to the CDN scripts on the next request).
+
+import lighthouse from 'lighthouse';
+import * as chromeLauncher from 'chrome-launcher';
+import { writeFileSync } from 'node:fs';
+import { parseArgs } from 'node:util';
+
+const { values, positionals } = parseArgs({
+  allowPositionals: true,
+  options: {
+    runs: { type: 'string', default: '5' },
+    cookie: { type: 'string' },
+    out: { type: 'string' },
+  },
+});
+const url = positionals[0];
+if (!url) {
+  console.error('usage: npm run lighthouse -- <url> [--runs 5] [--cookie session=...] [--out report.json]');
+  process.exit(2);
+}
+
+const METRICS = {
+  'first-contentful-paint': 'FCP ms',
+  'largest-contentful-paint': 'LCP ms',
+  'total-blocking-time': 'TBT ms',
+  'interactive': 'TTI ms',
+  'bootup-time': 'JS boot ms',
+  'total-byte-weight': 'bytes',
+};
+
+const median = (xs) => {
+  const sorted = [...xs].sort((a, b) => a - b);
+  const mid = Math.floor(sorted.length / 2);
+  return sorted.length % 2 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
+};
+
+const chrome = await chromeLauncher.launch({ chromeFlags: ['--headless=new'] });
+const runs = [];
+try {
+  for (let i = 0; i < Number(values.runs); i++) {
+    const result = await lighthouse(url, {
+      port: chrome.port,
+      onlyCategories: ['performance'],
+      formFactor: 'mobile',
+      throttlingMethod: 'simulate',
+      extraHeaders: values.cookie ? { Cookie: values.cookie } : undefined,
+    });
+    const audits = result.lhr.audits;
+    runs.push(Object.fromEntries(Object.keys(METRICS).map((id) => [id, audits[id].numericValue])));
+  }
+} finally {
+  await chrome.kill();
+}
+
+const summary = Object.fromEntries(
+  Object.entries(METRICS).map(([id, label]) => [label, Math.round(median(runs.map((r) => r[id])))]),
+);
+console.table(summary);
+if (values.out) {
+  writeFileSync(values.out, JSON.stringify({ url, runs, median: summary }, null, 2) + '\n');
+}
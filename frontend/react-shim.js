@@ -0,0 +1,7 @@
+// static/js/app.js is written against the React UMD globals. esbuild injects
+// this module so that `React` and `ReactDOM` there resolve to the bundled
+// production builds instead.
+import * as React from 'react';
+import * as ReactDOM from 'react-dom/client';
+
+export { React, ReactDOM };
@@ -0,0 +1,101 @@
+"""
+Compression and conditional requests for the JSON API.
+
+JSON responses of at least JSON_COMPRESS_MIN_BYTES are gzip- (or, with the
+optional brotli package, Brotli-) compressed for clients that accept it.
+Views decorated with @conditional answer with a weak ETag derived from the
+user's data version (see data_version.py) and the request URL, so a
+client revalidating unchanged data gets a 304 after a single primary-key
+lookup, without the view or its queries running.
+"""
+
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import current_app, make_response, request
+from flask_login import current_user
+
+import data_version
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE = ('application/json',)
+
+# Part of every ETag: bump when a response format changes, so clients don't
+# keep a body of the old shape that a version stamp would still validate
+ETAG_FORMAT = 1
+
+
+def etag_for(key):
+    """Weak ETag value for a data_version key"""
+    return hashlib.sha1(f"{ETAG_FORMAT}:{key}".encode('utf-8')).hexdigest()[:20]
+
+
+def _validated(response, tag):
+    response.set_etag(tag, weak=True)
+    # Always revalidate: the version check is cheap and the data is per user
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional(view):
+    """Serve GET/HEAD with a data-version ETag, and 304 when the client's copy is current"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not current_user.is_authenticated:
+            return view(*args, **kwargs)
+        # Read before the view runs: a write landing in between makes the
+        # body newer than its tag, which only costs the client a refetch
+        tag = etag_for(data_version.current_key(request.full_path))
+        if request.if_none_match.contains_weak(tag):
+            return _validated(current_app.response_class(status=304), tag)
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            _validated(response, tag)
+        return response
+
+    return wrapper
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """after_request hook compressing JSON bodies above the size threshold"""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.mimetype not in COMPRESSIBLE
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config.get('JSON_COMPRESS_MIN_BYTES', 1024):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding == 'br':
+        data = brotli.compress(data, quality=current_app.config.get('JSON_BROTLI_QUALITY', 5))
+    elif encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=current_app.config.get('JSON_GZIP_LEVEL', 6), mtime=0)
+    else:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
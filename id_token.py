@@ -0,0 +1,131 @@
+"""
+Local verification of OpenID Connect ID tokens.
+
+An ID token is a JWS-signed JWT. RS256/RS384/RS512 signatures are checked
+against the provider's JWKS (PKCS#1 v1.5, with plain integer arithmetic, so
+no crypto library is needed) and HS256/HS384/HS512 against the client
+secret. Any other algorithm, including 'none', is rejected; the caller then
+falls back to the userinfo endpoint.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+LEEWAY = 60  # seconds of clock skew tolerated on exp, iat and nbf
+
+_HASHES = {'256': hashlib.sha256, '384': hashlib.sha384, '512': hashlib.sha512}
+
+# DER prefix of the DigestInfo structure PKCS#1 v1.5 wraps around each digest
+_DIGEST_INFO = {
+    'sha256': bytes.fromhex('3031300d060960864801650304020105000420'),
+    'sha384': bytes.fromhex('3041300d060960864801650304020205000430'),
+    'sha512': bytes.fromhex('3051300d060960864801650304020305000440'),
+}
+
+
+class IDTokenError(ValueError):
+    """The token is malformed, badly signed, or not meant for us"""
+
+
+class UnknownKeyError(IDTokenError):
+    """No key in the JWKS matches the token's kid: the provider may have rotated keys"""
+
+
+def b64url_decode(data):
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def _b64url_int(data):
+    if not isinstance(data, str):
+        raise IDTokenError(f"malformed JWKS key: {data!r} is not a base64url string")
+    try:
+        return int.from_bytes(b64url_decode(data), 'big')
+    except ValueError as e:
+        raise IDTokenError(f"malformed JWKS key: {e}") from None
+
+
+def _rsa_key(jwks, kid):
+    candidates = [
+        key for key in (jwks or {}).get('keys', []) if isinstance(key, dict)
+        and key.get('kty') == 'RSA' and key.get('use', 'sig') == 'sig' and key.get('n') and key.get('e')
+    ]
+    if kid is not None:
+        candidates = [key for key in candidates if key.get('kid') == kid]
+    if not candidates:
+        raise UnknownKeyError(f"no RSA signing key with kid {kid!r} in the JWKS")
+    if len(candidates) > 1:
+        raise IDTokenError("token has no kid and the JWKS holds several RSA keys")
+    return _b64url_int(candidates[0]['n']), _b64url_int(candidates[0]['e'])
+
+
+def verify_rsa(signing_input, signature, n, e, hash_name):
+    """RSASSA-PKCS1-v1_5 verification; True if ``signature`` is valid for ``signing_input``"""
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        return False
+    s = int.from_bytes(signature, 'big')
+    if s >= n:
+        return False
+    encoded = pow(s, e, n).to_bytes(size, 'big')
+    digest = _DIGEST_INFO[hash_name] + hashlib.new(hash_name, signing_input).digest()
+    expected = b'\x00\x01' + b'\xff' * (size - len(digest) - 3) + b'\x00' + digest
+    return hmac.compare_digest(encoded, expected)
+
+
+def verify_id_token(token, jwks, issuer, audience, nonce=None, client_secret=None, now=None, leeway=LEEWAY):
+    """Check ``token``'s signature and its iss, aud, azp, exp, iat, nbf and nonce claims.
+
+    Returns the claims. Raises UnknownKeyError when the JWKS has no matching
+    key and IDTokenError for every other failure.
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split('.')
+        header = json.loads(b64url_decode(header_b64))
+        claims = json.loads(b64url_decode(payload_b64))
+        signature = b64url_decode(signature_b64)
+    except (AttributeError, ValueError) as e:
+        raise IDTokenError(f"malformed token: {e}") from None
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise IDTokenError("malformed token")
+
+    alg = header.get('alg', '')
+    if not isinstance(alg, str):
+        raise IDTokenError(f"unsupported signing algorithm {alg!r}")
+    family, bits = alg[:2], alg[2:]
+    signing_input = f"{header_b64}.{payload_b64}".encode('ascii')
+    if family == 'RS' and bits in _HASHES:
+        n, e = _rsa_key(jwks, header.get('kid'))
+        valid = verify_rsa(signing_input, signature, n, e, f'sha{bits}')
+    elif family == 'HS' and bits in _HASHES:
+        if not client_secret:
+            raise IDTokenError(f"{alg} token but no client secret configured")
+        expected = hmac.new(client_secret.encode(), signing_input, _HASHES[bits]).digest()
+        valid = hmac.compare_digest(signature, expected)
+    else:
+        raise IDTokenError(f"unsupported signing algorithm {alg!r}")
+    if not valid:
+        raise IDTokenError("bad signature")
+
+    now = time.time() if now is None else now
+    if claims.get('iss') != issuer:
+        raise IDTokenError(f"issuer {claims.get('iss')!r} is not {issuer!r}")
+    aud = claims.get('aud')
+    audiences = aud if isinstance(aud, list) else [aud]
+    if audience not in audiences:
+        raise IDTokenError(f"audience {aud!r} does not include {audience!r}")
+    if len(audiences) > 1 and claims.get('azp') != audience:
+        raise IDTokenError("token issued to another party (azp)")
+    if not isinstance(claims.get('exp'), (int, float)) or claims['exp'] + leeway < now:
+        raise IDTokenError("token expired")
+    if isinstance(claims.get('iat'), (int, float)) and claims['iat'] - leeway > now:
+        raise IDTokenError("token issued in the future")
+    if isinstance(claims.get('nbf'), (int, float)) and claims['nbf'] - leeway > now:
+        raise IDTokenError("token not valid yet")
+    if nonce is not None and not hmac.compare_digest(str(claims.get('nonce', '')), nonce):
+        raise IDTokenError("nonce mismatch")
+    return claims
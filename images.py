@@ -0,0 +1,835 @@
+import argparse
+import glob
+import hashlib
+import io
+import mimetypes
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from flask import current_app, send_from_directory
+import db
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Pillow format names and MIME types of the optional encodings in IMAGE_VARIANT_FORMATS
+# (preferred first when the client accepts several)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+# Uploads are stored as <stem>_orig<ext> until processed; no image file is
+# ever rewritten under the same name
+ORIGINAL_SUFFIX = '_orig'
+
+# Processed images are content-addressed: <h[:2]>/<h[2:4]>/<h><ext> under
+# UPLOAD_FOLDER where h is the SHA-256 of the main image, with the variants
+# alongside as <h>_<width>w.<format>. Identical uploads share one set of files.
+_CONTENT_PATH = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+# Main images that variants can be (re)generated from on demand
+GENERATABLE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Stems of generated files (sized variants, legacy thumbnails) and unprocessed
+# uploads, which are never sources for on-demand variants
+_DERIVED_STEM = re.compile(r'_(\d+w|thumb|orig)$')
+
+# tools.image_path values are relative to /data, i.e. images/<path in UPLOAD_FOLDER>
+IMAGE_PATH_PREFIX = 'images/'
+
+# tools.image_status values; NULL means no processing is outstanding
+STATUS_PENDING = 'pending'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+# Persistent queue of uploads waiting for resize/thumbnail work. It lives in
+# the main database so jobs survive restarts and are shared by all workers.
+JOB_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS image_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tool_id INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        available_at REAL NOT NULL,
+        claimed_at REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_image_jobs_status ON image_jobs(status, available_at)",
+    """
+    CREATE TRIGGER IF NOT EXISTS image_jobs_tool_delete AFTER DELETE ON tools BEGIN
+        DELETE FROM image_jobs WHERE tool_id = old.id;
+    END
+    """,
+]
+
+# Number of tools pointing at each image_path, kept by triggers so files are
+# only deleted once nothing references them
+REF_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS image_refs (
+        image_path TEXT PRIMARY KEY,
+        refcount INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS image_refs_tool_insert AFTER INSERT ON tools
+    WHEN new.image_path IS NOT NULL BEGIN
+        INSERT INTO image_refs (image_path, refcount) VALUES (new.image_path, 1)
+        ON CONFLICT(image_path) DO UPDATE SET refcount = refcount + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS image_refs_tool_update AFTER UPDATE OF image_path ON tools
+    WHEN old.image_path IS NOT new.image_path BEGIN
+        UPDATE image_refs SET refcount = refcount - 1 WHERE image_path = old.image_path;
+        DELETE FROM image_refs WHERE image_path = old.image_path AND refcount <= 0;
+        INSERT INTO image_refs (image_path, refcount) SELECT new.image_path, 1 WHERE new.image_path IS NOT NULL
+        ON CONFLICT(image_path) DO UPDATE SET refcount = refcount + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS image_refs_tool_delete AFTER DELETE ON tools
+    WHEN old.image_path IS NOT NULL BEGIN
+        UPDATE image_refs SET refcount = refcount - 1 WHERE image_path = old.image_path;
+        DELETE FROM image_refs WHERE image_path = old.image_path AND refcount <= 0;
+    END
+    """,
+]
+
+# Claim the oldest runnable job, including ones left 'running' by a worker
+# that died mid-job
+_RUNNABLE_SQL = """
+    SELECT id FROM image_jobs
+    WHERE (status = 'pending' AND available_at <= :now)
+       OR (status = 'running' AND claimed_at < :stale)
+    ORDER BY id
+    LIMIT 1
+"""
+
+_CLAIM_SQL = f"""
+    UPDATE image_jobs SET status = 'running', claimed_at = :now, attempts = attempts + 1
+    WHERE id = ({_RUNNABLE_SQL})
+    RETURNING id, tool_id, filename, attempts
+"""
+
+# Claim one given job, if it is still waiting to run
+_CLAIM_ONE_SQL = """
+    UPDATE image_jobs SET status = 'running', claimed_at = :now, attempts = attempts + 1
+    WHERE id = :id AND status = 'pending' AND available_at <= :now
+    RETURNING id, tool_id, filename, attempts
+"""
+
+
+# Variant files (everything derived from a main image) with their size and
+# when they were last served, for the IMAGE_VARIANT_CACHE_BYTES budget
+CACHE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS image_cache (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_image_cache_last_used ON image_cache(last_used)",
+]
+
+# Per-process throttles so serving an image rarely writes to the database
+_touched = {}
+_last_budget_check = [0.0]
+
+# Striped locks so only one thread or process renders a given image's variants
+_LOCK_STRIPES = 256
+_thread_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+
+def ensure_image_tables(conn):
+    """Create the job queue, refcount and variant cache tables, counting existing references on first run"""
+    refs_exist = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'image_refs'"
+    ).fetchone()
+    for sql in JOB_SCHEMA + REF_SCHEMA + CACHE_SCHEMA:
+        conn.execute(sql)
+    if not refs_exist:
+        rebuild_image_refs(conn)
+
+
+def rebuild_image_refs(conn):
+    conn.execute("DELETE FROM image_refs")
+    conn.execute(
+        "INSERT INTO image_refs (image_path, refcount) "
+        "SELECT image_path, COUNT(*) FROM tools WHERE image_path IS NOT NULL GROUP BY image_path"
+    )
+
+
+def image_relpath(image_path):
+    """Path inside UPLOAD_FOLDER for a tools.image_path value"""
+    if image_path.startswith(IMAGE_PATH_PREFIX):
+        return image_path[len(IMAGE_PATH_PREFIX):]
+    return os.path.basename(image_path)
+
+
+def content_relpath(data, extension):
+    """Sharded, content-addressed location for a processed image"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def is_content_path(relpath):
+    return bool(_CONTENT_PATH.match(relpath))
+
+
+def check_image(image_file):
+    """True if Pillow can identify the upload (reads the header only)"""
+    from PIL import Image  # Pillow is imported on first use to keep worker boot fast
+
+    try:
+        with Image.open(image_file):
+            pass
+        return True
+    except OSError:  # includes UnidentifiedImageError
+        return False
+    finally:
+        image_file.seek(0)
+
+
+def write_atomic(path, data):
+    """Write ``data`` to ``path`` so readers see either the old file or the new one"""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def is_original(filename):
+    return os.path.splitext(filename)[0].endswith(ORIGINAL_SUFFIX)
+
+
+def original_filename(filename):
+    """Name under which an upload is kept until its job has run"""
+    stem, extension = os.path.splitext(filename)
+    return stem + ORIGINAL_SUFFIX + extension
+
+
+def save_original(image_file, path):
+    """Store the upload unmodified; it is served until its job has run"""
+    image_file.seek(0)
+    write_atomic(path, image_file.read())
+
+
+def delete_image(upload_folder, relpath):
+    """Remove an image together with its variants and any unprocessed original"""
+    stem = os.path.splitext(relpath)[0]
+    if stem.endswith(ORIGINAL_SUFFIX):
+        stem = stem[:-len(ORIGINAL_SUFFIX)]
+    base = glob.escape(os.path.join(upload_folder, stem))
+    for pattern in (f"{base}.*", f"{base}{ORIGINAL_SUFFIX}.*", f"{base}_thumb.*", f"{base}_*w.*"):
+        for path in glob.glob(pattern):
+            if path.endswith('.tmp'):
+                continue
+            os.remove(path)
+            current_app.logger.debug(f"Deleted image file: {path}")
+
+
+def variant_widths(config):
+    """Sizes in the variant registry, ascending; the largest is the main image"""
+    largest = config['MAX_IMAGE_DIMENSION']
+    widths = set(config.get('IMAGE_VARIANT_WIDTHS', ())) | {largest, config.get('THUMBNAIL_DIMENSION', 200)}
+    return sorted(w for w in widths if w <= largest)
+
+
+def variant_suffix(width, config):
+    return '' if width == config['MAX_IMAGE_DIMENSION'] else f'_{width}w'
+
+
+def release_image(conn, upload_folder, image_path):
+    """Delete an image's files if no tool references image_path any more (call after commit)"""
+    referenced = conn.execute("SELECT 1 FROM image_refs WHERE image_path = ?", (image_path,)).fetchone()
+    if not referenced:
+        relpath = image_relpath(image_path)
+        delete_image(upload_folder, relpath)
+        stem = os.path.splitext(relpath)[0]
+        conn.execute("DELETE FROM image_cache WHERE substr(path, 1, ?) = ?", (len(stem), stem))
+        conn.commit()
+
+
+def derivative_sizes(config):
+    """(suffix, max dimension) of every file built from an upload; '' is the main image"""
+    return [(variant_suffix(w, config), w) for w in variant_widths(config)]
+
+
+@lru_cache(maxsize=None)
+def encoder_available(name):
+    """True if this Pillow build can write the format (AVIF needs libavif)"""
+    from PIL import Image
+
+    try:
+        Image.new('RGB', (1, 1)).save(io.BytesIO(), format=FORMATS[name][0])
+        return True
+    except (KeyError, OSError, ValueError):
+        return False
+
+
+def variant_formats(config):
+    """{extension name: quality} of the extra encodings this build can produce"""
+    return {name: quality for name, quality in config.get('IMAGE_VARIANT_FORMATS', {}).items()
+            if encoder_available(name)}
+
+
+def _fit(size, max_dimension):
+    """Scale ``size`` down to fit a max_dimension square, keeping the aspect ratio"""
+    width, height = size
+    if width <= max_dimension and height <= max_dimension:
+        return size
+    if width > height:
+        return max_dimension, max(1, int(height * (max_dimension / width)))
+    return max(1, int(width * (max_dimension / height))), max_dimension
+
+
+def render_derivatives(source, sizes, quality, formats=None, extension=None):
+    """
+    Decode an image once and encode every derivative in ``sizes`` from it.
+
+    JPEGs are decoded at reduced scale with draft(), so a 12MP photo is never
+    fully decoded just to produce a 1024px image. Each smaller size is resized
+    from the previous in-memory image instead of re-reading an encoded file,
+    and is also encoded in each of ``formats`` ({'webp': quality, ...}).
+    ``extension`` forces the main format ('.jpg' or '.png'), e.g. to match an
+    existing main image; by default it follows the image mode.
+    Returns the main file extension and a {suffix + extension: bytes} dict.
+    """
+    from PIL import Image
+
+    sizes = sorted(sizes, key=lambda s: s[1], reverse=True)
+    with Image.open(source) as img:
+        is_jpeg = img.format == 'JPEG'
+        if is_jpeg:
+            # libjpeg scales by 1/2, 1/4 or 1/8 while decoding, never below the target
+            img.draft('RGB', _fit(img.size, sizes[0][1]))
+
+        # Convert to RGB if necessary (for JPEG compatibility)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+        if extension is not None:
+            use_jpeg = extension.lower() in ('.jpg', '.jpeg')
+        else:
+            use_jpeg = is_jpeg or img.mode == 'RGB'
+        if use_jpeg:
+            fmt, extension, options = 'JPEG', extension or '.jpg', {'quality': quality, 'optimize': True}
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+        else:
+            # Save as PNG for other modes (e.g. 16-bit greyscale)
+            fmt, extension, options = 'PNG', extension or '.png', {'optimize': True}
+
+        outputs = {}
+        for suffix, max_dimension in sizes:
+            target = _fit(img.size, max_dimension)
+            if target != img.size:
+                img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            output = io.BytesIO()
+            img.save(output, format=fmt, **options)
+            outputs[suffix + extension] = output.getvalue()
+            for name, format_quality in (formats or {}).items():
+                output = io.BytesIO()
+                img.save(output, format=FORMATS[name][0], quality=format_quality)
+                outputs[f'{suffix}.{name}'] = output.getvalue()
+    return extension, outputs
+
+
+@contextmanager
+def single_flight(upload_folder, key):
+    """Hold an exclusive lock for ``key`` across threads and worker processes"""
+    stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:4], 16) % _LOCK_STRIPES
+    with _thread_locks[stripe]:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(upload_folder, '.locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f'{stripe:02x}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def variant_names(extension, sizes, formats):
+    """File name suffixes of every variant of a main image with ``extension``"""
+    names = []
+    for suffix, _ in sizes:
+        names += [suffix + extension] + [f'{suffix}.{name}' for name in formats]
+    return [name for name in names if name != extension]
+
+
+def build_variants(upload_folder, relpath, sizes, quality, formats):
+    """Render whichever variants of a main image are missing, under the single-flight lock.
+
+    Returns (relpath, size) of every variant file now on disk.
+    """
+    stem, extension = os.path.splitext(relpath)
+    names = variant_names(extension, sizes, formats)
+    with single_flight(upload_folder, stem):
+        missing = [name for name in names if not os.path.exists(os.path.join(upload_folder, stem + name))]
+        if missing:
+            _, outputs = render_derivatives(
+                os.path.join(upload_folder, relpath), sizes, quality, formats, extension
+            )
+            for name in missing:
+                write_atomic(os.path.join(upload_folder, stem + name), outputs[name])
+    files = []
+    for name in names:
+        path = os.path.join(upload_folder, stem + name)
+        if os.path.exists(path):
+            files.append((stem + name, os.path.getsize(path)))
+    return files
+
+
+def record_variants(conn, files):
+    """Add variant files to the cache index as just used"""
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO image_cache (path, size, last_used) VALUES (?, ?, ?) "
+        "ON CONFLICT(path) DO UPDATE SET size = excluded.size, last_used = excluded.last_used",
+        [(path, size, now) for path, size in files],
+    )
+
+
+def enforce_cache_budget(conn, upload_folder, budget):
+    """Delete least recently used variants until they fit in ``budget`` bytes (0 = unlimited).
+
+    Evicts down to 90% of the budget so that it isn't hit again at once.
+    Main images are never in the cache index, so only regenerable files go.
+    Returns the number of files removed.
+    """
+    if not budget:
+        return 0
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM image_cache").fetchone()[0]
+    if total <= budget:
+        return 0
+    target = budget * 0.9
+    evicted = []
+    for path, size in conn.execute("SELECT path, size FROM image_cache ORDER BY last_used"):
+        if total <= target:
+            break
+        try:
+            os.remove(os.path.join(upload_folder, path))
+        except FileNotFoundError:
+            pass
+        evicted.append((path,))
+        total -= size
+    conn.executemany("DELETE FROM image_cache WHERE path = ?", evicted)
+    conn.commit()
+    return len(evicted)
+
+
+def _check_budget(app):
+    """Run enforce_cache_budget at most once per IMAGE_VARIANT_CACHE_CHECK_INTERVAL per process"""
+    budget = app.config.get('IMAGE_VARIANT_CACHE_BYTES', 0)
+    now = time.monotonic()
+    if not budget or now - _last_budget_check[0] < app.config.get('IMAGE_VARIANT_CACHE_CHECK_INTERVAL', 60):
+        return
+    _last_budget_check[0] = now
+    with db.pooled_connection(app) as conn:
+        evicted = enforce_cache_budget(conn, app.config['UPLOAD_FOLDER'], budget)
+    if evicted:
+        app.logger.info(f"Evicted {evicted} image variant(s) to stay within the cache budget")
+
+
+def can_generate(relpath):
+    """Whether ``relpath`` names a main image; variants of variants would grow the folder without bound"""
+    stem, extension = os.path.splitext(relpath)
+    return extension.lower() in GENERATABLE_EXTENSIONS and not _DERIVED_STEM.search(stem)
+
+
+def ensure_variants(app, relpath):
+    """Generate missing variants of a stored main image on demand (e.g. legacy or evicted ones)"""
+    files = build_variants(
+        app.config['UPLOAD_FOLDER'], relpath, derivative_sizes(app.config),
+        app.config['JPEG_QUALITY'], variant_formats(app.config),
+    )
+    with db.pooled_connection(app) as conn:
+        record_variants(conn, files)
+        conn.commit()
+    _check_budget(app)
+
+
+def touch_variant(app, relpath):
+    """Mark a served variant as recently used, writing at most once per interval per process"""
+    now = time.time()
+    interval = app.config.get('IMAGE_VARIANT_CACHE_TOUCH_INTERVAL', 3600)
+    if now - _touched.get(relpath, 0) < interval:
+        return
+    if len(_touched) > 10000:
+        _touched.clear()
+    _touched[relpath] = now
+    with db.pooled_connection(app) as conn:
+        conn.execute("UPDATE image_cache SET last_used = ? WHERE path = ?", (now, relpath))
+        conn.commit()
+
+
+def pick_width(requested, config):
+    """Smallest registry width covering ``requested`` pixels, else the largest"""
+    widths = variant_widths(config)
+    return next((w for w in widths if w >= requested), widths[-1])
+
+
+def variant_candidates(filename, width, accepted, config):
+    """Files that could answer a request for ``filename`` at ``width``, best first.
+
+    ``accepted`` holds the FORMATS names the client explicitly accepts. The
+    original ``filename`` always comes last, so images uploaded before
+    variants existed (or still queued) keep being served.
+    """
+    stem, extension = os.path.splitext(filename)
+    if is_original(filename):
+        # Not processed yet: the upload is all there is
+        return [filename]
+    suffix = variant_suffix(pick_width(width, config), config)
+    generated = variant_formats(config)
+    names = [f'{stem}{suffix}.{name}' for name in FORMATS if name in accepted and name in generated]
+    names.append(stem + suffix + extension)
+    if width <= config.get('THUMBNAIL_DIMENSION', 200):
+        # Thumbnails written before the variant registry
+        names.append(f'{stem}_thumb{extension}')
+    names.append(filename)
+    return list(dict.fromkeys(names))
+
+
+def etag(filename):
+    """Strong ETag for an image file; valid because no file is ever rewritten under its name"""
+    return hashlib.sha1(filename.encode('utf-8')).hexdigest()[:20]
+
+
+def _cache_headers(response, filename, final):
+    response.set_etag(etag(filename))
+    if final:
+        # The URL can never map to different bytes again
+        max_age = current_app.config.get('IMAGE_CACHE_MAX_AGE', 31536000)
+        response.headers['Cache-Control'] = f'private, max-age={max_age}, immutable'
+    else:
+        # A better variant may appear once processing finishes; revalidate each time
+        response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept')
+    return response
+
+
+def not_modified(filename, final):
+    return _cache_headers(current_app.response_class(status=304), filename, final)
+
+
+def send_image(folder, filename, final):
+    """Response for an image file, or an X-Accel-Redirect for nginx to serve it"""
+    if current_app.config.get('IMAGE_SENDFILE') == 'x-accel':
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        prefix = current_app.config.get('IMAGE_X_ACCEL_PREFIX', '/protected-images/')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + filename
+    else:
+        response = send_from_directory(folder, filename, etag=etag(filename))
+    return _cache_headers(response, filename, final)
+
+
+def srcset(image_path, config):
+    """srcset value listing every registry width of an image, for <img srcset>"""
+    return ', '.join(f'/data/{image_path}?w={w} {w}w' for w in variant_widths(config))
+
+
+def enqueue(conn, tool_id, filename):
+    """Queue processing of a stored original in the caller's transaction; returns the job id"""
+    conn.execute("UPDATE tools SET image_status = ? WHERE id = ?", (STATUS_PENDING, tool_id))
+    return conn.execute(
+        "INSERT INTO image_jobs (tool_id, filename, available_at) VALUES (?, ?, ?)",
+        (tool_id, filename, time.time()),
+    ).lastrowid
+
+
+def claim_job(conn, stale_after, job_id=None):
+    """Claim the oldest runnable job, or only ``job_id`` when given; None if there is none"""
+    now = time.time()
+    if job_id is not None:
+        job = conn.execute(_CLAIM_ONE_SQL, {'now': now, 'id': job_id}).fetchone()
+        conn.commit()
+        return job
+    params = {'now': now, 'stale': now - stale_after}
+    # Idle workers poll every few seconds: look with a plain read first so an
+    # empty queue never takes the write lock from requests
+    if conn.execute(_RUNNABLE_SQL, params).fetchone() is None:
+        return None
+    job = conn.execute(_CLAIM_SQL, params).fetchone()
+    conn.commit()
+    return job
+
+
+def process_job(app, job):
+    """Build the optimized image and thumbnail for a claimed job"""
+    folder = app.config['UPLOAD_FOLDER']
+    filename = job['filename']
+    image_path = IMAGE_PATH_PREFIX + filename
+
+    with db.pooled_connection(app) as conn:
+        tool = conn.execute("SELECT image_path FROM tools WHERE id = ?", (job['tool_id'],)).fetchone()
+    if tool is None or tool['image_path'] != image_path:
+        # The tool was deleted or given another image while the job waited
+        _finish_job(app, job)
+        return
+
+    extension, outputs = render_derivatives(
+        os.path.join(folder, filename), derivative_sizes(app.config),
+        app.config['JPEG_QUALITY'], variant_formats(app.config),
+    )
+    relpath = content_relpath(outputs[extension], extension)
+    _write_outputs(folder, relpath, extension, outputs)
+
+    with db.pooled_connection(app) as conn:
+        updated = conn.execute(
+            "UPDATE tools SET image_path = ?, image_status = ? WHERE id = ? AND image_path = ?",
+            (IMAGE_PATH_PREFIX + relpath, STATUS_READY, job['tool_id'], image_path),
+        ).rowcount
+        conn.execute("DELETE FROM image_jobs WHERE id = ?", (job['id'],))
+        stem = os.path.splitext(relpath)[0]
+        record_variants(conn, [(stem + name, len(data)) for name, data in outputs.items() if name != extension])
+        conn.commit()
+
+        if updated:
+            # Another tool may have released the same content between our
+            # write and the commit; put back anything it removed
+            _write_outputs(folder, relpath, extension, outputs)
+            release_image(conn, folder, image_path)
+        else:
+            release_image(conn, folder, IMAGE_PATH_PREFIX + relpath)
+    _check_budget(app)
+
+
+def _write_outputs(folder, relpath, extension, outputs):
+    """Write the files for a content path that don't exist yet, main image last"""
+    stem = os.path.join(folder, os.path.splitext(relpath)[0])
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+    for name in sorted(outputs, key=lambda name: name == extension):
+        path = stem + name
+        if not os.path.exists(path):
+            write_atomic(path, outputs[name])
+
+
+def _finish_job(app, job):
+    with db.pooled_connection(app) as conn:
+        conn.execute("DELETE FROM image_jobs WHERE id = ?", (job['id'],))
+        conn.commit()
+
+
+def _fail_job(app, job, error):
+    max_attempts = app.config.get('IMAGE_JOB_MAX_ATTEMPTS', 3)
+    with db.pooled_connection(app) as conn:
+        if job['attempts'] >= max_attempts:
+            conn.execute(
+                "UPDATE image_jobs SET status = ?, last_error = ? WHERE id = ?",
+                (STATUS_FAILED, str(error), job['id']),
+            )
+            conn.execute(
+                "UPDATE tools SET image_status = ? WHERE id = ? AND image_path = ?",
+                (STATUS_FAILED, job['tool_id'], IMAGE_PATH_PREFIX + job['filename']),
+            )
+            app.logger.error(f"Image job {job['id']} failed permanently: {error}")
+        else:
+            delay = app.config.get('IMAGE_JOB_RETRY_DELAY', 5) * 2 ** (job['attempts'] - 1)
+            conn.execute(
+                "UPDATE image_jobs SET status = 'pending', last_error = ?, available_at = ? WHERE id = ?",
+                (str(error), time.time() + delay * (1 + random.random() * 0.2), job['id']),
+            )
+            app.logger.warning(f"Image job {job['id']} failed (attempt {job['attempts']}), retrying: {error}")
+        conn.commit()
+
+
+def run_next_job(app, job_id=None):
+    """Claim and run one job (``job_id`` only, when given); returns False when there was nothing to run"""
+    with db.pooled_connection(app) as conn:
+        job = claim_job(conn, app.config.get('IMAGE_JOB_TIMEOUT', 300), job_id)
+    if job is None:
+        return False
+    try:
+        process_job(app, job)
+    except Exception as e:
+        _fail_job(app, job, e)
+    return True
+
+
+def run_pending(app):
+    """Run queued jobs in the calling thread until none are runnable"""
+    count = 0
+    with app.app_context():
+        while run_next_job(app):
+            count += 1
+    return count
+
+
+class ImageWorkerPool:
+    """Background threads draining image_jobs for one worker process.
+
+    ``size`` bounds how many images this process processes at once. Threads
+    are started lazily from the first request so that none are created in
+    the gunicorn master before it forks (--preload); like the connection
+    pool, a forked child starts its own.
+    """
+
+    def __init__(self, app, size=1, poll_interval=2.0):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"image-worker-{i}", daemon=True)
+                for i in range(self.size)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def wake(self):
+        self.ensure_started()
+        self._wake.set()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    if run_next_job(self.app):
+                        continue
+            except Exception as e:
+                self.app.logger.error(f"Image worker error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+def init_app(app):
+    """Set up the image worker pool; IMAGE_WORKERS = 0 processes uploads inline"""
+    if app.config.get('IMAGE_SENDFILE') == 'x-sendfile':
+        # Let Apache/lighttpd (mod_xsendfile) stream image files
+        app.config['USE_X_SENDFILE'] = True
+    app.add_template_global(lambda image_path: srcset(image_path, app.config), 'image_srcset')
+    app.add_template_global(variant_widths(app.config), 'image_widths')
+    size = app.config.get('IMAGE_WORKERS', 1)
+    if size > 0:
+        pool = ImageWorkerPool(app, size, app.config.get('IMAGE_WORKER_POLL_INTERVAL', 2.0))
+        app.extensions['image_workers'] = pool
+        app.before_request(pool.ensure_started)
+    return app.extensions.get('image_workers')
+
+
+def submit(app, job_id):
+    """Hand a newly committed job to the workers, or run it now if there are none.
+
+    Run inline, only that job is processed: other users' queued jobs are
+    left for run_pending() rather than added to this request.
+    """
+    pool = app.extensions.get('image_workers')
+    if pool is not None:
+        pool.wake()
+    else:
+        run_next_job(app, job_id)
+
+
+def _backfill_one(upload_folder, sizes, quality, formats, relpath):
+    try:
+        return relpath, build_variants(upload_folder, relpath, sizes, quality, formats), None
+    except (OSError, ValueError) as e:
+        return relpath, [], str(e)
+
+
+def backfill(config, workers=None):
+    """Generate missing variants for every stored image, ``workers`` processes in parallel"""
+    folder = config['UPLOAD_FOLDER']
+    conn = sqlite3.connect(config['TOOLTRACKER_DB'])
+    ensure_image_tables(conn)
+    relpaths = [
+        image_relpath(image_path) for (image_path,) in
+        conn.execute("SELECT DISTINCT image_path FROM tools WHERE image_path IS NOT NULL")
+    ]
+    relpaths = [relpath for relpath in relpaths if can_generate(relpath)]
+    print(f"🔧 Building variants for {len(relpaths)} image(s) with {workers or os.cpu_count()} worker(s)")
+
+    build = partial(_backfill_one, folder, derivative_sizes(config), config['JPEG_QUALITY'], variant_formats(config))
+    done = failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for relpath, files, error in pool.map(build, relpaths, chunksize=4):
+            if error:
+                print(f"⚠️  {relpath}: {error}")
+                failed += 1
+                continue
+            record_variants(conn, files)
+            done += 1
+            if done % 100 == 0:
+                conn.commit()
+                print(f"  {done}/{len(relpaths)}")
+    conn.commit()
+    evicted = enforce_cache_budget(conn, folder, config.get('IMAGE_VARIANT_CACHE_BYTES', 0))
+    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"✅ {done} image(s) up to date, {failed} failed, {evicted} variant(s) evicted in {elapsed:.1f}s")
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the tool image store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    backfill_parser = sub.add_parser('backfill', help='generate missing variants for existing images')
+    backfill_parser.add_argument('--workers', type=int, default=None, help='processes to use (default: CPU count)')
+    sub.add_parser('evict', help='trim the variant cache to IMAGE_VARIANT_CACHE_BYTES')
+    args = parser.parse_args()
+
+    from config import config as configs
+    config_class = configs[os.environ.get('FLASK_ENV', 'default')]
+    config = {name: getattr(config_class, name) for name in dir(config_class) if name.isupper()}
+
+    if args.command == 'backfill':
+        return 0 if backfill(config, args.workers) else 1
+    conn = sqlite3.connect(config['TOOLTRACKER_DB'])
+    ensure_image_tables(conn)
+    evicted = enforce_cache_budget(conn, config['UPLOAD_FOLDER'], config.get('IMAGE_VARIANT_CACHE_BYTES', 0))
+    print(f"✅ {evicted} variant(s) evicted")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Lending and returning many tools at once.
+
+lend_tools() and return_tools() check a whole batch with one query and
+apply every item that passed with one more statement (per return date, for
+returns), all in a single IMMEDIATE transaction, so lending a kit of N tools
+costs the same handful of statements as lending one. The items reach SQLite
+as one JSON parameter read with json_each() rather than a placeholder per
+item, which keeps the SQL the same for every batch size and clear of the
+host parameter limit.
+
+Each item gets a result in request order: {'tool_id', 'ok': True,
+'loan_id'} when applied, or {'tool_id', 'ok': False, 'error'} with the
+message the single-tool routes would flash.
+"""
+
+import datetime
+import json
+
+# Largest batch accepted by the API
+MAX_BATCH_ITEMS = 500
+
+TOOL_NOT_FOUND = 'Tool not found or access denied'
+PERSON_NOT_FOUND = 'Person not found or access denied'
+ALREADY_LENT = 'Tool already lent out'
+NOT_LENT = 'No active loan found for this tool.'
+BAD_DATE = 'Invalid date format. Please use YYYY-MM-DD format.'
+DUPLICATE = 'Tool appears more than once in the batch'
+
+LEND_CHECK = """
+    SELECT r.key AS idx, t.id IS NOT NULL AS tool_ok, p.id IS NOT NULL AS person_ok,
+           EXISTS (SELECT 1 FROM loans l WHERE l.tool_id = t.id AND l.returned_on IS NULL) AS lent
+    FROM json_each(?) r
+    LEFT JOIN tools t ON t.id = json_extract(r.value, '$[0]') AND t.created_by = ?
+    LEFT JOIN people p ON p.id = json_extract(r.value, '$[1]') AND p.created_by = ?
+"""
+
+LEND_INSERT = """
+    INSERT INTO loans (tool_id, person_id, lent_on, lent_by)
+    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'), ?
+    FROM json_each(?)
+    ORDER BY key
+"""
+
+# Nothing else can write inside the IMMEDIATE transaction, so the active
+# loans of the tools just lent are exactly the ones LEND_INSERT created
+ACTIVE_LOANS = """
+    SELECT id, tool_id FROM loans
+    WHERE tool_id IN (SELECT value FROM json_each(?)) AND returned_on IS NULL
+"""
+
+RETURN_CHECK = """
+    SELECT r.key AS idx, t.id IS NOT NULL AS tool_ok,
+           (SELECT l.id FROM loans l WHERE l.tool_id = t.id AND l.returned_on IS NULL LIMIT 1) AS loan_id
+    FROM json_each(?) r
+    LEFT JOIN tools t ON t.id = json_extract(r.value, '$[0]') AND t.created_by = ?
+"""
+
+# Run once per distinct return date, usually just the one
+RETURN_UPDATE = """
+    UPDATE loans SET returned_on = ? WHERE id IN (SELECT value FROM json_each(?))
+"""
+
+
+class BatchError(ValueError):
+    """The request can't be processed at all (not a list, too many items)"""
+
+
+def _id(value):
+    """A positive integer id from JSON (or a digit string), else None"""
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if type(value) is int and value > 0:
+        return value
+    return None
+
+
+def _date(value, default):
+    """A YYYY-MM-DD date, ``default`` when missing, else None"""
+    if value in (None, ''):
+        return default
+    try:
+        datetime.datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+def _parse(items, fields, defaults):
+    """Validate the shape of every item; returns (results, pending).
+
+    ``fields`` are (name, parse, error) for the values besides tool_id.
+    ``results`` has one entry per item, None for those still to be checked
+    against the database; ``pending`` holds (index, tool_id, *values) for those.
+    """
+    if not isinstance(items, list) or not items:
+        raise BatchError('items must be a non-empty list')
+    if len(items) > MAX_BATCH_ITEMS:
+        raise BatchError(f'at most {MAX_BATCH_ITEMS} items per batch')
+    results, pending, seen = [], [], set()
+    for item in items:
+        item = {**defaults, **item} if isinstance(item, dict) else {}
+        tool_id = _id(item.get('tool_id'))
+        values = [parse(item.get(name)) for name, parse, _ in fields]
+        if tool_id is None:
+            error = TOOL_NOT_FOUND
+        elif tool_id in seen:
+            error = DUPLICATE
+        else:
+            error = next((message for value, (_, _, message) in zip(values, fields) if value is None), None)
+        seen.add(tool_id)
+        if error:
+            results.append({'tool_id': item.get('tool_id'), 'ok': False, 'error': error})
+        else:
+            results.append(None)
+            pending.append((len(results) - 1, tool_id, *values))
+    return results, pending
+
+
+def _begin(conn):
+    # Take the write lock up front so nothing can lend or return these tools
+    # between the checks and the write. Inside a transaction the caller has
+    # already opened, the checks could read state another writer changes
+    # before this one gets the lock, so that is refused.
+    if conn.in_transaction:
+        raise RuntimeError("loan batches must start outside a transaction")
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def lend_tools(conn, user_id, items, person_id=None, lent_date=None):
+    """Lend each item's tool_id to its person_id on its lent_date.
+
+    ``person_id`` and ``lent_date`` apply to items that don't give their own;
+    the date defaults to today. Returns the per-item results; the writes are
+    left in the caller's transaction to commit.
+    """
+    today = datetime.date.today().isoformat()
+    fields = [('person_id', _id, PERSON_NOT_FOUND), ('lent_date', lambda value: _date(value, today), BAD_DATE)]
+    defaults = {key: value for key, value in (('person_id', person_id), ('lent_date', lent_date))
+                if value is not None}
+    results, pending = _parse(items, fields, defaults)
+    if not pending:
+        return results
+
+    _begin(conn)
+    rows = {row[0]: row for row in conn.execute(
+        LEND_CHECK, (json.dumps([p[1:] for p in pending]), user_id, user_id))}
+    accepted = []
+    for key, (index, tool_id, _, _) in enumerate(pending):
+        _, tool_ok, person_ok, lent = rows[key]
+        if not tool_ok:
+            results[index] = {'tool_id': tool_id, 'ok': False, 'error': TOOL_NOT_FOUND}
+        elif lent:
+            results[index] = {'tool_id': tool_id, 'ok': False, 'error': ALREADY_LENT}
+        elif not person_ok:
+            results[index] = {'tool_id': tool_id, 'ok': False, 'error': PERSON_NOT_FOUND}
+        else:
+            accepted.append((index, tool_id, *pending[key][2:]))
+    if accepted:
+        conn.execute(LEND_INSERT, (user_id, json.dumps([a[1:] for a in accepted])))
+        loan_ids = {tool_id: loan_id for loan_id, tool_id in
+                    conn.execute(ACTIVE_LOANS, (json.dumps([a[1] for a in accepted]),))}
+        for index, tool_id, _, _ in accepted:
+            results[index] = {'tool_id': tool_id, 'ok': True, 'loan_id': loan_ids[tool_id]}
+    return results
+
+
+def return_tools(conn, user_id, items, returned_date=None):
+    """Close the active loan of each item's tool_id on its returned_date (default today).
+
+    Returns the per-item results; the writes are left in the caller's
+    transaction to commit.
+    """
+    today = datetime.date.today().isoformat()
+    fields = [('returned_date', lambda value: _date(value, today), BAD_DATE)]
+    defaults = {'returned_date': returned_date} if returned_date is not None else {}
+    results, pending = _parse(items, fields, defaults)
+    if not pending:
+        return results
+
+    _begin(conn)
+    rows = {row[0]: row for row in conn.execute(
+        RETURN_CHECK, (json.dumps([p[1:] for p in pending]), user_id))}
+    accepted = {}
+    for key, (index, tool_id, returned_on) in enumerate(pending):
+        _, tool_ok, loan_id = rows[key]
+        if not tool_ok or loan_id is None:
+            results[index] = {'tool_id': tool_id, 'ok': False, 'error': NOT_LENT if tool_ok else TOOL_NOT_FOUND}
+        else:
+            accepted.setdefault(returned_on, []).append(loan_id)
+            results[index] = {'tool_id': tool_id, 'ok': True, 'loan_id': loan_id}
+    for returned_on, loan_ids in accepted.items():
+        conn.execute(RETURN_UPDATE, (returned_on, json.dumps(loan_ids)))
+    return results
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Migration script to move existing tool images into the content-addressed store.
+Every image referenced from tools.image_path is hashed and moved to
+<h[:2]>/<h[2:4]>/<h><ext> under UPLOAD_FOLDER, together with its thumbnail
+and variants; identical images collapse into a single copy. Safe to re-run.
+Usage: python migrate_images.py [--dry-run] [--thumb-width 200]
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import sqlite3
+import sys
+
+import images
+
+
+def get_db_path():
+    """Get the database path from environment or use default"""
+    return os.environ.get('TOOLTRACKER_DB', 'tooltracker.db')
+
+
+def get_upload_folder():
+    """Get the upload folder from environment or use default"""
+    return os.environ.get('UPLOAD_FOLDER', os.path.join('static', 'images'))
+
+
+def related_files(upload_folder, relpath, thumb_width):
+    """(path, new suffix) of the thumbnail, variants and other encodings of an image"""
+    stem = os.path.join(upload_folder, os.path.splitext(relpath)[0])
+    main = os.path.join(upload_folder, relpath)
+    base = glob.escape(stem)
+    related = []
+    for path in glob.glob(base + '_thumb.*'):
+        related.append((path, f'_{thumb_width}w' + os.path.splitext(path)[1]))
+    for path in glob.glob(base + '_*w.*') + glob.glob(base + '.*'):
+        if path != main and not path.endswith('.tmp'):
+            related.append((path, path[len(stem):]))
+    return related
+
+
+def _place(source, dest):
+    """Make ``dest`` a copy of ``source`` unless an identical image already lives there"""
+    if os.path.exists(dest):
+        return
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        os.link(source, dest)
+    except OSError:
+        tmp = dest + '.tmp'
+        shutil.copy2(source, tmp)
+        os.replace(tmp, dest)
+
+
+def migrate_images(db_path, upload_folder, thumb_width=200, dry_run=False):
+    """Rehash every referenced image into the content-addressed layout"""
+    if not os.path.exists(db_path):
+        print(f"❌ Database file not found: {db_path}")
+        return False
+
+    print(f"🔧 Migrating images in {upload_folder} for database {db_path}")
+    conn = sqlite3.connect(db_path)
+    images.ensure_image_tables(conn)
+
+    moved = deduplicated = missing = skipped = 0
+    rows = conn.execute("SELECT DISTINCT image_path FROM tools WHERE image_path IS NOT NULL").fetchall()
+    for (image_path,) in rows:
+        relpath = images.image_relpath(image_path)
+        if images.is_content_path(relpath) or images.is_original(relpath):
+            # Already migrated, or still waiting for the image worker
+            skipped += 1
+            continue
+
+        source = os.path.join(upload_folder, relpath)
+        if not os.path.isfile(source):
+            print(f"⚠️  Missing file for {image_path}")
+            missing += 1
+            continue
+
+        with open(source, 'rb') as f:
+            data = f.read()
+        extension = os.path.splitext(relpath)[1].lower()
+        new_relpath = images.content_relpath(data, extension)
+        new_stem = os.path.join(upload_folder, os.path.splitext(new_relpath)[0])
+        duplicate = os.path.exists(new_stem + extension)
+        print(f"{'=' if duplicate else '→'} {relpath} -> {new_relpath}")
+        if dry_run:
+            continue
+
+        # Copy first, repoint the tools, then remove the old names: an
+        # interrupted run leaves every tool with a working image
+        files = [(source, extension)] + related_files(upload_folder, relpath, thumb_width)
+        for path, suffix in files:
+            _place(path, new_stem + suffix)
+        conn.execute(
+            "UPDATE tools SET image_path = ? WHERE image_path = ?",
+            (images.IMAGE_PATH_PREFIX + new_relpath, image_path),
+        )
+        conn.commit()
+        for path, _ in files:
+            os.remove(path)
+        if duplicate:
+            deduplicated += 1
+        else:
+            moved += 1
+
+    if not dry_run:
+        images.rebuild_image_refs(conn)
+        conn.commit()
+    conn.close()
+
+    orphans = [
+        name for name in os.listdir(upload_folder)
+        if os.path.isfile(os.path.join(upload_folder, name)) and not images.is_original(name)
+    ] if os.path.isdir(upload_folder) else []
+
+    print(f"✅ {moved} image(s) moved, {deduplicated} duplicate(s) merged, "
+          f"{skipped} already in place, {missing} missing")
+    if orphans:
+        print(f"ℹ️  {len(orphans)} file(s) in {upload_folder} are not referenced by any tool and were left alone")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='show what would move without changing anything')
+    parser.add_argument('--thumb-width', type=int, default=200,
+                        help='THUMBNAIL_DIMENSION the existing _thumb files were made with')
+    args = parser.parse_args()
+    ok = migrate_images(get_db_path(), get_upload_folder(), args.thumb_width, args.dry_run)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
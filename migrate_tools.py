@@ -1,20 +1,24 @@
 #!/usr/bin/env python3
 """
-Migration script to add new fields to the tools table.
-Run this script to add brand, model_number, and serial_number columns to existing databases.
+Migration script to bring an existing database up to the current schema.
+Runs the versioned steps in migrations.py that the database hasn't applied
+yet, after taking a backup. The app does the same on startup; this script is
+for migrating ahead of a deploy, or with a backup on hand.
 """
 
 import sqlite3
 import os
 import sys
 
+import migrations
+
 def get_db_path():
     """Get the database path from environment or use default"""
     db_path = os.environ.get('TOOLTRACKER_DB', 'tooltracker.db')
     return db_path
 
 def migrate_tools_table(db_path):
-    """Migrate existing tools table to include new fields"""
+    """Apply any pending schema migrations to the database at ``db_path``"""
     try:
         if not os.path.exists(db_path):
             print(f"❌ Database file not found: {db_path}")
@@ -24,52 +28,20 @@ def migrate_tools_table(db_path):
         print(f"🔧 Migrating database: {db_path}")
         
         conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        # Check if new columns already exist
-        c.execute("PRAGMA table_info(tools)")
-        columns = [col[1] for col in c.fetchall()]
-        
-        print(f"Current columns: {', '.join(columns)}")
-        
-        migrations_applied = []
+        version = migrations.schema_version(conn)
+        print(f"Current schema version: {version} (latest: {migrations.LATEST_VERSION})")
         
-        # Add brand column if it doesn't exist
-        if 'brand' not in columns:
-            try:
-                c.execute("ALTER TABLE tools ADD COLUMN brand TEXT")
-                migrations_applied.append("brand")
-                print("✓ Added brand column to tools table")
-            except sqlite3.OperationalError as e:
-                print(f"❌ Error adding brand column: {e}")
-        
-        # Add model_number column if it doesn't exist
-        if 'model_number' not in columns:
-            try:
-                c.execute("ALTER TABLE tools ADD COLUMN model_number TEXT")
-                migrations_applied.append("model_number")
-                print("✓ Added model_number column to tools table")
-            except sqlite3.OperationalError as e:
-                print(f"❌ Error adding model_number column: {e}")
-        
-        # Add serial_number column if it doesn't exist
-        if 'serial_number' not in columns:
-            try:
-                c.execute("ALTER TABLE tools ADD COLUMN serial_number TEXT")
-                migrations_applied.append("serial_number")
-                print("✓ Added serial_number column to tools table")
-            except sqlite3.OperationalError as e:
-                print(f"❌ Error adding serial_number column: {e}")
+        applied = migrations.migrate(conn, db_path)
+        conn.close()
         
-        if migrations_applied:
-            conn.commit()
+        if applied:
+            descriptions = {target: description for target, description, _ in migrations.MIGRATIONS}
+            for target in applied:
+                print(f"✓ {target}: {descriptions[target]}")
             print(f"✅ Migration completed successfully!")
-            print(f"Added columns: {', '.join(migrations_applied)}")
-            print("\nYou can now use the new fields in the Tool Tracker application.")
         else:
-            print("✅ No migration needed - all columns already exist")
+            print("✅ No migration needed - the schema is up to date")
             
-        conn.close()
         return True
             
     except Exception as e:
@@ -84,7 +56,7 @@ def main():
     db_path = get_db_path()
     
     # Confirm before proceeding
-    print(f"This will add new columns to your tools table in: {db_path}")
+    print(f"This will update the schema of: {db_path}")
     response = input("Do you want to continue? (y/N): ").strip().lower()
     
     if response not in ['y', 'yes']:
@@ -112,7 +84,7 @@ def main():
         print("\n🎉 Migration completed successfully!")
         if os.path.exists(backup_path):
             print(f"💾 Backup saved as: {backup_path}")
-        print("\nYou can now restart your Tool Tracker application to use the new fields.")
+        print("\nYou can now restart your Tool Tracker application.")
     else:
         print("\n❌ Migration failed!")
         if os.path.exists(backup_path):
@@ -0,0 +1,189 @@
+"""
+Versioned schema migrations, tracked in the database's PRAGMA user_version.
+
+Every step in MIGRATIONS runs once, in order, in its own transaction that
+also bumps user_version. When the schema is current, startup costs a single
+PRAGMA read; otherwise one process migrates under a file lock while the other
+gunicorn workers wait and then find nothing left to do.
+
+Schema changes (a new column, index, trigger or table) are made by appending
+a step: never edit a step that has shipped, since databases that already ran
+it won't run it again.
+"""
+
+import logging
+import sqlite3
+from contextlib import contextmanager
+
+import data_version
+import db
+import images
+import reports
+import search
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        picture TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tools (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        value REAL,
+        image_path TEXT,
+        brand TEXT,
+        model_number TEXT,
+        serial_number TEXT,
+        acquisition_date TEXT,
+        image_status TEXT,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(created_by) REFERENCES users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS people (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        contact_info TEXT,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(created_by) REFERENCES users(id),
+        UNIQUE(name, created_by)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS loans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tool_id INTEGER NOT NULL,
+        person_id INTEGER NOT NULL,
+        lent_on TEXT NOT NULL,
+        returned_on TEXT,
+        lent_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(tool_id) REFERENCES tools(id),
+        FOREIGN KEY(person_id) REFERENCES people(id),
+        FOREIGN KEY(lent_by) REFERENCES users(id)
+    )
+    """,
+]
+
+# Columns added after the first release, which databases from before
+# versioned migrations may lack. tools.created_at is not here: SQLite can't
+# add a column with a CURRENT_TIMESTAMP default, so such databases go without
+# it (see tools_has_created_at in app.py).
+LEGACY_COLUMNS = {
+    'tools': [
+        ('created_by', 'TEXT'),
+        ('brand', 'TEXT'),
+        ('model_number', 'TEXT'),
+        ('serial_number', 'TEXT'),
+        ('acquisition_date', 'TEXT'),
+        ('image_status', 'TEXT'),
+    ],
+    'people': [('contact_info', 'TEXT'), ('created_by', 'TEXT')],
+    'loans': [('lent_by', 'TEXT')],
+}
+
+
+def create_tables(conn):
+    """Base tables, bringing databases created by earlier releases up to date"""
+    for sql in TABLES:
+        conn.execute(sql)
+    for table, columns in LEGACY_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, type_ in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {type_}")
+                logger.info(f"Added {table}.{name}")
+
+
+def create_indexes(conn):
+    missing = db.ensure_indexes(conn)
+    if missing:
+        raise sqlite3.OperationalError(f"indexes missing after creation: {', '.join(missing)}")
+
+
+def create_search_index(conn):
+    # Built whatever TOOL_SEARCH_BACKEND says, so switching backends needs no migration
+    if not search.ensure_search_index(conn):
+        logger.warning("SQLite FTS5 unavailable; tool search falls back to LIKE")
+
+
+# (version, description, step) in the order they are applied
+MIGRATIONS = [
+    (1, 'base tables', create_tables),
+    (2, 'indexes for the hot queries', create_indexes),
+    (3, 'full-text search index over tools', create_search_index),
+    (4, 'report summary tables', reports.ensure_report_tables),
+    (5, 'image job queue, refcounts and variant cache', images.ensure_image_tables),
+    (6, 'per-user data version stamps', data_version.ensure_data_version_tables),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def migration_lock(db_path):
+    """Exclusive lock shared by every process migrating ``db_path``"""
+    if fcntl is None or not db_path or db_path == ':memory:':
+        yield
+        return
+    with open(db_path + '.migrate.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate(conn, db_path=None, migrations=MIGRATIONS):
+    """Apply the steps ``conn``'s database hasn't run yet; return the versions applied.
+
+    Each step commits together with its user_version bump, so an interrupted
+    run resumes at the step that failed. Raises whatever the failing step
+    raised, after rolling it back.
+    """
+    latest = migrations[-1][0]
+    if schema_version(conn) >= latest:
+        return []
+
+    applied = []
+    with migration_lock(db_path):
+        # Another worker may have migrated while this one waited for the lock
+        version = schema_version(conn)
+        for target, description, step in migrations:
+            if target <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {int(target)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.exception(f"Migration {target} ({description}) failed")
+                raise
+            logger.info(f"Applied migration {target}: {description}")
+            applied.append(target)
+    return applied
+
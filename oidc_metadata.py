@@ -0,0 +1,258 @@
+"""
+Cached OpenID provider metadata: the discovery document and the JWKS.
+
+Documents are held in memory and in a JSON file shared by workers and
+restarts, and kept fresh by a background thread that honours the provider's
+Cache-Control/Expires headers and revalidates with ETag/Last-Modified. Request
+handlers only read what is cached, so no request waits on the provider for
+metadata; while it is unreachable the last good copy stays in use.
+"""
+
+import email.utils
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+DISCOVERY = 'discovery'
+JWKS = 'jwks'
+
+FETCH_TIMEOUT = 5  # seconds
+MIN_TTL = 60  # never refetch more often than this, whatever the headers say
+REFRESH_MARGIN = 0.1  # refresh when this fraction of the lifetime is left
+RETRY_MIN = 5  # seconds before the first retry after a failed refresh, doubled per failure
+RETRY_MAX = 300
+
+# Endpoints a discovery document must name for it to be usable
+REQUIRED_ENDPOINTS = ('authorization_endpoint', 'token_endpoint', 'userinfo_endpoint')
+
+_MAX_AGE = re.compile(r'(?:^|,)\s*(?:s-)?max-age\s*=\s*"?(\d+)', re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+def cache_lifetime(headers, default_ttl, max_ttl, now=None):
+    """Seconds a response may be used for, from Cache-Control or Expires, within [MIN_TTL, max_ttl]"""
+    cache_control = headers.get('Cache-Control', '')
+    directives = {part.strip().split('=')[0].lower() for part in cache_control.split(',')}
+    if 'no-store' in directives or 'no-cache' in directives:
+        ttl = MIN_TTL
+    elif _MAX_AGE.search(cache_control):
+        ttl = int(_MAX_AGE.search(cache_control).group(1))
+    elif headers.get('Expires'):
+        try:
+            expires = email.utils.parsedate_to_datetime(headers['Expires']).timestamp()
+        except (TypeError, ValueError):
+            expires = 0
+        ttl = expires - (now if now is not None else time.time())
+    else:
+        ttl = default_ttl
+    return max(MIN_TTL, min(ttl, max_ttl))
+
+
+class ProviderMetadata:
+    """The discovery document at ``discovery_url`` and the JWKS it points to.
+
+    ``cache_path`` ('' or None to keep them in memory only) is shared by every
+    process using the same provider. ``max_ttl`` bounds how long a document
+    is used before revalidation; ``default_ttl`` applies when the provider
+    sends no caching headers.
+    """
+
+    def __init__(self, discovery_url, cache_path=None, default_ttl=3600, max_ttl=86400, get=None):
+        self.discovery_url = discovery_url
+        self.cache_path = cache_path
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self._get = get
+        self._entries = {}  # name -> {url, document, etag, last_modified, lifetime, expires_at}
+        self._lock = threading.Lock()
+        self._cache_mtime = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._failures = 0
+        self.refreshes = 0
+        self.revalidations = 0
+        self.errors = 0
+
+    # -- reading (never touches the network)
+
+    def document(self, name):
+        with self._lock:
+            self._load_locked()
+            entry = self._entries.get(name)
+            return entry['document'] if entry else None
+
+    def discovery(self):
+        return self.document(DISCOVERY)
+
+    def jwks(self):
+        return self.document(JWKS)
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                'documents': {name: round(entry['expires_at'] - now) for name, entry in self._entries.items()},
+                'refreshes': self.refreshes,
+                'revalidations': self.revalidations,
+                'errors': self.errors,
+            }
+
+    # -- disk cache
+
+    def _load_locked(self):
+        """Pick up the shared cache file when another process has rewritten it"""
+        if not self.cache_path:
+            return
+        try:
+            mtime = os.path.getmtime(self.cache_path)
+        except OSError:
+            return
+        if mtime == self._cache_mtime:
+            return
+        self._cache_mtime = mtime
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(cached, dict) or cached.get('discovery_url') != self.discovery_url:
+            return
+        for name, entry in (cached.get('entries') or {}).items():
+            current = self._entries.get(name)
+            if current is None or entry.get('expires_at', 0) > current['expires_at']:
+                self._entries[name] = entry
+
+    def _save_locked(self):
+        if not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'discovery_url': self.discovery_url, 'entries': self._entries}, f)
+            os.replace(tmp, self.cache_path)
+            self._cache_mtime = os.path.getmtime(self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write OIDC metadata cache {self.cache_path}: {e}")
+
+    # -- refreshing
+
+    def _http_get(self, url, headers):
+        if self._get is not None:
+            return self._get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        import requests
+
+        return requests.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+
+    def refresh(self, name, url):
+        """Fetch (or revalidate) one document now; raises on failure, keeping the cached copy"""
+        with self._lock:
+            entry = self._entries.get(name)
+            headers = {'Accept': 'application/json'}
+            if entry and entry.get('url') == url:
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+        resp = self._http_get(url, headers)
+        lifetime = cache_lifetime(resp.headers, self.default_ttl, self.max_ttl)
+        if resp.status_code == 304 and entry and entry.get('url') == url:
+            with self._lock:
+                self._entries[name] = dict(entry, lifetime=lifetime, expires_at=time.time() + lifetime)
+                document = entry['document']
+                self.revalidations += 1
+                self._save_locked()
+            return document
+
+        resp.raise_for_status()
+        document = resp.json()
+        if name == DISCOVERY:
+            missing = [key for key in REQUIRED_ENDPOINTS if not document.get(key)]
+            if missing:
+                raise ValueError(f"discovery document lacks {', '.join(missing)}")
+        elif name == JWKS and not isinstance(document.get('keys'), list):
+            raise ValueError("JWKS has no keys")
+
+        with self._lock:
+            self._entries[name] = {
+                'url': url,
+                'document': document,
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'lifetime': lifetime,
+                'expires_at': time.time() + lifetime,
+            }
+            self.refreshes += 1
+            self._save_locked()
+        logger.info(f"Refreshed OIDC {name} from {url} (valid {int(lifetime)}s)")
+        return document
+
+    def _due(self, name, now):
+        """Seconds until ``name`` should be refreshed, <= 0 when it is due"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return 0
+        return entry['expires_at'] - entry.get('lifetime', 0) * REFRESH_MARGIN - now
+
+    def refresh_due(self):
+        """Refresh whatever is missing or about to expire; return seconds until the next refresh"""
+        now = time.time()
+        with self._lock:
+            self._load_locked()
+            discovery_wait = self._due(DISCOVERY, now)
+        if discovery_wait <= 0:
+            self.refresh(DISCOVERY, self.discovery_url)
+
+        discovery = self.discovery()
+        jwks_uri = discovery.get('jwks_uri') if discovery else None
+        waits = [self._due(DISCOVERY, time.time())]
+        if jwks_uri:
+            with self._lock:
+                entry = self._entries.get(JWKS)
+                stale_uri = entry is not None and entry.get('url') != jwks_uri
+                jwks_wait = 0 if stale_uri else self._due(JWKS, time.time())
+            if jwks_wait <= 0:
+                self.refresh(JWKS, jwks_uri)
+            waits.append(self._due(JWKS, time.time()))
+        return max(1.0, min(waits))
+
+    def request_refresh(self, name=None):
+        """Ask the background thread to refetch now (e.g. the JWKS after a key rotation)"""
+        with self._lock:
+            for key in ([name] if name else list(self._entries)):
+                if key in self._entries:
+                    self._entries[key] = dict(self._entries[key], expires_at=0)
+        self._wake.set()
+
+    # -- background thread
+
+    def start(self):
+        """Start the refresh thread in this process (again after a fork)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='oidc-metadata', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                delay = self.refresh_due()
+                self._failures = 0
+            except Exception as e:
+                self.errors += 1
+                self._failures += 1
+                delay = min(RETRY_MAX, RETRY_MIN * 2 ** (self._failures - 1))
+                logger.warning(f"OIDC metadata refresh failed ({e}); retrying in {delay}s")
+            self._wake.wait(delay)
+            self._wake.clear()
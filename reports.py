@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Per-user report aggregates, maintained incrementally by triggers.
+
+The financial and brand reports read these summary tables instead of
+re-aggregating every tool on each page view. Every write to tools or loans
+adjusts them inside the same transaction, so they never lag the base tables.
+Run this module directly to check (and optionally repair) them:
+
+    python reports.py [--repair]
+"""
+
+import os
+import sqlite3
+import sys
+
+# Value ranges shown on the financial report, in display order
+VALUE_BUCKETS = ('No Value Set', '$0 - $50', '$51 - $100', '$101 - $250', '$251 - $500', '$501 - $1000', '$1000+')
+
+# Summaries are kept to 6 decimal places so repeated +/- of float values can't drift
+PRECISION = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_totals (
+    user_id TEXT PRIMARY KEY,
+    total_tools INTEGER NOT NULL DEFAULT 0,
+    valued_tools INTEGER NOT NULL DEFAULT 0,
+    total_value REAL NOT NULL DEFAULT 0,
+    tools_lent_out INTEGER NOT NULL DEFAULT 0,
+    value_lent_out REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS report_value_buckets (
+    user_id TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total_value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS report_brands (
+    user_id TEXT NOT NULL,
+    brand TEXT NOT NULL,
+    tool_count INTEGER NOT NULL DEFAULT 0,
+    valued_count INTEGER NOT NULL DEFAULT 0,
+    total_value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, brand)
+) WITHOUT ROWID;
+"""
+
+
+def bucket_sql(value):
+    """CASE expression mapping ``value`` to its VALUE_BUCKETS label"""
+    return f"""CASE
+        WHEN {value} IS NULL OR {value} = 0 THEN 'No Value Set'
+        WHEN {value} <= 50 THEN '$0 - $50'
+        WHEN {value} <= 100 THEN '$51 - $100'
+        WHEN {value} <= 250 THEN '$101 - $250'
+        WHEN {value} <= 500 THEN '$251 - $500'
+        WHEN {value} <= 1000 THEN '$501 - $1000'
+        ELSE '$1000+'
+    END"""
+
+
+def _tool_delta(row, sign):
+    """Statements adding (sign '+') or removing (sign '-') one tool row's contribution"""
+    value = f"COALESCE({row}.value, 0)"
+    valued = f"({row}.value IS NOT NULL)"
+    active_loans = f"(SELECT COUNT(*) FROM loans WHERE tool_id = {row}.id AND returned_on IS NULL)"
+    return f"""
+        INSERT INTO report_totals (user_id, total_tools, valued_tools, total_value, tools_lent_out, value_lent_out)
+        SELECT {row}.created_by, {sign}1, {sign}{valued}, {sign}{value},
+               {sign}{active_loans}, {sign}{active_loans} * {value}
+        WHERE {row}.created_by IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_tools = total_tools + excluded.total_tools,
+            valued_tools = valued_tools + excluded.valued_tools,
+            total_value = ROUND(total_value + excluded.total_value, {PRECISION}),
+            tools_lent_out = tools_lent_out + excluded.tools_lent_out,
+            value_lent_out = ROUND(value_lent_out + excluded.value_lent_out, {PRECISION});
+        INSERT INTO report_value_buckets (user_id, bucket, count, total_value)
+        SELECT {row}.created_by, {bucket_sql(row + '.value')}, {sign}1, {sign}{value}
+        WHERE {row}.created_by IS NOT NULL
+        ON CONFLICT (user_id, bucket) DO UPDATE SET
+            count = count + excluded.count,
+            total_value = ROUND(total_value + excluded.total_value, {PRECISION});
+        INSERT INTO report_brands (user_id, brand, tool_count, valued_count, total_value)
+        SELECT {row}.created_by, {row}.brand, {sign}1, {sign}{valued}, {sign}{value}
+        WHERE {row}.created_by IS NOT NULL AND {row}.brand IS NOT NULL AND {row}.brand != ''
+        ON CONFLICT (user_id, brand) DO UPDATE SET
+            tool_count = tool_count + excluded.tool_count,
+            valued_count = valued_count + excluded.valued_count,
+            total_value = ROUND(total_value + excluded.total_value, {PRECISION});
+        DELETE FROM report_value_buckets WHERE user_id = {row}.created_by AND count <= 0;
+        DELETE FROM report_brands WHERE user_id = {row}.created_by AND tool_count <= 0;
+    """
+
+
+def _loan_delta(row, sign):
+    """Statements adding or removing one active loan's contribution"""
+    return f"""
+        INSERT INTO report_totals (user_id, tools_lent_out, value_lent_out)
+        SELECT created_by, {sign}1, {sign}COALESCE(value, 0) FROM tools
+        WHERE id = {row}.tool_id AND created_by IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET
+            tools_lent_out = tools_lent_out + excluded.tools_lent_out,
+            value_lent_out = ROUND(value_lent_out + excluded.value_lent_out, {PRECISION});
+    """
+
+
+TRIGGERS = {
+    'report_tool_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS report_tool_insert AFTER INSERT ON tools BEGIN
+            {_tool_delta('new', '+')}
+        END
+    """,
+    'report_tool_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS report_tool_delete AFTER DELETE ON tools BEGIN
+            {_tool_delta('old', '-')}
+        END
+    """,
+    'report_tool_update': f"""
+        CREATE TRIGGER IF NOT EXISTS report_tool_update AFTER UPDATE OF value, brand, created_by ON tools BEGIN
+            {_tool_delta('old', '-')}
+            {_tool_delta('new', '+')}
+        END
+    """,
+    'report_loan_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS report_loan_insert AFTER INSERT ON loans
+        WHEN new.returned_on IS NULL BEGIN
+            {_loan_delta('new', '+')}
+        END
+    """,
+    'report_loan_close': f"""
+        CREATE TRIGGER IF NOT EXISTS report_loan_close AFTER UPDATE OF returned_on, tool_id ON loans
+        WHEN old.returned_on IS NULL BEGIN
+            {_loan_delta('old', '-')}
+        END
+    """,
+    'report_loan_open': f"""
+        CREATE TRIGGER IF NOT EXISTS report_loan_open AFTER UPDATE OF returned_on, tool_id ON loans
+        WHEN new.returned_on IS NULL BEGIN
+            {_loan_delta('new', '+')}
+        END
+    """,
+    'report_loan_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS report_loan_delete AFTER DELETE ON loans
+        WHEN old.returned_on IS NULL BEGIN
+            {_loan_delta('old', '-')}
+        END
+    """,
+}
+
+# From-scratch aggregation, used to seed the tables and by the consistency check
+_RECOMPUTE = {
+    'report_totals': f"""
+        SELECT t.created_by AS user_id,
+               COUNT(*) AS total_tools,
+               COUNT(t.value) AS valued_tools,
+               ROUND(COALESCE(SUM(t.value), 0), {PRECISION}) AS total_value,
+               COALESCE(SUM(a.n), 0) AS tools_lent_out,
+               ROUND(COALESCE(SUM(a.n * COALESCE(t.value, 0)), 0), {PRECISION}) AS value_lent_out
+        FROM tools t
+        LEFT JOIN (
+            SELECT tool_id, COUNT(*) AS n FROM loans WHERE returned_on IS NULL GROUP BY tool_id
+        ) a ON a.tool_id = t.id
+        WHERE t.created_by IS NOT NULL
+        GROUP BY t.created_by
+    """,
+    'report_value_buckets': f"""
+        SELECT created_by AS user_id, {bucket_sql('value')} AS bucket,
+               COUNT(*) AS count, ROUND(COALESCE(SUM(value), 0), {PRECISION}) AS total_value
+        FROM tools
+        WHERE created_by IS NOT NULL
+        GROUP BY 1, 2
+    """,
+    'report_brands': f"""
+        SELECT created_by AS user_id, brand, COUNT(*) AS tool_count, COUNT(value) AS valued_count,
+               ROUND(COALESCE(SUM(value), 0), {PRECISION}) AS total_value
+        FROM tools
+        WHERE created_by IS NOT NULL AND brand IS NOT NULL AND brand != ''
+        GROUP BY 1, 2
+    """,
+}
+
+_KEYS = {
+    'report_totals': ('user_id',),
+    'report_value_buckets': ('user_id', 'bucket'),
+    'report_brands': ('user_id', 'brand'),
+}
+
+
+def ensure_report_tables(conn):
+    """Create the summary tables and triggers, seeding them on first creation"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'report_totals'"
+    ).fetchone()
+    # executescript() would commit the caller's transaction, so run statements one by one
+    for statement in SCHEMA.split(';'):
+        if statement.strip():
+            conn.execute(statement)
+    for sql in TRIGGERS.values():
+        conn.execute(sql)
+    if not exists:
+        rebuild_report_tables(conn)
+
+
+def rebuild_report_tables(conn):
+    """Recompute every summary row from the base tables"""
+    for table, query in _RECOMPUTE.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} {query}")
+
+
+def check_report_tables(conn):
+    """Recompute the summaries from scratch and diff them against the stored rows.
+
+    Returns a list of human-readable differences; empty means consistent.
+    """
+    problems = []
+    for table, query in _RECOMPUTE.items():
+        keys = _KEYS[table]
+        expected = {tuple(r[k] for k in keys): dict(r) for r in _rows(conn, query)}
+        stored = {tuple(r[k] for k in keys): dict(r) for r in _rows(conn, f"SELECT * FROM {table}")}
+        for key in sorted(set(expected) | set(stored), key=repr):
+            want, got = expected.get(key), stored.get(key)
+            if want is None and not any(v for k, v in got.items() if k not in keys):
+                continue  # an all-zero totals row is equivalent to no row
+            if want is None or got is None:
+                problems.append(f"{table}{key}: expected {want}, stored {got}")
+                continue
+            for column, value in want.items():
+                if isinstance(value, (int, float)):
+                    same = abs((got[column] or 0) - value) <= 10 ** -PRECISION
+                else:
+                    same = got[column] == value
+                if not same:
+                    problems.append(f"{table}{key}.{column}: expected {value}, stored {got[column]}")
+    return problems
+
+
+def _rows(conn, sql, params=()):
+    cur = conn.execute(sql, params)
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def financial_summary(conn, user_id):
+    """Inventory totals, lent-out totals and the value distribution for one user"""
+    rows = _rows(conn, "SELECT * FROM report_totals WHERE user_id = ?", (user_id,))
+    totals = rows[0] if rows else {}
+    inventory_stats = {
+        'total_tools': totals.get('total_tools', 0),
+        'total_value': totals.get('total_value', 0),
+        'avg_value': totals['total_value'] / totals['valued_tools'] if totals.get('valued_tools') else 0,
+    }
+    lent_stats = {
+        'tools_lent_out': totals.get('tools_lent_out', 0),
+        'value_lent_out': totals.get('value_lent_out', 0),
+    }
+    buckets = {
+        row['value_range']: row
+        for row in _rows(
+            conn,
+            "SELECT bucket AS value_range, count, total_value FROM report_value_buckets WHERE user_id = ?",
+            (user_id,),
+        )
+    }
+    value_distribution = [buckets[b] for b in VALUE_BUCKETS if b in buckets]
+    return inventory_stats, lent_stats, value_distribution
+
+
+def brand_summary(conn, user_id):
+    """Per-brand tool count, total and average value, highest total first"""
+    rows = _rows(
+        conn,
+        """
+        SELECT brand, tool_count, total_value, valued_count
+        FROM report_brands
+        WHERE user_id = ?
+        ORDER BY total_value DESC
+        """,
+        (user_id,),
+    )
+    for row in rows:
+        valued_count = row.pop('valued_count')
+        row['avg_value'] = row['total_value'] / valued_count if valued_count else 0
+    return rows
+
+
+def main():
+    repair = '--repair' in sys.argv[1:]
+    db_path = os.environ.get('TOOLTRACKER_DB', 'tooltracker.db')
+    if not os.path.exists(db_path):
+        print(f"❌ Database file not found: {db_path}")
+        return 1
+
+    conn = sqlite3.connect(db_path)
+    ensure_report_tables(conn)
+    problems = check_report_tables(conn)
+    if not problems:
+        print("✅ Report summaries match the tools and loans tables")
+        return 0
+
+    print(f"❌ {len(problems)} difference(s) between stored and recomputed summaries:")
+    for problem in problems:
+        print(f"  {problem}")
+    if repair:
+        rebuild_report_tables(conn)
+        conn.commit()
+        print("🔧 Summaries rebuilt from scratch")
+        return 0
+    print("\nRun with --repair to rebuild them.")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
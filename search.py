@@ -0,0 +1,134 @@
+import re
+import sqlite3
+
+# Columns of the full-text index; rowid is the tool id
+SEARCH_COLUMNS = ('name', 'description', 'brand', 'model_number', 'serial_number', 'borrower')
+
+# bm25 weights, in SEARCH_COLUMNS order: a hit in the name outranks one in the description
+BM25_WEIGHTS = (10.0, 1.0, 5.0, 3.0, 3.0, 2.0)
+
+# Name of the person a tool is currently lent to, or '' (``{tool_id}`` is substituted)
+_BORROWER_SQL = """COALESCE((
+        SELECT p.name FROM loans l JOIN people p ON p.id = l.person_id
+        WHERE l.tool_id = {tool_id} AND l.returned_on IS NULL
+        LIMIT 1
+    ), '')"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tools_fts USING fts5(
+    name, description, brand, model_number, serial_number, borrower,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# Keep tools_fts in step with tools, loans and people inside the writer's transaction
+FTS_TRIGGERS = {
+    'tools_fts_tool_insert': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_tool_insert AFTER INSERT ON tools BEGIN
+            INSERT INTO tools_fts (rowid, name, description, brand, model_number, serial_number, borrower)
+            VALUES (new.id, new.name, new.description, new.brand, new.model_number, new.serial_number,
+                    """ + _BORROWER_SQL.format(tool_id='new.id') + """);
+        END
+    """,
+    'tools_fts_tool_update': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_tool_update
+        AFTER UPDATE OF name, description, brand, model_number, serial_number ON tools BEGIN
+            UPDATE tools_fts SET name = new.name, description = new.description, brand = new.brand,
+                model_number = new.model_number, serial_number = new.serial_number
+            WHERE rowid = new.id;
+        END
+    """,
+    'tools_fts_tool_delete': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_tool_delete AFTER DELETE ON tools BEGIN
+            DELETE FROM tools_fts WHERE rowid = old.id;
+        END
+    """,
+    'tools_fts_loan_insert': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_loan_insert AFTER INSERT ON loans BEGIN
+            UPDATE tools_fts SET borrower = """ + _BORROWER_SQL.format(tool_id='new.tool_id') + """
+            WHERE rowid = new.tool_id;
+        END
+    """,
+    'tools_fts_loan_update': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_loan_update
+        AFTER UPDATE OF tool_id, person_id, returned_on ON loans BEGIN
+            UPDATE tools_fts SET borrower = """ + _BORROWER_SQL.format(tool_id='tools_fts.rowid') + """
+            WHERE rowid IN (old.tool_id, new.tool_id);
+        END
+    """,
+    'tools_fts_loan_delete': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_loan_delete AFTER DELETE ON loans BEGIN
+            UPDATE tools_fts SET borrower = """ + _BORROWER_SQL.format(tool_id='old.tool_id') + """
+            WHERE rowid = old.tool_id;
+        END
+    """,
+    'tools_fts_person_update': """
+        CREATE TRIGGER IF NOT EXISTS tools_fts_person_update AFTER UPDATE OF name ON people BEGIN
+            UPDATE tools_fts SET borrower = new.name
+            WHERE rowid IN (SELECT tool_id FROM loans WHERE person_id = new.id AND returned_on IS NULL);
+        END
+    """,
+}
+
+# Columns matched with LIKE '%term%', for matches inside words and when FTS5
+# is unavailable (t = tools, p = borrower)
+LIKE_COLUMNS = ('t.name', 't.description', 't.brand', 't.model_number', 't.serial_number', 'p.name')
+
+
+def fts5_available(conn):
+    """True if this SQLite build can create FTS5 tables"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def ensure_search_index(conn):
+    """Create tools_fts and its sync triggers, populating it on first creation.
+
+    Returns False (and leaves the schema untouched) when FTS5 is unavailable,
+    in which case callers should use the LIKE fallback.
+    """
+    if not fts5_available(conn):
+        return False
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tools_fts'"
+    ).fetchone()
+    conn.execute(FTS_SCHEMA)
+    for sql in FTS_TRIGGERS.values():
+        conn.execute(sql)
+    if not exists:
+        rebuild_search_index(conn)
+    return True
+
+
+def rebuild_search_index(conn):
+    """Repopulate tools_fts from scratch"""
+    conn.execute("DELETE FROM tools_fts")
+    conn.execute(
+        "INSERT INTO tools_fts (rowid, " + ', '.join(SEARCH_COLUMNS) + ") "
+        "SELECT t.id, t.name, t.description, t.brand, t.model_number, t.serial_number, "
+        + _BORROWER_SQL.format(tool_id='t.id') + " FROM tools t"
+    )
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query where every word must prefix-match a token.
+
+    Returns '' when the text has no searchable words.
+    """
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text))
+
+
+def like_filter(text):
+    """WHERE fragment and params matching ``text`` anywhere in a tool's columns"""
+    pattern = f"%{text}%"
+    return "(" + " OR ".join(f"{col} LIKE ?" for col in LIKE_COLUMNS) + ")", [pattern] * len(LIKE_COLUMNS)
+
+
+def bm25_rank():
+    """ORDER BY expression ranking tools_fts matches best-first"""
+    return f"bm25(tools_fts, {', '.join(str(w) for w in BM25_WEIGHTS)})"
@@ -1,3 +1,9 @@
+// Widths of the server-side image variants (set by index.html from the variant registry)
+const IMAGE_WIDTHS = window.IMAGE_WIDTHS || [200, 1024];
+
+const imageSrcSet = (imagePath) =>
+  IMAGE_WIDTHS.map((w) => `/data/${imagePath}?w=${w} ${w}w`).join(', ');
+
 const ToolCard = ({ tool }) => {
   const navigateToDetail = () => {
     window.location.href = `/tool/${tool.id}`;
@@ -119,8 +125,8 @@ const ToolCard = ({ tool }) => {
             {tool.image_path ? (
               <div className="flex-shrink-0">
                 <img
-                  src={`/data/${tool.image_path}?thumb=1`}
-                  srcSet={`/data/${tool.image_path}?thumb=1 200w, /data/${tool.image_path} 1024w`}
+                  src={`/data/${tool.image_path}?w=96`}
+                  srcSet={imageSrcSet(tool.image_path)}
                   sizes="80px"
                   alt={tool.name}
                   loading="lazy"
@@ -417,23 +423,27 @@ const App = () => {
   const [brands, setBrands] = React.useState([]);
   const [selectedBrand, setSelectedBrand] = React.useState('');
   const [pagination, setPagination] = React.useState({
-    page: 1,
     per_page: 20,
     total_count: 0,
-    total_pages: 0,
     has_next: false,
-    has_prev: false
+    next_cursor: null
   });
 
-  // Function to fetch tools with current filters
-  const fetchTools = React.useCallback(async (page = 1, append = false) => {
+  // Function to fetch tools with current filters. Searches are paged by page
+  // number so results stay in relevance order (keyset cursors page in id order);
+  // otherwise pass the previous page's next_cursor to continue. `next` is the
+  // page or cursor to load, null for the first page.
+  const fetchTools = React.useCallback(async (next = null, append = false) => {
     const params = new URLSearchParams({
-      page: page.toString(),
-      per_page: '20'
+      per_page: '20',
+      include_total: '1'
     });
     
     if (debouncedSearchTerm.trim()) {
+      params.append('page', next || 1);
       params.append('search', debouncedSearchTerm.trim());
+    } else {
+      params.append('cursor', next || '');
     }
     
     if (selectedBrand) {
@@ -477,7 +487,7 @@ const App = () => {
         setBrands(brandsData);
         
         // Then fetch first page of tools
-        await fetchTools(1, false);
+        await fetchTools(null, false);
         setLoading(false);
       } catch (error) {
         console.error('Error loading initial data:', error);
@@ -502,9 +512,9 @@ const App = () => {
   React.useEffect(() => {
     if (!loading) {
       // Reset pagination when filters change
-      setPagination(prev => ({ ...prev, page: 1 }));
+      setPagination(prev => ({ ...prev, next_cursor: null }));
       setFiltering(true);
-      fetchTools(1, false).finally(() => setFiltering(false));
+      fetchTools(null, false).finally(() => setFiltering(false));
     }
   }, [debouncedSearchTerm, selectedBrand, fetchTools]);
 
@@ -534,8 +544,8 @@ const App = () => {
     if (loadingMore || !pagination.has_next) return;
     
     setLoadingMore(true);
-    const nextPage = pagination.page + 1;
-    await fetchTools(nextPage, true);
+    const next = debouncedSearchTerm.trim() ? pagination.page + 1 : pagination.next_cursor;
+    await fetchTools(next, true);
     setLoadingMore(false);
   };
 
@@ -591,7 +601,7 @@ const App = () => {
           Found {pagination.total_count} tool{pagination.total_count !== 1 ? 's' : ''}
           {debouncedSearchTerm && ` matching "${debouncedSearchTerm}"`}
           {selectedBrand && ` from ${selectedBrand}`}
-          {pagination.total_pages > 1 && ` (showing ${tools.length} of ${pagination.total_count})`}
+          {pagination.total_count > tools.length && ` (showing ${tools.length} of ${pagination.total_count})`}
         </div>
       )}
       
@@ -604,7 +614,7 @@ const App = () => {
             </svg>
             <span className="text-red-800">{error}</span>
             <button 
-              onClick={() => fetchTools(1, false)} 
+              onClick={() => fetchTools(null, false)} 
               className="ml-auto text-red-600 hover:text-red-800 underline text-sm"
             >
               Retry
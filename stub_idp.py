@@ -0,0 +1,243 @@
+"""
+A minimal OpenID provider on localhost, for the tests and benchmarks.
+
+Serves a discovery document, a JWKS, and token and userinfo endpoints over
+HTTP/1.1 with keep-alive, logs every request it receives, and can be told
+to fail or slow down specific paths, or to charge every new connection a
+handshake delay the way a TLS provider across a network would. id_token()
+issues RS256 (or HS256) ID tokens whose key it publishes in the JWKS.
+Usage:
+    with StubIdP() as idp:
+        app.config['OIDC_DISCOVERY_URL'] = idp.discovery_url
+        idp.tokens['id_token'] = idp.id_token(nonce=...)
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+DISCOVERY_PATH = '/.well-known/openid-configuration'
+
+_signing_key = None  # (n, e, d), generated once per process
+
+
+def _probable_prime(bits):
+    small = (3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47)
+    while True:
+        n = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+        if all(n % p for p in small) and _miller_rabin(n):
+            return n
+
+
+def _miller_rabin(n, rounds=20):
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def signing_key(bits=2048):
+    """An RSA key pair (n, e, d) for signing test tokens; not for real use"""
+    global _signing_key
+    if _signing_key is None:
+        e = 65537
+        while True:
+            p, q = _probable_prime(bits // 2), _probable_prime(bits // 2)
+            phi = (p - 1) * (q - 1)
+            if p != q and phi % e:
+                break
+        _signing_key = (p * q, e, pow(e, -1, phi))
+    return _signing_key
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _int_b64url(value):
+    return _b64url(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+def public_jwk(kid):
+    """The JWKS entry for signing_key()"""
+    n, e, _ = signing_key()
+    return {'kty': 'RSA', 'use': 'sig', 'alg': 'RS256', 'kid': kid, 'n': _int_b64url(n), 'e': _int_b64url(e)}
+
+
+def sign_jwt(claims, alg='RS256', kid=None, secret=None):
+    """A compact JWS over ``claims``: RS256 with signing_key(), or HS256 with ``secret``"""
+    header = {'alg': alg, 'typ': 'JWT'}
+    if kid:
+        header['kid'] = kid
+    signing_input = f"{_b64url(json.dumps(header).encode())}.{_b64url(json.dumps(claims).encode())}".encode()
+    if alg == 'HS256':
+        signature = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+    elif alg == 'RS256':
+        n, _, d = signing_key()
+        size = (n.bit_length() + 7) // 8
+        digest = bytes.fromhex('3031300d060960864801650304020105000420') + hashlib.sha256(signing_input).digest()
+        padded = b'\x00\x01' + b'\xff' * (size - len(digest) - 3) + b'\x00' + digest
+        signature = pow(int.from_bytes(padded, 'big'), d, n).to_bytes(size, 'big')
+    else:
+        raise ValueError(f"unsupported alg {alg}")
+    return f"{signing_input.decode()}.{_b64url(signature)}"
+
+
+class StubIdP:
+    def __init__(self, max_age=300, latency=0.0, connect_latency=0.0):
+        self.max_age = max_age
+        self.latency = latency  # seconds added to every response
+        self.connect_latency = connect_latency  # seconds added to every new connection (handshake cost)
+        self.requests = []  # (method, path, headers)
+        self.connections = 0
+        self.failures = {}  # path -> remaining number of 503 responses (-1 = forever)
+        self.discovery_etag = '"v1"'
+        self.jwks = {'keys': []}
+        self.claims = {'sub': 'stub-user', 'email': 'stub@example.com', 'name': 'Stub User'}
+        self.tokens = {}  # extra fields for the token response, e.g. id_token
+        self.client_id = 'tooltracker'  # audience of the ID tokens it issues
+        self.kid = 'stub-key'
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def discovery_url(self):
+        return self.base_url + DISCOVERY_PATH
+
+    def discovery(self):
+        return {
+            'issuer': self.base_url,
+            'authorization_endpoint': self.base_url + '/authorize',
+            'token_endpoint': self.base_url + '/token',
+            'userinfo_endpoint': self.base_url + '/userinfo',
+            'jwks_uri': self.base_url + '/jwks',
+        }
+
+    def id_token(self, alg='RS256', secret=None, **claims):
+        """A signed ID token for self.claims, published key included; ``claims`` override the defaults"""
+        now = int(time.time())
+        payload = dict(self.claims, iss=self.base_url, aud=self.client_id, iat=now, exp=now + 300)
+        payload.update(claims)
+        if alg == 'RS256' and public_jwk(self.kid) not in self.jwks['keys']:
+            self.jwks['keys'].append(public_jwk(self.kid))
+        return sign_jwt(payload, alg, kid=self.kid if alg == 'RS256' else None, secret=secret)
+
+    def paths(self, method=None):
+        return [path for m, path, _ in self.requests if method is None or m == method]
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        idp = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; with Nagle on, a kept-alive
+            # connection would stall on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                idp.connections += 1
+                if idp.connect_latency:
+                    time.sleep(idp.connect_latency)
+                super().setup()
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload=None, headers=None):
+                body = json.dumps(payload).encode() if payload is not None else b''
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if payload is not None:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _failing(self, path):
+                remaining = idp.failures.get(path, 0)
+                if remaining:
+                    idp.failures[path] = remaining - 1 if remaining > 0 else remaining
+                    self._send(503, {'error': 'temporarily_unavailable'})
+                    return True
+                return False
+
+            def _begin(self):
+                path = self.path.split('?')[0]
+                idp.requests.append((self.command, path, dict(self.headers)))
+                if idp.latency:
+                    time.sleep(idp.latency)
+                return path
+
+            def do_GET(self):
+                path = self._begin()
+                if self._failing(path):
+                    return
+                cache = {'Cache-Control': f'public, max-age={idp.max_age}'}
+                if path == DISCOVERY_PATH:
+                    if self.headers.get('If-None-Match') == idp.discovery_etag:
+                        self._send(304, headers=dict(cache, ETag=idp.discovery_etag))
+                    else:
+                        self._send(200, idp.discovery(), dict(cache, ETag=idp.discovery_etag))
+                elif path == '/jwks':
+                    self._send(200, idp.jwks, cache)
+                elif path == '/userinfo':
+                    if not self.headers.get('Authorization', '').startswith('Bearer '):
+                        self._send(401, {'error': 'invalid_token'})
+                    else:
+                        self._send(200, idp.claims)
+                else:
+                    self._send(404, {'error': 'not_found'})
+
+            def do_POST(self):
+                path = self._begin()
+                length = int(self.headers.get('Content-Length') or 0)
+                form = parse_qs(self.rfile.read(length).decode())
+                if self._failing(path):
+                    return
+                if path == '/token' and form.get('code'):
+                    self._send(200, dict({'access_token': 'stub-access-token', 'token_type': 'Bearer',
+                                          'expires_in': 300}, **idp.tokens))
+                else:
+                    self._send(400, {'error': 'invalid_request'})
+
+        return Handler
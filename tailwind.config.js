@@ -0,0 +1,26 @@
+// Tailwind theme for the static CSS build (npm run build:css). Only classes
+// found in the files under `content` are emitted. The inline config in
+// templates/base.html is the fallback used when there is no build: keep the
+// two in step.
+module.exports = {
+  content: [
+    './templates/**/*.html',
+    './static/js/**/*.js',
+    '!./static/dist/**',
+  ],
+  theme: {
+    extend: {
+      colors: {
+        brand: '#2563eb',
+        'brand-hover': '#1d4ed8',
+        'brand-light': '#dbeafe',
+      },
+      fontFamily: { inter: ['Inter', 'sans-serif'] },
+      spacing: {
+        '18': '4.5rem',
+        '88': '22rem',
+      },
+    },
+  },
+  plugins: [],
+};
@@ -0,0 +1,99 @@
+from app import decode_cursor, encode_cursor
+
+
+def _add_tools(app, user_id, names):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        conn.executemany(
+            "INSERT INTO tools (name, description, value, brand, created_by) VALUES (?, '', 1, 'Acme', ?)",
+            [(name, user_id) for name in names],
+        )
+        conn.commit()
+
+
+def _walk(client, **params):
+    """Follow next_cursor to the end, returning ids and every pagination block"""
+    ids, pages = [], []
+    cursor = ''
+    while cursor is not None:
+        resp = client.get('/api/tools', query_string={**params, 'cursor': cursor})
+        assert resp.status_code == 200
+        data = resp.get_json()
+        ids += [t['id'] for t in data['tools']]
+        pages.append(data['pagination'])
+        cursor = data['pagination']['next_cursor']
+    return ids, pages
+
+
+def _offset_ids(client, **params):
+    ids, page = [], 1
+    while True:
+        data = client.get('/api/tools', query_string={**params, 'page': page}).get_json()
+        ids += [t['id'] for t in data['tools']]
+        if not data['pagination']['has_next']:
+            return ids
+        page += 1
+
+
+def test_cursor_pages_match_offset_pages(app, client, user_id):
+    _add_tools(app, user_id, [f"Wrench {i}" for i in range(35)])
+    ids, pages = _walk(client, per_page=10)
+    assert ids == _offset_ids(client, per_page=10)
+    assert len(ids) == 35
+    assert [p['has_next'] for p in pages] == [True, True, True, False]
+    assert all('total_count' not in p for p in pages)
+
+
+def test_cursor_carries_total(app, client, user_id):
+    _add_tools(app, user_id, [f"Clamp {i}" for i in range(25)])
+    _, pages = _walk(client, per_page=10, include_total=1)
+    assert [p['total_count'] for p in pages] == [25, 25, 25]
+    assert decode_cursor(pages[0]['next_cursor'])['total'] == 25
+
+
+def test_search_cursor_pages_in_id_order(app, client, user_id):
+    _add_tools(app, user_id, [f"Drill {'bit ' * (i % 4)}{i}" for i in range(23)])
+    ids, _ = _walk(client, per_page=10, search='drill')
+    assert ids == sorted(_offset_ids(client, per_page=10, search='drill'))
+    assert len(set(ids)) == 23
+
+
+def test_search_cursor_survives_writes_between_pages(app, client, user_id):
+    _add_tools(app, user_id, [f"Drill {'bit ' * (i % 4)}{i}" for i in range(25)])
+    first = client.get('/api/tools', query_string={'search': 'drill', 'per_page': 10, 'cursor': ''}).get_json()
+    ids = [t['id'] for t in first['tools']]
+    # Other users' writes change the index statistics bm25() scores with
+    _add_tools(app, f'{user_id}-other', [f"Drill bit drill {i}" for i in range(50)])
+    _add_tools(app, user_id, ['Zebra'])
+
+    cursor = first['pagination']['next_cursor']
+    while cursor:
+        data = client.get('/api/tools', query_string={'search': 'drill', 'per_page': 10, 'cursor': cursor}).get_json()
+        ids += [t['id'] for t in data['tools']]
+        cursor = data['pagination']['next_cursor']
+    assert len(ids) == len(set(ids)) == 25
+
+
+def test_search_pages_keep_ranked_order(app, client, user_id):
+    _add_tools(app, user_id, [f"Drill bit bit bit {i}" for i in range(15)] + [f"Drill {i}" for i in range(5)])
+    all_ids = _offset_ids(client, per_page=20)
+    ids = _offset_ids(client, per_page=10, search='drill')
+    # The short names rank best though they were added last
+    assert sorted(ids[:5]) == all_ids[15:]
+    assert sorted(ids) == all_ids
+
+
+def test_invalid_cursor_rejected(client):
+    assert client.get('/api/tools?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/tools', query_string={'cursor': encode_cursor({'id': 'x'})}).status_code == 400
+
+
+def test_offset_contract_unchanged(app, client, user_id):
+    _add_tools(app, user_id, [f"Saw {i}" for i in range(12)])
+    data = client.get('/api/tools?page=2&per_page=10').get_json()
+    assert len(data['tools']) == 2
+    assert data['pagination'] == {
+        'page': 2, 'per_page': 10, 'total_count': 12, 'total_pages': 2,
+        'has_next': False, 'has_prev': True,
+    }
@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+
+import pytest
+from flask import url_for
+
+from assets import AssetManifest, StaticHashes
+
+
+@pytest.fixture
+def manifest(app, tmp_path, monkeypatch):
+    path = tmp_path / 'manifest.json'
+    monkeypatch.setitem(app.extensions, 'assets', AssetManifest(str(path)))
+    return path
+
+
+def test_pages_use_the_built_bundles(client, manifest):
+    manifest.write_text(json.dumps({
+        'app.js': 'app-3F2K9QZA.js',
+        'brand-logos.js': 'brand-logos-7HX2M4PB.js',
+        'tailwind.css': 'tailwind-0123456789.css',
+    }))
+    html = client.get('/').get_data(as_text=True)
+    assert '<script src="/static/dist/app-3F2K9QZA.js" defer></script>' in html
+    assert '/static/dist/brand-logos-7HX2M4PB.js' in html
+    assert '<link rel="stylesheet" href="/static/dist/tailwind-0123456789.css">' in html
+    assert 'unpkg.com' not in html and 'cdn.tailwindcss.com' not in html
+    assert 'text/babel' not in html
+
+
+def test_without_a_build_pages_fall_back_to_the_cdn(client, manifest):
+    html = client.get('/').get_data(as_text=True)
+    assert 'https://unpkg.com/babel-standalone@6/babel.min.js' in html
+    assert '<script type="text/babel" src="/static/js/app.js?v=' in html
+    assert 'https://cdn.tailwindcss.com' in html
+    assert '/static/js/brand-logos.js?v=' in html
+
+
+def test_manifest_is_reread_when_rebuilt(app, manifest):
+    manifest.write_text(json.dumps({'app.js': 'app-AAAA.js'}))
+    assets = app.extensions['assets']
+    assert assets.get('app.js') == 'app-AAAA.js'
+    manifest.write_text(json.dumps({'app.js': 'app-BBBB.js'}))
+    os.utime(manifest, (1, 1))  # a different mtime, however fast the rebuild
+    assert assets.get('app.js') == 'app-BBBB.js'
+    manifest.unlink()
+    assert assets.get('app.js') is None
+
+
+def test_real_build_is_served_by_assets(app, client):
+    """Checks `npm run build` output, when there is one, the way the templates use it"""
+    entries = app.extensions['assets'].entries()
+    if not entries:
+        pytest.skip('frontend not built (npm run build)')
+    with app.test_request_context():
+        urls = {name: app.jinja_env.globals['asset_url'](name) for name in entries}
+    for name, url in urls.items():
+        stem, ext = os.path.splitext(name)
+        assert url.startswith(f'/static/dist/{stem}-') and url.endswith(ext)
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert 'immutable' in resp.headers['Cache-Control']
+
+
+@pytest.fixture
+def static_dir(app, tmp_path, monkeypatch):
+    folder = tmp_path / 'static'
+    (folder / 'js').mkdir(parents=True)
+    monkeypatch.setattr(app, 'static_folder', str(folder))
+    monkeypatch.setitem(app.extensions, 'static_hashes', StaticHashes(str(folder)))
+    return folder
+
+
+def test_static_urls_carry_a_content_hash(app, static_dir):
+    script = static_dir / 'js' / 'lend.js'
+    script.write_text('console.log(1);')
+    with app.test_request_context():
+        first = url_for('static', filename='js/lend.js')
+        assert first.startswith('/static/js/lend.js?v=')
+        assert url_for('static', filename='dist/app-3F2K9QZA.js') == '/static/dist/app-3F2K9QZA.js'
+        assert url_for('static', filename='js/missing.js') == '/static/js/missing.js'
+        script.write_text('console.log(2);')
+        assert url_for('static', filename='js/lend.js') != first
+
+
+def test_versioned_static_urls_are_immutable(app, static_dir):
+    (static_dir / 'js' / 'lend.js').write_text('console.log(1);')
+    (static_dir / 'dist').mkdir()
+    (static_dir / 'dist' / 'app-3F2K9QZA.js').write_text('app();')
+    client = app.test_client()
+    with app.test_request_context():
+        versioned = url_for('static', filename='js/lend.js')
+
+    for url in (versioned, '/static/dist/app-3F2K9QZA.js'):
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    # Without the version, or with one for older content, clients must revalidate
+    for url in ('/static/js/lend.js', '/static/js/lend.js?v=0123456789ab'):
+        resp = client.get(url)
+        assert resp.get_data(as_text=True) == 'console.log(1);'
+        assert resp.headers['Cache-Control'] == 'no-cache'
+
+
+def test_precompressed_copies_follow_accept_encoding(app, static_dir):
+    source = 'const tools = [];\n' * 200
+    script = static_dir / 'js' / 'app.js'
+    script.write_text(source)
+    (static_dir / 'js' / 'app.js.gz').write_bytes(gzip.compress(source.encode()))
+    (static_dir / 'js' / 'app.js.br').write_bytes(b'brotli bytes')
+    client = app.test_client()
+
+    resp = client.get('/static/js/app.js', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert resp.get_data() == b'brotli bytes'
+
+    resp = client.get('/static/js/app.js', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Content-Type'].startswith('text/javascript')
+    assert gzip.decompress(resp.get_data()).decode() == source
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+    resp = client.get('/static/js/app.js')
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_data(as_text=True) == source
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+    # A copy older than the file it was made from is stale
+    os.utime(static_dir / 'js' / 'app.js.br', (1, 1))
+    resp = client.get('/static/js/app.js', headers={'Accept-Encoding': 'br'})
+    assert 'Content-Encoding' not in resp.headers
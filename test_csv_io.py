@@ -0,0 +1,148 @@
+import io
+import sqlite3
+
+import pytest
+
+import csv_io
+
+
+def _upload(client, text, name='tools.csv'):
+    data = {'csv_file': (io.BytesIO(text if isinstance(text, bytes) else text.encode('utf-8')), name)}
+    return client.post('/user/import/tools', data=data, content_type='multipart/form-data', follow_redirects=True)
+
+
+def _tool_names(app, user_id):
+    with app.app_context():
+        from db import get_db
+        return sorted(r['name'] for r in get_db().execute(
+            "SELECT name FROM tools WHERE created_by = ?", (user_id,)))
+
+
+def _csv(rows, has_created_at=True):
+    lines = [','.join(csv_io.tool_headers(has_created_at))]
+    lines += rows
+    return '\n'.join(lines) + '\n'
+
+
+def test_import_inserts_in_batches(app, client, user_id):
+    rows = [f'Tool {i:04d},desc,{i}.5,Brand,M{i},S{i},2024-01-01,' for i in range(1234)]
+    response = _upload(client, _csv(rows))
+    assert b'Successfully imported 1234 tools!' in response.data
+    names = _tool_names(app, user_id)
+    assert len(names) == 1234 and names[0] == 'Tool 0000'
+
+
+def test_import_is_all_or_nothing(app, client, user_id):
+    rows = [f'Tool {i},desc,1,Brand,,,,' for i in range(600)]
+    rows += [',missing name,1,,,,,' for _ in range(7)]
+    rows.append('Bad,desc,not-a-number,,,,,')
+    response = _upload(client, _csv(rows))
+    assert b'Import failed with 8 error(s). No tools were imported.' in response.data
+    assert response.data.count(b'Error: Row') == 5
+    assert _tool_names(app, user_id) == []
+
+
+def test_import_is_retried_when_the_database_is_busy(app, client, user_id, monkeypatch):
+    import_tools_csv = csv_io.import_tools_csv
+    calls = []
+
+    def busy_once(conn, *args, **kwargs):
+        result = import_tools_csv(conn, *args, **kwargs)
+        calls.append(result.imported)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return result
+
+    monkeypatch.setattr(csv_io, 'import_tools_csv', busy_once)
+    monkeypatch.setitem(app.config, 'SQLITE_BUSY_BACKOFF', 0)
+    response = _upload(client, _csv([f'Tool {i},desc,1,Brand,,,,' for i in range(30)]))
+    assert calls == [30, 30]
+    assert b'Successfully imported 30 tools!' in response.data
+    assert len(_tool_names(app, user_id)) == 30
+
+
+def test_import_rejects_bad_encoding_and_headers(app, client, user_id):
+    response = _upload(client, _csv(['Caf\xe9,,,,,,,']).encode('latin-1'))
+    assert b'must be UTF-8 encoded' in response.data
+    response = _upload(client, 'Name,Value\nHammer,1\n')
+    assert b'Invalid CSV format' in response.data
+    assert _tool_names(app, user_id) == []
+
+
+def test_import_result_counts_rate():
+    import sqlite3
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE tools (name, description, value, brand, model_number, serial_number, "
+                 "acquisition_date, created_by)")
+    stream = io.BytesIO(_csv(['A,,1,,,,', 'B,,,,,,', 'C,,2,,,,'], has_created_at=False).encode())
+    result = csv_io.import_tools_csv(conn, stream, 'u1', False, batch_size=2)
+    assert (result.rows, result.imported, result.error_count) == (3, 3, 0)
+    assert result.rows_per_second > 0
+    assert not stream.closed
+    assert conn.execute("SELECT COUNT(*) FROM tools").fetchone()[0] == 3
+
+
+def test_export_streams_round_trip(app, client, user_id):
+    rows = [f'Tool {i:04d},"desc, with comma",{i},Brand,,,2024-01-01,' for i in range(1, 1201)]
+    _upload(client, _csv(rows))
+    response = client.get('/user/export/tools')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    assert 'attachment' in response.headers['Content-Disposition']
+    exported = list(csv_io.csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(exported) == 1200
+    assert exported[0]['Name'] == 'Tool 0001' and exported[0]['Description'] == 'desc, with comma'
+
+    # Imports the export unchanged
+    response = _upload(client, response.get_data())
+    assert b'Successfully imported 1200 tools!' in response.data
+
+
+def test_export_stream_holds_no_pooled_connection(app, client, user_id):
+    from db import get_pool
+    _upload(client, _csv([f'Tool {i},,1,,,,,' for i in range(3)]))
+    response = client.get('/user/export/tools', buffered=False)
+    chunks = response.response
+    assert next(iter(chunks)).startswith(b'Name,')
+    # A slow download leaves the pool to other requests
+    assert get_pool(app).stats()['in_use'] == 0
+    assert b''.join(chunks).count(b'Tool ') == 3
+    response.close()
+
+
+def test_export_chunks_by_fetchmany():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE tools (name, description, value, brand, model_number, serial_number, "
+                 "acquisition_date, created_by)")
+    conn.executemany("INSERT INTO tools (name, value, created_by) VALUES (?, ?, 'u1')",
+                     [(f'T{i}', i) for i in range(5)])
+    chunks = list(csv_io.export_tools_csv(conn, 'u1', False, chunk_size=2))
+    assert len(chunks) == 4  # header + 2 + 2 + 1
+    assert chunks[1] == b'T0,,,,,,\r\nT1,,1,,,,\r\n'
+
+
+def test_export_query_errors_flash_and_redirect(app, client, monkeypatch):
+    def locked(conn, user_id, has_created_at):
+        raise sqlite3.OperationalError('database is locked')
+        yield
+
+    monkeypatch.setattr(csv_io, 'export_tools_csv', locked)
+    response = client.get('/user/export/tools')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/user/settings')
+    with client.session_transaction() as sess:
+        assert sess['_flashes'] == [('message', 'Error exporting tools: database is locked')]
+
+
+def test_export_errors_mid_stream_are_logged_and_abort_the_download(app, client, monkeypatch, caplog):
+    def fails_later(conn, user_id, has_created_at):
+        yield b'Name\r\n'
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(csv_io, 'export_tools_csv', fails_later)
+    response = client.get('/user/export/tools')
+    assert response.status_code == 200
+    with pytest.raises(sqlite3.OperationalError):
+        response.get_data()
+    assert 'failed mid-stream: disk I/O error' in caplog.text
@@ -0,0 +1,111 @@
+import io
+
+import pytest
+
+import csv_io
+import data_version
+
+
+def _run(app, sql, *params):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        cursor = conn.execute(sql, params)
+        conn.commit()
+        return cursor.lastrowid
+
+
+def _version(app, user_id):
+    with app.app_context():
+        from db import get_db
+        return data_version.current(get_db(), user_id)
+
+
+@pytest.fixture
+def tool(app, user_id):
+    return _run(app, "INSERT INTO tools (name, value, created_by) VALUES ('Saw', 10, ?)", user_id)
+
+
+@pytest.fixture
+def person(app, user_id):
+    return _run(app, "INSERT INTO people (name, created_by) VALUES ('Ann', ?)", user_id)
+
+
+@pytest.fixture
+def loan(app, tool, person):
+    return _run(app, "INSERT INTO loans (tool_id, person_id, lent_on) VALUES (?, ?, '2024-01-01')", tool, person)
+
+
+def _csv():
+    text = io.StringIO()
+    text.write(','.join(csv_io.tool_headers(True)) + '\n')
+    text.write('Drill,,5,Acme,,,,\n')
+    return io.BytesIO(text.getvalue().encode('utf-8'))
+
+
+WRITES = {
+    'add_tool': lambda client, ids: client.post('/add', data={'name': 'Drill'}),
+    'edit_tool': lambda client, ids: client.post(f"/edit/{ids['tool']}", data={'name': 'Hand saw', 'value': '12'}),
+    'delete_tool': lambda client, ids: client.post(f"/delete/{ids['tool']}"),
+    'lend_tool': lambda client, ids: client.post(f"/lend/{ids['tool']}",
+                                                 data={'person_id': ids['person'], 'lent_date': '2024-03-01'}),
+    'return_tool': lambda client, ids: client.post(f"/return/{ids['loan_tool']}"),
+    'edit_loan': lambda client, ids: client.post(f"/edit_loan/{ids['loan']}",
+                                                 data={'lent_date': '2024-01-02', 'returned_date': ''}),
+    'add_person': lambda client, ids: client.post('/add_person', data={'name': 'Bob', 'contact_info': ''}),
+    'edit_person': lambda client, ids: client.post(f"/people/{ids['person']}/edit",
+                                                   data={'name': 'Ann B', 'contact_info': 'ann@example.com'}),
+    'delete_person': lambda client, ids: client.post(f"/people/{ids['person']}/delete"),
+    'import_tools': lambda client, ids: client.post('/user/import/tools', content_type='multipart/form-data',
+                                                    data={'csv_file': (_csv(), 'tools.csv')}),
+    'api_tools': lambda client, ids: client.post('/api/tools', json={'name': 'Drill'}),
+    'api_lend_batch': lambda client, ids: client.post('/api/loans/batch/lend', json={
+        'person_id': ids['person'], 'items': [{'tool_id': ids['tool']}]}),
+    'api_return_batch': lambda client, ids: client.post('/api/loans/batch/return',
+                                                        json={'items': [{'tool_id': ids['loan_tool']}]}),
+}
+
+
+@pytest.mark.parametrize('route', WRITES)
+def test_every_write_route_bumps_the_version(app, client, user_id, tool, person, loan, route):
+    # A second tool and person with nothing lent, for the routes that refuse otherwise
+    ids = {
+        'tool': _run(app, "INSERT INTO tools (name, created_by) VALUES ('Plane', ?)", user_id),
+        'person': _run(app, "INSERT INTO people (name, created_by) VALUES ('Cy', ?)", user_id),
+        'loan': loan,
+        'loan_tool': tool,
+    }
+    before = _version(app, user_id)
+    resp = WRITES[route](client, ids)
+    assert resp.status_code in (200, 201, 302)
+    assert _version(app, user_id) > before
+
+
+def test_refused_writes_leave_the_version_alone(app, client, user_id, tool, person, loan):
+    before = _version(app, user_id)
+    client.post(f"/delete/{tool}")  # lent out
+    client.post(f"/people/{person}/delete")  # has loans
+    client.post('/add', data={'name': 'Drill', 'value': 'lots'})
+    client.post('/user/import/tools', content_type='multipart/form-data',
+                data={'csv_file': (io.BytesIO(b'Name\nDrill\n'), 'tools.csv')})
+    assert _version(app, user_id) == before
+
+
+def test_other_users_writes_leave_the_version_alone(app, client, user_id):
+    before = _version(app, user_id)
+    other = f"{user_id}-other"
+    _run(app, "INSERT INTO users (id, email, name) VALUES (?, ?, 'Other')", other, f"{other}@example.com")
+    _run(app, "INSERT INTO tools (name, created_by) VALUES ('Saw', ?)", other)
+    assert _version(app, user_id) == before
+
+
+def test_versioned_keys_change_with_the_data(app, user_id):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        key = data_version.versioned_key(conn, user_id, 'api', '/api/tools?')
+        assert key == f"{user_id}:v0:api:/api/tools?"
+        assert data_version.versioned_key(conn, user_id, 'api', '/api/tools?') == key
+        conn.execute("INSERT INTO tools (name, created_by) VALUES ('Saw', ?)", (user_id,))
+        conn.commit()
+        assert data_version.versioned_key(conn, user_id, 'api', '/api/tools?') == f"{user_id}:v1:api:/api/tools?"
@@ -0,0 +1,144 @@
+import os
+import threading
+import pytest
+from db import HOT_QUERIES, ConnectionPool, PoolExhausted
+
+
+def test_pool_reuses_warm_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'sub' / 'pool.db'), size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats['opens'] == 1
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 1
+
+
+def test_pool_applies_pragmas_once(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), pragmas={'cache_size': -4096})
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+
+
+def test_pool_rolls_back_on_release(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=1)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn)
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolExhausted):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+    # A waiter is handed the connection as soon as it is released
+    pool.timeout = 5
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert pool.stats()['waits'] == 2
+
+
+def test_pool_drops_connections_after_fork(tmp_path, monkeypatch):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'))
+    pool.release(pool.acquire())
+    parent_pid = os.getpid()
+    monkeypatch.setattr(os, 'getpid', lambda: parent_pid + 1)
+    pool.acquire()
+    assert pool.stats()['opens'] == 1
+    assert pool.stats()['idle'] == 0
+
+
+def test_health_reports_pool_stats(app):
+    resp = app.test_client().get('/health')
+    assert resp.status_code == 200
+    assert resp.get_json()['db_pool']['size'] == app.config['DB_POOL_SIZE']
+
+
+def test_storage_profile_applied(app):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+
+def test_storage_profile_only_reads_a_current_journal_mode(tmp_path):
+    import sqlite3
+    from db import apply_storage_profile
+    conn = sqlite3.connect(str(tmp_path / 'profile.db'))
+    assert apply_storage_profile(conn, {'journal_mode': 'WAL'}) == 'wal'
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert apply_storage_profile(conn, {'journal_mode': 'WAL'}) == 'wal'
+    assert statements == ["PRAGMA journal_mode"]
+    assert apply_storage_profile(conn, {'journal_mode': 'DELETE'}) == 'delete'
+
+
+def test_busy_retry_reruns_view(app):
+    import sqlite3
+    from db import busy_retry
+    calls = []
+
+    @busy_retry
+    def view():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return 'ok'
+
+    with app.app_context():
+        app.config['SQLITE_BUSY_BACKOFF'] = 0
+        try:
+            assert view() == 'ok'
+        finally:
+            app.config['SQLITE_BUSY_BACKOFF'] = 0.05
+    assert len(calls) == 3
+
+
+def test_busy_retry_gives_up(app):
+    import sqlite3
+    from db import busy_retry
+
+    @busy_retry
+    def view():
+        raise sqlite3.OperationalError('database is locked')
+
+    with app.app_context():
+        app.config.update(SQLITE_BUSY_BACKOFF=0, SQLITE_BUSY_RETRIES=1)
+        try:
+            with pytest.raises(sqlite3.OperationalError):
+                view()
+        finally:
+            app.config.update(SQLITE_BUSY_BACKOFF=0.05, SQLITE_BUSY_RETRIES=3)
+
+
+def test_managed_indexes_exist(app):
+    from db import INDEXES, ensure_indexes
+    with app.app_context():
+        from db import get_db
+        assert ensure_indexes(get_db()) == []
+        names = {r[0] for r in get_db().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert set(INDEXES) <= names
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_avoids_full_scan(app, name):
+    from db import full_table_scans, get_db
+    sql, params = HOT_QUERIES[name]
+    with app.app_context():
+        assert full_table_scans(get_db(), sql, params) == [], f"{name} falls back to a full table scan"
@@ -0,0 +1,108 @@
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+import app as app_module
+import data_version
+import migrations
+
+
+def _add_tools(app, user_id, count, description='x' * 40):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        conn.executemany(
+            "INSERT INTO tools (name, description, value, brand, created_by) VALUES (?, ?, 1, 'Acme', ?)",
+            [(f"Tool {i}", description, user_id) for i in range(count)],
+        )
+        conn.commit()
+
+
+def test_unchanged_data_is_answered_with_304_without_running_the_view(app, client, user_id, monkeypatch):
+    _add_tools(app, user_id, 3)
+    first = client.get('/api/brands')
+    assert first.status_code == 200 and first.get_json() == ['Acme']
+    tag = first.headers['ETag']
+    assert tag.startswith('W/"')
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    def no_queries():
+        raise AssertionError('the view ran')
+
+    monkeypatch.setattr(app_module, 'get_conn', no_queries)
+    resp = client.get('/api/brands', headers={'If-None-Match': tag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == tag
+    assert resp.get_data() == b''
+
+
+def test_writes_change_the_etag(app, client, user_id):
+    _add_tools(app, user_id, 3)
+    tag = client.get('/api/tools').headers['ETag']
+    assert client.get('/api/tools', headers={'If-None-Match': tag}).status_code == 304
+
+    assert client.post('/api/tools', json={'name': 'Chisel'}).status_code == 201
+    resp = client.get('/api/tools', headers={'If-None-Match': tag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != tag
+    assert 'Chisel' in [t['name'] for t in resp.get_json()['tools']]
+
+
+def test_etags_differ_per_url_and_user(app, client, user_id):
+    _add_tools(app, user_id, 3)
+    tags = {client.get(url).headers['ETag'] for url in ('/api/tools', '/api/tools?brand=Acme', '/api/brands')}
+    assert len(tags) == 3
+
+
+def test_large_json_is_compressed(app, client, user_id):
+    _add_tools(app, user_id, 30)
+    resp = client.get('/api/tools', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    body = gzip.decompress(resp.get_data())
+    assert int(resp.headers['Content-Length']) == len(resp.get_data()) < len(body)
+    assert len(json.loads(body)['tools']) == 20
+
+    plain = client.get('/api/tools')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data() == body
+    # The ETag is weak, so it holds for either encoding
+    assert plain.headers['ETag'] == resp.headers['ETag']
+
+
+def test_small_json_is_left_alone(client):
+    resp = client.get('/api/brands', headers={'Accept-Encoding': 'gzip'})
+    assert resp.get_json() == []
+    assert 'Content-Encoding' not in resp.headers
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO users (id, email, name) VALUES ('u1', 'u1@example.com', 'U1')")
+    conn.execute("INSERT INTO users (id, email, name) VALUES ('u2', 'u2@example.com', 'U2')")
+    yield conn
+    conn.close()
+
+
+def test_every_change_to_a_users_data_bumps_their_version(conn):
+    versions = []
+
+    def run(sql, *params):
+        conn.execute(sql, params)
+        versions.append((data_version.current(conn, 'u1'), data_version.current(conn, 'u2')))
+
+    run("INSERT INTO tools (id, name, created_by) VALUES (1, 'Saw', 'u1')")
+    run("UPDATE tools SET brand = 'Acme' WHERE id = 1")
+    run("INSERT INTO people (id, name, created_by) VALUES (1, 'Ann', 'u1')")
+    run("UPDATE people SET contact_info = 'ann@example.com' WHERE id = 1")
+    run("INSERT INTO loans (id, tool_id, person_id, lent_on) VALUES (1, 1, 1, '2024-01-01')")
+    run("UPDATE loans SET returned_on = '2024-02-01' WHERE id = 1")
+    run("DELETE FROM loans WHERE id = 1")
+    run("DELETE FROM people WHERE id = 1")
+    run("UPDATE tools SET created_by = 'u2' WHERE id = 1")  # both owners see a change
+    run("DELETE FROM tools WHERE id = 1")
+    assert versions == [(1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (8, 0), (9, 1), (9, 2)]
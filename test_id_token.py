@@ -0,0 +1,89 @@
+import base64
+import json
+import time
+
+import pytest
+
+from id_token import IDTokenError, UnknownKeyError, verify_id_token
+from stub_idp import public_jwk, sign_jwt
+
+ISSUER = 'https://idp.example.com'
+CLIENT_ID = 'tooltracker'
+KID = 'key-1'
+JWKS = {'keys': [public_jwk(KID)]}
+
+
+def _claims(**overrides):
+    now = int(time.time())
+    claims = {'iss': ISSUER, 'aud': CLIENT_ID, 'sub': 'u1', 'email': 'u1@example.com',
+              'iat': now, 'exp': now + 300, 'nonce': 'n-1'}
+    claims.update(overrides)
+    return {k: v for k, v in claims.items() if v is not None}
+
+
+def _verify(token, jwks, **kwargs):
+    kwargs.setdefault('nonce', 'n-1')
+    return verify_id_token(token, jwks, ISSUER, CLIENT_ID, **kwargs)
+
+
+def test_rs256_token_verifies():
+    claims = _verify(sign_jwt(_claims(), kid=KID), JWKS)
+    assert claims['sub'] == 'u1' and claims['email'] == 'u1@example.com'
+
+
+def test_tampered_payload_is_rejected():
+    header, _, signature = sign_jwt(_claims(), kid=KID).split('.')
+    forged = base64.urlsafe_b64encode(json.dumps(_claims(sub='admin')).encode()).rstrip(b'=').decode()
+    with pytest.raises(IDTokenError, match='bad signature'):
+        _verify(f'{header}.{forged}.{signature}', JWKS)
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'iss': 'https://evil.example.com'}, 'issuer'),
+    ({'aud': 'someone-else'}, 'audience'),
+    ({'aud': [CLIENT_ID, 'other']}, 'azp'),
+    ({'exp': int(time.time()) - 3600}, 'expired'),
+    ({'exp': None}, 'expired'),
+    ({'nonce': 'replayed'}, 'nonce'),
+    ({'nonce': None}, 'nonce'),
+])
+def test_claims_are_checked(overrides, message):
+    with pytest.raises(IDTokenError, match=message):
+        _verify(sign_jwt(_claims(**overrides), kid=KID), JWKS)
+
+
+def test_unknown_key_is_reported_separately():
+    token = sign_jwt(_claims(), kid='rotated-key')
+    with pytest.raises(UnknownKeyError):
+        _verify(token, JWKS)
+
+
+@pytest.mark.parametrize('header', [b'{"alg":"none"}', b'{"alg":1}', b'{"alg":["RS","256"]}', b'{"alg":null}'])
+def test_unsigned_tokens_are_rejected(header):
+    header = base64.urlsafe_b64encode(header).rstrip(b'=').decode()
+    payload = base64.urlsafe_b64encode(json.dumps(_claims()).encode()).rstrip(b'=').decode()
+    with pytest.raises(IDTokenError, match='unsupported'):
+        _verify(f'{header}.{payload}.', JWKS)
+    with pytest.raises(IDTokenError, match='malformed'):
+        _verify('not-a-jwt', JWKS)
+
+
+@pytest.mark.parametrize('field, value', [('n', 12345), ('e', ['AQAB']), ('n', {'x': 1}), ('e', 'AQ\u00e9B'),
+                                          ('n', 'not*base64')])
+def test_malformed_jwks_keys_are_rejected(field, value):
+    jwks = {'keys': [dict(public_jwk(KID), **{field: value})]}
+    with pytest.raises(IDTokenError, match='malformed JWKS key'):
+        _verify(sign_jwt(_claims(), kid=KID), jwks)
+
+
+def test_jwks_entries_that_are_not_objects_are_skipped():
+    assert _verify(sign_jwt(_claims(), kid=KID), {'keys': ['not-a-key', public_jwk(KID)]})['sub'] == 'u1'
+
+
+def test_hs256_uses_the_client_secret():
+    token = sign_jwt(_claims(), alg='HS256', secret='s3cret')
+    assert _verify(token, None, client_secret='s3cret')['sub'] == 'u1'
+    with pytest.raises(IDTokenError, match='bad signature'):
+        _verify(token, None, client_secret='wrong')
+    with pytest.raises(IDTokenError, match='no client secret'):
+        _verify(token, None)
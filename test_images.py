@@ -0,0 +1,433 @@
+import io
+import os
+import sqlite3
+import time
+
+from PIL import Image, JpegImagePlugin
+
+import images
+import migrations
+
+
+def _png(size=(2000, 1500), mode='RGBA'):
+    """A solid image in a random colour, so uploads from different tests never deduplicate"""
+    buf = io.BytesIO()
+    color = tuple(os.urandom(3)) + ((255,) if mode == 'RGBA' else ())
+    Image.new(mode, size, color).save(buf, 'PNG')
+    buf.seek(0)
+    return buf
+
+
+def _tool(app, user_id, name):
+    with app.app_context():
+        from db import get_db
+        return get_db().execute(
+            "SELECT id, image_path, image_status FROM tools WHERE created_by = ? AND name = ?", (user_id, name)
+        ).fetchone()
+
+
+def _jobs(app, tool_id):
+    with app.app_context():
+        from db import get_db
+        return get_db().execute("SELECT * FROM image_jobs WHERE tool_id = ?", (tool_id,)).fetchall()
+
+
+def _path(app, image_path):
+    return os.path.join(app.config['UPLOAD_FOLDER'], images.image_relpath(image_path))
+
+
+def _top_level_files(app):
+    folder = app.config['UPLOAD_FOLDER']
+    return {name for name in os.listdir(folder) if os.path.isfile(os.path.join(folder, name))}
+
+
+def test_upload_is_processed_and_original_replaced(app, client, user_id):
+    before = _top_level_files(app)
+    client.post('/add', data={'name': 'Drill', 'image': (_png(), 'photo.png')},
+                content_type='multipart/form-data')
+    tool = _tool(app, user_id, 'Drill')
+    assert tool['image_status'] == images.STATUS_READY
+    assert images.is_content_path(images.image_relpath(tool['image_path']))
+    assert tool['image_path'].endswith('.jpg')
+    with Image.open(_path(app, tool['image_path'])) as img:
+        assert img.size == (1024, 768)
+    base, ext = os.path.splitext(_path(app, tool['image_path']))
+    for width in (96, 200, 480):
+        assert os.path.isfile(f"{base}_{width}w.jpg")
+        assert os.path.isfile(f"{base}_{width}w.webp")
+    assert os.path.isfile(base + '.webp')
+    # The staged original is gone once processed
+    assert _top_level_files(app) == before
+    assert _jobs(app, tool['id']) == []
+
+
+def test_rejects_files_that_are_not_images(app, client, user_id):
+    response = client.post('/add', data={'name': 'Saw', 'image': (io.BytesIO(b'not an image'), 'saw.jpg')},
+                           content_type='multipart/form-data')
+    assert b'Error processing image' in response.data
+    assert _tool(app, user_id, 'Saw') is None
+
+
+def _queue_original(app, user_id, name, data):
+    filename = images.original_filename(f"queued_{name}.png")
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as f:
+        f.write(data)
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        tool_id = conn.execute(
+            "INSERT INTO tools (name, image_path, created_by) VALUES (?, ?, ?)",
+            (name, os.path.join('images', filename), user_id),
+        ).lastrowid
+        images.enqueue(conn, tool_id, filename)
+        conn.commit()
+    return tool_id
+
+
+def test_worker_pool_processes_queue_in_background(app, user_id):
+    tool_id = _queue_original(app, user_id, 'Sander', _png((400, 300)).getvalue())
+    assert _tool(app, user_id, 'Sander')['image_status'] == images.STATUS_PENDING
+
+    pool = images.ImageWorkerPool(app, size=2, poll_interval=0.05)
+    try:
+        pool.wake()
+        deadline = time.monotonic() + 10
+        while _tool(app, user_id, 'Sander')['image_status'] != images.STATUS_READY:
+            assert time.monotonic() < deadline, 'image job was not processed'
+            time.sleep(0.02)
+    finally:
+        pool.stop()
+    assert images.is_content_path(images.image_relpath(_tool(app, user_id, 'Sander')['image_path']))
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'queued_Sander_orig.png'))
+    assert _jobs(app, tool_id) == []
+
+
+def test_inline_processing_runs_only_the_uploaded_image(app, client, user_id):
+    queued = _queue_original(app, user_id, 'Sander', _png((400, 300)).getvalue())
+    client.post('/add', data={'name': 'Drill', 'image': (_png(), 'photo.png')},
+                content_type='multipart/form-data')
+    assert _tool(app, user_id, 'Drill')['image_status'] == images.STATUS_READY
+    # Jobs queued before the upload are left to the queue
+    [job] = _jobs(app, queued)
+    assert (job['status'], job['attempts']) == ('pending', 0)
+    assert _tool(app, user_id, 'Sander')['image_status'] == images.STATUS_PENDING
+
+
+def test_failed_jobs_are_retried_then_marked_failed(app, user_id):
+    tool_id = _queue_original(app, user_id, 'Broken', b'\x89PNG truncated')
+    for attempt in range(1, app.config['IMAGE_JOB_MAX_ATTEMPTS'] + 1):
+        images.run_pending(app)
+        job = _jobs(app, tool_id)[0]
+        assert job['attempts'] == attempt
+        if attempt < app.config['IMAGE_JOB_MAX_ATTEMPTS']:
+            assert job['status'] == 'pending' and job['available_at'] > time.time()
+            with app.app_context():
+                from db import get_db
+                get_db().execute("UPDATE image_jobs SET available_at = 0 WHERE id = ?", (job['id'],))
+                get_db().commit()
+    assert job['status'] == images.STATUS_FAILED and job['last_error']
+    tool = _tool(app, user_id, 'Broken')
+    # The original stays in place and keeps being served
+    assert tool['image_status'] == images.STATUS_FAILED
+    assert os.path.isfile(_path(app, tool['image_path']))
+
+
+def test_polling_an_empty_queue_only_reads():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn)
+    statements = []
+    conn.set_trace_callback(statements.append)
+
+    assert images.claim_job(conn, 60) is None
+    assert not conn.in_transaction
+    assert [s.split()[0] for s in statements] == ['SELECT']
+
+    conn.execute("INSERT INTO image_jobs (tool_id, filename, available_at) VALUES (1, 'a.png', 0)")
+    conn.commit()
+    assert images.claim_job(conn, 60)['filename'] == 'a.png'
+    assert images.claim_job(conn, 60) is None
+    conn.close()
+
+
+def test_deleting_tool_drops_queued_job_and_files(app, client, user_id):
+    tool_id = _queue_original(app, user_id, 'Clamp', _png((50, 50)).getvalue())
+    original = _path(app, _tool(app, user_id, 'Clamp')['image_path'])
+    client.post(f'/delete/{tool_id}')
+    assert _tool(app, user_id, 'Clamp') is None
+    assert _jobs(app, tool_id) == []
+    assert not os.path.exists(original)
+
+
+def test_render_derivatives_decodes_once_at_reduced_scale(monkeypatch):
+    source = io.BytesIO()
+    Image.new('RGB', (4000, 3000), (10, 120, 200)).save(source, 'JPEG')
+    drafts = []
+    original_draft = JpegImagePlugin.JpegImageFile.draft
+
+    def draft(self, mode, size):
+        drafts.append(size)
+        return original_draft(self, mode, size)
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, 'draft', draft)
+    source.seek(0)
+    extension, outputs = images.render_derivatives(source, [('_thumb', 200), ('', 1024), ('_small', 480)], 85)
+    assert extension == '.jpg'
+    assert drafts == [(1024, 768)]
+    sizes = {name: Image.open(io.BytesIO(data)).size for name, data in outputs.items()}
+    assert sizes == {'.jpg': (1024, 768), '_small.jpg': (480, 360), '_thumb.jpg': (200, 150)}
+
+
+def test_render_derivatives_keeps_small_images_unscaled():
+    source = _png((120, 80), mode='RGB')
+    extension, outputs = images.render_derivatives(source, [('', 1024), ('_thumb', 200)], 85)
+    assert extension == '.jpg'
+    assert {Image.open(io.BytesIO(data)).size for data in outputs.values()} == {(120, 80)}
+
+
+def test_render_derivatives_encodes_extra_formats():
+    extension, outputs = images.render_derivatives(_png((600, 400), mode='RGB'), [('', 1024), ('_96w', 96)], 85,
+                                                   {'webp': 80})
+    assert sorted(outputs) == ['.jpg', '.webp', '_96w.jpg', '_96w.webp']
+    assert Image.open(io.BytesIO(outputs['_96w.webp'])).format == 'WEBP'
+
+
+def test_serve_image_negotiates_width_and_format(app, client, user_id):
+    client.post('/add', data={'name': 'Router', 'image': (_png(), 'router.png')},
+                content_type='multipart/form-data')
+    url = '/data/' + _tool(app, user_id, 'Router')['image_path']
+    webp = {'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8'}
+    legacy = {'Accept': 'image/png,image/*;q=0.8'}
+
+    def served(query, headers):
+        response = client.get(url + query, headers=headers)
+        assert response.status_code == 200
+        assert 'Accept' in response.headers['Vary']
+        img = Image.open(io.BytesIO(response.data))
+        return img.format, img.size
+
+    assert served('', legacy) == ('JPEG', (1024, 768))
+    assert served('', webp) == ('WEBP', (1024, 768))
+    assert served('?w=96', webp) == ('WEBP', (96, 72))
+    assert served('?w=150', legacy) == ('JPEG', (200, 150))
+    assert served('?thumb=1', legacy) == ('JPEG', (200, 150))
+    assert served('?w=5000', legacy) == ('JPEG', (1024, 768))
+
+
+def test_serve_image_falls_back_to_original(app, client):
+    folder = app.config['UPLOAD_FOLDER']
+    # Variants are only generated from JPEG/PNG main images
+    with open(os.path.join(folder, 'legacy_only.gif'), 'wb') as f:
+        Image.new('RGB', (300, 200)).save(f, 'GIF')
+    response = client.get('/data/images/legacy_only.gif?w=96', headers={'Accept': 'image/webp'})
+    assert Image.open(io.BytesIO(response.data)).size == (300, 200)
+    assert client.get('/data/images/missing.jpg').status_code == 404
+
+
+def test_image_responses_are_cacheable_and_revalidate_without_disk(app, client, user_id):
+    client.post('/add', data={'name': 'Grinder', 'image': (_png(), 'grinder.png')},
+                content_type='multipart/form-data')
+    image_path = _tool(app, user_id, 'Grinder')['image_path']
+    url = f'/data/{image_path}?w=96'
+    accept = {'Accept': 'image/webp'}
+    response = client.get(url, headers=accept)
+    assert response.headers['Cache-Control'] == 'private, max-age=31536000, immutable'
+    etag = response.headers['ETag']
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    # Answered from the ETag alone, even with the file gone
+    os.remove(_path(app, image_path).replace('.jpg', '_96w.webp'))
+    response = client.get(url, headers={**accept, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag and 'Accept' in response.headers['Vary']
+
+
+def test_original_is_revalidated_until_processed(app, client, user_id):
+    _queue_original(app, user_id, 'Planer', _png((64, 64)).getvalue())
+    url = '/data/' + _tool(app, user_id, 'Planer')['image_path']
+    response = client.get(url)
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    response = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_x_accel_redirect_offload(app, client, user_id):
+    client.post('/add', data={'name': 'Jigsaw', 'image': (_png((300, 200)), 'jigsaw.png')},
+                content_type='multipart/form-data')
+    filename = images.image_relpath(_tool(app, user_id, 'Jigsaw')['image_path'])
+    app.config['IMAGE_SENDFILE'] = 'x-accel'
+    try:
+        response = client.get(f'/data/images/{filename}')
+    finally:
+        app.config['IMAGE_SENDFILE'] = ''
+    assert response.headers['X-Accel-Redirect'] == f'/protected-images/{filename}'
+    assert response.mimetype == 'image/jpeg' and response.data == b''
+
+
+def test_identical_uploads_share_files_until_last_reference_goes(app, client, user_id):
+    photo = _png((640, 480)).getvalue()
+    for name in ('Left', 'Right'):
+        client.post('/add', data={'name': name, 'image': (io.BytesIO(photo), 'same.png')},
+                    content_type='multipart/form-data')
+    left, right = _tool(app, user_id, 'Left'), _tool(app, user_id, 'Right')
+    assert left['image_path'] == right['image_path']
+    relpath = images.image_relpath(left['image_path'])
+    shard_a, shard_b, name = relpath.split('/')
+    assert name.startswith(shard_a + shard_b)
+    with app.app_context():
+        from db import get_db
+        refcount = get_db().execute("SELECT refcount FROM image_refs WHERE image_path = ?",
+                                    (left['image_path'],)).fetchone()[0]
+    assert refcount == 2
+
+    client.post(f"/delete/{left['id']}")
+    assert os.path.isfile(_path(app, right['image_path']))
+    client.post(f"/delete/{right['id']}")
+    assert not os.path.exists(_path(app, right['image_path']))
+    assert not os.path.exists(_path(app, right['image_path']).replace('.jpg', '_96w.webp'))
+
+
+def test_refcounts_follow_tool_writes(app, user_id):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        ids = [conn.execute("INSERT INTO tools (name, image_path, created_by) VALUES (?, ?, ?)",
+                            (f'R{i}', 'images/shared.jpg', user_id)).lastrowid for i in range(3)]
+        conn.execute("UPDATE tools SET image_path = 'images/other.jpg' WHERE id = ?", (ids[0],))
+        conn.execute("DELETE FROM tools WHERE id = ?", (ids[1],))
+        refs = dict(conn.execute("SELECT image_path, refcount FROM image_refs "
+                                 "WHERE image_path IN ('images/shared.jpg', 'images/other.jpg')").fetchall())
+        assert refs == {'images/shared.jpg': 1, 'images/other.jpg': 1}
+        conn.execute("DELETE FROM tools WHERE id IN (?, ?)", (ids[0], ids[2]))
+        assert conn.execute("SELECT COUNT(*) FROM image_refs WHERE image_path IN "
+                            "('images/shared.jpg', 'images/other.jpg')").fetchone()[0] == 0
+        conn.rollback()
+
+
+def test_migration_rehashes_legacy_files(app, user_id, capsys):
+    import migrate_images
+    folder = app.config['UPLOAD_FOLDER']
+    photo = _png((300, 200), mode='RGB').getvalue()
+    for name in ('tool_legacy_a', 'tool_legacy_b'):
+        with open(os.path.join(folder, f'{name}.jpg'), 'wb') as f:
+            f.write(photo)
+        with open(os.path.join(folder, f'{name}_thumb.jpg'), 'wb') as f:
+            f.write(b'thumb')
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        for name in ('LegacyA', 'LegacyB'):
+            conn.execute("INSERT INTO tools (name, image_path, created_by) VALUES (?, ?, ?)",
+                         (name, f"images/tool_legacy_{name[-1].lower()}.jpg", user_id))
+        conn.commit()
+
+    assert migrate_images.migrate_images(app.config['TOOLTRACKER_DB'], folder)
+    assert '1 image(s) moved, 1 duplicate(s) merged' in capsys.readouterr().out
+
+    a, b = _tool(app, user_id, 'LegacyA'), _tool(app, user_id, 'LegacyB')
+    assert a['image_path'] == b['image_path']
+    assert images.is_content_path(images.image_relpath(a['image_path']))
+    with open(_path(app, a['image_path']), 'rb') as f:
+        assert f.read() == photo
+    assert os.path.isfile(_path(app, a['image_path']).replace('.jpg', '_200w.jpg'))
+    assert not any(name.startswith('tool_legacy') for name in os.listdir(folder))
+
+    # Re-running leaves everything in place
+    assert migrate_images.migrate_images(app.config['TOOLTRACKER_DB'], folder)
+    assert _tool(app, user_id, 'LegacyA')['image_path'] == a['image_path']
+
+
+def test_missing_variants_are_generated_on_first_request(app, client):
+    folder = app.config['UPLOAD_FOLDER']
+    with open(os.path.join(folder, 'legacy_lazy.jpg'), 'wb') as f:
+        Image.new('RGB', (600, 400), (200, 10, 10)).save(f, 'JPEG')
+
+    response = client.get('/data/images/legacy_lazy.jpg?w=96', headers={'Accept': 'image/webp'})
+    assert response.mimetype == 'image/webp'
+    assert Image.open(io.BytesIO(response.data)).width == 96
+    assert os.path.isfile(os.path.join(folder, 'legacy_lazy_480w.jpg'))
+    with app.app_context():
+        from db import get_db
+        cached = {row['path'] for row in get_db().execute("SELECT path FROM image_cache")}
+    assert {'legacy_lazy_96w.webp', 'legacy_lazy_200w.jpg'} <= cached
+    assert 'legacy_lazy.jpg' not in cached
+
+
+def test_variants_are_never_generated_from_variants(app, client):
+    folder = app.config['UPLOAD_FOLDER']
+    with open(os.path.join(folder, 'legacy_chain.jpg'), 'wb') as f:
+        Image.new('RGB', (600, 400), (10, 200, 10)).save(f, 'JPEG')
+    assert client.get('/data/images/legacy_chain.jpg?w=96').status_code == 200
+    before = set(os.listdir(folder))
+
+    for name in ('legacy_chain_96w.jpg', 'legacy_chain_480w.jpg', 'legacy_chain_thumb.jpg'):
+        client.get(f'/data/images/{name}?w=200')
+        client.get(f'/data/images/{name}?w=96')
+    assert set(os.listdir(folder)) == before
+    assert not any(name.startswith('legacy_chain_96w_') for name in before)
+
+
+def test_concurrent_requests_render_variants_once(app, monkeypatch):
+    import threading
+    folder = app.config['UPLOAD_FOLDER']
+    with open(os.path.join(folder, 'legacy_flight.png'), 'wb') as f:
+        f.write(_png((400, 300)).getvalue())
+
+    calls = []
+    render = images.render_derivatives
+
+    def slow_render(*args, **kwargs):
+        calls.append(1)
+        time.sleep(0.1)
+        return render(*args, **kwargs)
+
+    monkeypatch.setattr(images, 'render_derivatives', slow_render)
+    threads = [threading.Thread(target=images.ensure_variants, args=(app, 'legacy_flight.png')) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert os.path.isfile(os.path.join(folder, 'legacy_flight_96w.png'))
+
+
+def test_cache_budget_evicts_least_recently_used_variants(app):
+    folder = app.config['UPLOAD_FOLDER']
+    names = ['evict_a_96w.webp', 'evict_b_96w.webp', 'evict_c_96w.webp']
+    for name in names + ['evict_a.jpg']:
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b'x' * 100)
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        conn.execute("DELETE FROM image_cache")
+        conn.executemany("INSERT INTO image_cache (path, size, last_used) VALUES (?, 100, ?)",
+                         [(name, used) for used, name in enumerate(names)])
+        conn.commit()
+        assert images.enforce_cache_budget(conn, folder, 1000) == 0
+        assert images.enforce_cache_budget(conn, folder, 200) == 2
+        remaining = [row['path'] for row in conn.execute("SELECT path FROM image_cache")]
+    assert remaining == ['evict_c_96w.webp']
+    assert not os.path.exists(os.path.join(folder, 'evict_a_96w.webp'))
+    assert os.path.exists(os.path.join(folder, 'evict_c_96w.webp'))
+    assert os.path.exists(os.path.join(folder, 'evict_a.jpg'))
+
+
+def test_backfill_builds_variants_for_existing_images(app, user_id, capsys):
+    folder = app.config['UPLOAD_FOLDER']
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        for name in ('backfill_a', 'backfill_b'):
+            with open(os.path.join(folder, f'{name}.png'), 'wb') as f:
+                f.write(_png((500, 300)).getvalue())
+            conn.execute("INSERT INTO tools (name, image_path, created_by) VALUES (?, ?, ?)",
+                         (name, f'images/{name}.png', user_id))
+        conn.commit()
+
+    assert images.backfill(dict(app.config), workers=2)
+    assert '0 failed' in capsys.readouterr().out
+    for name in ('backfill_a', 'backfill_b'):
+        assert os.path.isfile(os.path.join(folder, f'{name}_200w.png'))
+        assert os.path.isfile(os.path.join(folder, f'{name}_96w.webp'))
@@ -0,0 +1,149 @@
+import sqlite3
+
+import pytest
+
+import loans
+import migrations
+
+
+def _run(app, sql, *params):
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        cursor = conn.execute(sql, params)
+        conn.commit()
+        return cursor.lastrowid
+
+
+def _active_loans(app, tool_ids):
+    with app.app_context():
+        from db import get_db
+        marks = ', '.join('?' * len(tool_ids))
+        return {row['tool_id']: dict(row) for row in get_db().execute(
+            f"SELECT id, tool_id, person_id, lent_on, lent_by FROM loans "
+            f"WHERE tool_id IN ({marks}) AND returned_on IS NULL", tool_ids)}
+
+
+@pytest.fixture
+def kit(app, user_id):
+    return [_run(app, "INSERT INTO tools (name, created_by) VALUES (?, ?)", f"Tool {i}", user_id) for i in range(5)]
+
+
+@pytest.fixture
+def person(app, user_id):
+    return _run(app, "INSERT INTO people (name, created_by) VALUES ('Ann', ?)", user_id)
+
+
+def test_lend_a_kit(app, client, user_id, kit, person):
+    resp = client.post('/api/loans/batch/lend', json={
+        'person_id': person, 'lent_date': '2024-05-01', 'items': [{'tool_id': t} for t in kit],
+    })
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body['applied'], body['failed']) == (5, 0)
+    active = _active_loans(app, kit)
+    assert [r['tool_id'] for r in body['results']] == kit
+    for result in body['results']:
+        loan = active[result['tool_id']]
+        assert result == {'tool_id': loan['tool_id'], 'ok': True, 'loan_id': loan['id']}
+        assert (loan['person_id'], loan['lent_on'], loan['lent_by']) == (person, '2024-05-01', user_id)
+
+
+def test_lend_reports_each_failure_and_applies_the_rest(app, client, user_id, kit, person):
+    _run(app, "INSERT INTO loans (tool_id, person_id, lent_on) VALUES (?, ?, '2024-01-01')", kit[1], person)
+    other = f"{user_id}-other"
+    _run(app, "INSERT INTO users (id, email, name) VALUES (?, ?, 'Other')", other, f"{other}@example.com")
+    foreign_tool = _run(app, "INSERT INTO tools (name, created_by) VALUES ('Theirs', ?)", other)
+    foreign_person = _run(app, "INSERT INTO people (name, created_by) VALUES ('Them', ?)", other)
+
+    resp = client.post('/api/loans/batch/lend', json={'person_id': person, 'items': [
+        {'tool_id': kit[0]},
+        {'tool_id': kit[1]},
+        {'tool_id': foreign_tool},
+        {'tool_id': kit[2], 'person_id': foreign_person},
+        {'tool_id': kit[3], 'lent_date': '01/05/2024'},
+        {'tool_id': kit[0]},
+        {'tool_id': 'saw'},
+        {'tool_id': kit[4], 'lent_date': '2024-06-01'},
+    ]})
+    body = resp.get_json()
+    assert (body['applied'], body['failed']) == (2, 6)
+    assert [r.get('error') for r in body['results']] == [
+        None, loans.ALREADY_LENT, loans.TOOL_NOT_FOUND, loans.PERSON_NOT_FOUND,
+        loans.BAD_DATE, loans.DUPLICATE, loans.TOOL_NOT_FOUND, None,
+    ]
+    active = _active_loans(app, kit + [foreign_tool])
+    assert set(active) == {kit[0], kit[1], kit[4]}
+    assert active[kit[4]]['lent_on'] == '2024-06-01'
+
+
+def test_return_a_kit(app, client, kit, person):
+    for tool_id in kit[:3]:
+        _run(app, "INSERT INTO loans (tool_id, person_id, lent_on) VALUES (?, ?, '2024-01-01')", tool_id, person)
+    loan_ids = {t: loan['id'] for t, loan in _active_loans(app, kit).items()}
+
+    resp = client.post('/api/loans/batch/return', json={'returned_date': '2024-02-01', 'items': [
+        {'tool_id': kit[0]}, {'tool_id': kit[1], 'returned_date': '2024-03-01'}, {'tool_id': kit[3]},
+    ]})
+    body = resp.get_json()
+    assert body['results'] == [
+        {'tool_id': kit[0], 'ok': True, 'loan_id': loan_ids[kit[0]]},
+        {'tool_id': kit[1], 'ok': True, 'loan_id': loan_ids[kit[1]]},
+        {'tool_id': kit[3], 'ok': False, 'error': loans.NOT_LENT},
+    ]
+    assert set(_active_loans(app, kit)) == {kit[2]}
+    with app.app_context():
+        from db import get_db
+        returned = dict(get_db().execute(
+            "SELECT tool_id, returned_on FROM loans WHERE tool_id IN (?, ?)", (kit[0], kit[1])).fetchall())
+    assert returned == {kit[0]: '2024-02-01', kit[1]: '2024-03-01'}
+
+
+@pytest.mark.parametrize('body', [None, {}, {'items': []}, {'items': 'all'},
+                                  {'items': [{'tool_id': 1}] * (loans.MAX_BATCH_ITEMS + 1)}])
+def test_malformed_batches_are_rejected(client, body):
+    resp = client.post('/api/loans/batch/lend', json=body)
+    assert resp.status_code == 400
+    assert 'error' in resp.get_json()
+
+
+class CountingConnection(sqlite3.Connection):
+    statements = 0
+
+    def execute(self, sql, *args):
+        self.statements += 1
+        return super().execute(sql, *args)
+
+
+def test_batches_run_the_same_statements_whatever_their_size():
+    conn = sqlite3.connect(':memory:', factory=CountingConnection)
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO users (id, email, name) VALUES ('u1', 'u1@example.com', 'U1')")
+    conn.execute("INSERT INTO people (id, name, created_by) VALUES (1, 'Ann', 'u1')")
+    conn.executemany("INSERT INTO tools (id, name, created_by) VALUES (?, 'Saw', 'u1')", [(i,) for i in range(1, 201)])
+    conn.commit()
+
+    for size in (1, 200):
+        conn.statements = 0
+        results = loans.lend_tools(conn, 'u1', [{'tool_id': i} for i in range(1, size + 1)], person_id=1)
+        conn.commit()
+        assert all(r['ok'] for r in results)
+        assert conn.statements == 4  # BEGIN IMMEDIATE, check, insert, loan ids
+
+        conn.statements = 0
+        results = loans.return_tools(conn, 'u1', [{'tool_id': i} for i in range(1, size + 1)])
+        conn.commit()
+        assert all(r['ok'] for r in results)
+        assert conn.statements == 3  # BEGIN IMMEDIATE, check, update
+    conn.close()
+
+
+def test_batches_refuse_to_run_inside_an_open_transaction():
+    conn = sqlite3.connect(':memory:')
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO users (id, email, name) VALUES ('u1', 'u1@example.com', 'U1')")
+    with pytest.raises(RuntimeError, match='outside a transaction'):
+        loans.lend_tools(conn, 'u1', [{'tool_id': 1}], person_id=1)
+    with pytest.raises(RuntimeError, match='outside a transaction'):
+        loans.return_tools(conn, 'u1', [{'tool_id': 1}])
+    conn.close()
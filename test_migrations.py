@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+
+import pytest
+
+import migrations
+
+
+def _connect(path):
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_fresh_database_is_migrated_to_latest(tmp_path):
+    path = tmp_path / 'fresh.db'
+    conn = _connect(path)
+    assert migrations.migrate(conn, str(path)) == [v for v, _, _ in migrations.MIGRATIONS]
+    assert migrations.schema_version(conn) == migrations.LATEST_VERSION
+    assert {'tools_fts', 'report_totals', 'image_jobs', 'image_refs'} <= {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master")
+    }
+
+
+def test_current_schema_costs_one_pragma(tmp_path):
+    path = tmp_path / 'current.db'
+    conn = _connect(path)
+    migrations.migrate(conn, str(path))
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert migrations.migrate(conn, str(path)) == []
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_legacy_database_gains_missing_columns(tmp_path):
+    path = tmp_path / 'legacy.db'
+    conn = _connect(path)
+    conn.executescript("""
+        CREATE TABLE tools (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                            description TEXT, value REAL, image_path TEXT);
+        CREATE TABLE people (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL);
+        CREATE TABLE loans (id INTEGER PRIMARY KEY AUTOINCREMENT, tool_id INTEGER NOT NULL,
+                            person_id INTEGER NOT NULL, lent_on TEXT NOT NULL, returned_on TEXT);
+        INSERT INTO tools (name, value) VALUES ('Old hammer', 12.5);
+    """)
+    migrations.migrate(conn, str(path))
+    assert {'brand', 'model_number', 'serial_number', 'acquisition_date', 'image_status', 'created_by'} <= _columns(conn, 'tools')
+    assert {'contact_info', 'created_by'} <= _columns(conn, 'people')
+    assert 'lent_by' in _columns(conn, 'loans')
+    assert conn.execute("SELECT name FROM tools").fetchone()[0] == 'Old hammer'
+    # The search index is populated from the existing rows
+    assert conn.execute("SELECT rowid FROM tools_fts WHERE tools_fts MATCH 'hammer'").fetchone()
+
+
+def test_failed_step_is_rolled_back_and_retried(tmp_path):
+    path = tmp_path / 'fail.db'
+    conn = _connect(path)
+
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (x INTEGER)")
+        raise sqlite3.OperationalError('disk on fire')
+
+    steps = [(1, 'first', lambda conn: conn.execute("CREATE TABLE first (x INTEGER)")), (2, 'broken', broken)]
+    with pytest.raises(sqlite3.OperationalError):
+        migrations.migrate(conn, str(path), steps)
+    assert migrations.schema_version(conn) == 1
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert 'first' in tables and 'half_done' not in tables
+
+    steps[1] = (2, 'fixed', lambda conn: conn.execute("CREATE TABLE second (x INTEGER)"))
+    assert migrations.migrate(conn, str(path), steps) == [2]
+
+
+def test_concurrent_workers_migrate_once(tmp_path):
+    path = tmp_path / 'race.db'
+    _connect(path).close()
+    runs = []
+
+    def slow_step(conn):
+        runs.append(1)
+        conn.execute("CREATE TABLE raced (x INTEGER)")
+
+    steps = [(1, 'slow', slow_step)]
+    applied = []
+    threads = [
+        threading.Thread(target=lambda: applied.append(migrations.migrate(_connect(path), str(path), steps)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert runs == [1]
+    assert sorted(applied) == [[], [], [], [1]]
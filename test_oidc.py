@@ -0,0 +1,225 @@
+import json
+import logging
+import time
+
+import pytest
+import requests
+from flask import Flask
+
+import oidc_metadata
+from auth import OIDCAuth
+from oidc_metadata import ProviderMetadata, cache_lifetime
+from stub_idp import DISCOVERY_PATH, StubIdP
+
+REDIRECT_URI = 'http://localhost:5000/oidc/callback'
+
+
+@pytest.fixture
+def idp():
+    with StubIdP(max_age=120) as idp:
+        yield idp
+
+
+@pytest.fixture
+def oidc_app(tmp_path, idp):
+    app = Flask(__name__)
+    app.config.update(
+        OIDC_CLIENT_ID='tooltracker',
+        OIDC_REDIRECT_URI=REDIRECT_URI,
+        OIDC_DISCOVERY_URL=idp.discovery_url,
+        OIDC_DISCOVERY_CACHE=str(tmp_path / 'oidc-discovery.json'),
+        OIDC_DISCOVERY_CACHE_TTL=3600,
+        OIDC_HTTP_BACKOFF=0,
+    )
+    return app
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_construction_makes_no_requests(oidc_app, idp):
+    OIDCAuth(oidc_app)
+    assert idp.requests == []
+
+
+def test_login_never_waits_for_the_provider(oidc_app, idp, monkeypatch):
+    monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')  # the stub speaks plain http
+    oidc = OIDCAuth(oidc_app)
+    idp.latency = 0.5
+    start = time.monotonic()
+    # Nothing cached yet: the login is turned away rather than blocked
+    assert oidc.get_authorization_url(REDIRECT_URI, 'state') is None
+    assert oidc.discovery_pending
+    assert time.monotonic() - start < 0.2
+
+    # The refresher started by that call fetches discovery, then the JWKS
+    _wait_for(lambda: oidc.metadata.jwks() is not None)
+    assert idp.paths() == [DISCOVERY_PATH, '/jwks']
+    url = oidc.get_authorization_url(REDIRECT_URI, 'state')
+    assert url.startswith(idp.base_url + '/authorize')
+    assert idp.paths() == [DISCOVERY_PATH, '/jwks']
+
+
+def _tokens(oidc):
+    return oidc.get_token(REDIRECT_URI + '?code=auth-code&state=s', REDIRECT_URI)
+
+
+def _callback(oidc):
+    return oidc.get_userinfo(_tokens(oidc)['access_token'])
+
+
+def test_callbacks_reuse_one_connection(oidc_app, idp):
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()
+    for _ in range(3):
+        assert _callback(oidc) == idp.claims
+    assert idp.paths('POST') == ['/token'] * 3
+    assert idp.connections == 1
+
+
+def test_token_exchange_retries_server_errors(oidc_app, idp):
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()
+    idp.failures['/token'] = 2
+    assert _tokens(oidc)['access_token'] == 'stub-access-token'
+    assert idp.paths('POST') == ['/token'] * 3
+
+    # Once the retries are used up the failure surfaces as before
+    idp.failures['/userinfo'] = -1
+    with pytest.raises(requests.exceptions.HTTPError):
+        oidc.get_userinfo('stub-access-token')
+    assert idp.paths('GET').count('/userinfo') == 3
+
+
+def test_idp_calls_log_their_latency(oidc_app, idp, caplog):
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()
+    with caplog.at_level(logging.INFO):
+        _callback(oidc)
+    timings = [r.getMessage() for r in caplog.records if r.getMessage().startswith('OIDC ')]
+    assert timings[0].startswith(f'OIDC token exchange: POST {idp.base_url}/token -> 200 in ')
+    assert timings[1].startswith(f'OIDC userinfo: GET {idp.base_url}/userinfo -> 200 in ')
+    assert all(t.endswith(' ms') for t in timings)
+
+
+def test_claims_come_from_the_verified_id_token(oidc_app, idp):
+    idp.tokens['id_token'] = idp.id_token(nonce='n-1')
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()
+    claims = oidc.get_user_claims(_tokens(oidc), nonce='n-1')
+    assert claims['sub'] == 'stub-user' and claims['email'] == 'stub@example.com'
+    assert '/userinfo' not in idp.paths()
+
+
+@pytest.mark.parametrize('overrides, nonce', [
+    ({'email': None}, 'n-1'),  # required claim missing
+    ({}, 'another-login'),  # nonce mismatch
+    ({'aud': 'someone-else'}, 'n-1'),
+])
+def test_userinfo_is_asked_when_the_id_token_is_unusable(oidc_app, idp, overrides, nonce):
+    idp.tokens['id_token'] = idp.id_token(nonce='n-1', **overrides)
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()
+    assert oidc.get_user_claims(_tokens(oidc), nonce=nonce) == idp.claims
+    assert idp.paths('GET').count('/userinfo') == 1
+
+
+def test_unknown_signing_key_triggers_a_jwks_refresh(oidc_app, idp):
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()  # JWKS cached before the key exists
+    idp.tokens['id_token'] = idp.id_token(nonce='n-1')
+    assert oidc.get_user_claims(_tokens(oidc), nonce='n-1') == idp.claims
+    oidc.metadata.refresh_due()
+    assert idp.paths().count('/jwks') == 2
+    assert oidc.get_user_claims(_tokens(oidc), nonce='n-1')['sub'] == 'stub-user'
+    assert idp.paths('GET').count('/userinfo') == 1
+
+
+def test_id_token_verification_can_be_turned_off(oidc_app, idp):
+    oidc_app.config['OIDC_VERIFY_ID_TOKEN'] = False
+    idp.tokens['id_token'] = idp.id_token(nonce='n-1')
+    oidc = OIDCAuth(oidc_app)
+    oidc.metadata.refresh_due()
+    assert oidc.get_user_claims(_tokens(oidc), nonce='n-1') == idp.claims
+    assert '/userinfo' in idp.paths()
+
+
+def test_documents_are_shared_through_the_disk_cache(oidc_app, idp):
+    first = ProviderMetadata(idp.discovery_url, oidc_app.config['OIDC_DISCOVERY_CACHE'])
+    first.refresh_due()
+    with open(oidc_app.config['OIDC_DISCOVERY_CACHE']) as f:
+        cached = json.load(f)
+    assert set(cached['entries']) == {'discovery', 'jwks'}
+
+    # Another worker (or a restart) finds both documents fresh on disk
+    second = ProviderMetadata(idp.discovery_url, oidc_app.config['OIDC_DISCOVERY_CACHE'])
+    assert second.discovery() == idp.discovery()
+    assert second.refresh_due() > 60
+    assert idp.paths() == [DISCOVERY_PATH, '/jwks']
+
+
+def test_expired_discovery_is_revalidated_with_etag(idp):
+    metadata = ProviderMetadata(idp.discovery_url)
+    metadata.refresh_due()
+    metadata.request_refresh('discovery')
+    metadata.refresh_due()
+    _, path, headers = idp.requests[-1]
+    assert path == DISCOVERY_PATH and headers['If-None-Match'] == '"v1"'
+    assert metadata.revalidations == 1
+    assert metadata.discovery() == idp.discovery()
+
+
+def test_revalidation_returns_the_document_it_revalidated(idp, monkeypatch):
+    metadata = ProviderMetadata(idp.discovery_url)
+    revalidated = metadata.refresh('discovery', idp.discovery_url)
+    save = metadata._save_locked
+
+    def save_then_replace():
+        # Another refresh storing a newer document as soon as the lock is free
+        save()
+        metadata._entries['discovery'] = dict(metadata._entries['discovery'], document={'issuer': 'newer'})
+
+    monkeypatch.setattr(metadata, '_save_locked', save_then_replace)
+    assert metadata.refresh('discovery', idp.discovery_url) == revalidated
+    assert metadata.revalidations == 1
+
+
+def test_provider_outage_keeps_the_cached_documents(idp):
+    metadata = ProviderMetadata(idp.discovery_url)
+    metadata.refresh_due()
+    metadata.request_refresh()
+    idp.failures[DISCOVERY_PATH] = -1
+    with pytest.raises(Exception):
+        metadata.refresh_due()
+    assert metadata.discovery() == idp.discovery()
+
+
+def test_refresher_retries_with_backoff(idp, monkeypatch):
+    monkeypatch.setattr(oidc_metadata, 'RETRY_MIN', 0.05)
+    idp.failures[DISCOVERY_PATH] = 2
+    metadata = ProviderMetadata(idp.discovery_url)
+    metadata.start()
+    _wait_for(lambda: metadata.discovery() is not None)
+    assert metadata.errors == 2
+    assert idp.paths().count(DISCOVERY_PATH) == 3
+
+
+def test_cache_for_another_provider_is_ignored(tmp_path, idp):
+    path = str(tmp_path / 'cache.json')
+    with open(path, 'w') as f:
+        json.dump({'discovery_url': 'https://other.example.com/', 'entries': {'discovery': {
+            'document': {'token_endpoint': 'x'}, 'expires_at': time.time() + 600}}}, f)
+    metadata = ProviderMetadata(idp.discovery_url, path)
+    assert metadata.discovery() is None
+
+
+def test_cache_lifetime_follows_headers():
+    assert cache_lifetime({'Cache-Control': 'public, max-age=600'}, 3600, 86400) == 600
+    assert cache_lifetime({'Cache-Control': 'max-age=999999'}, 3600, 86400) == 86400
+    assert cache_lifetime({'Cache-Control': 'no-store'}, 3600, 86400) == oidc_metadata.MIN_TTL
+    assert cache_lifetime({'Expires': 'Thu, 01 Jan 1970 00:20:00 GMT'}, 3600, 86400, now=0) == 1200
+    assert cache_lifetime({}, 3600, 86400) == 3600
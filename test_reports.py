@@ -0,0 +1,78 @@
+import reports
+
+
+def _seed(client, app, user_id):
+    client.post('/add', data={'name': 'Drill', 'value': '120', 'brand': 'DeWalt'})
+    client.post('/add', data={'name': 'Saw', 'value': '45.5', 'brand': 'DeWalt'})
+    client.post('/add', data={'name': 'Level', 'value': '', 'brand': 'Stanley'})
+    client.post('/add', data={'name': 'Router', 'value': '1200.10', 'brand': ''})
+    client.post('/add_person', data={'name': 'Pat'})
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        tools = {r['name']: r['id'] for r in conn.execute(
+            "SELECT id, name FROM tools WHERE created_by = ?", (user_id,))}
+        person = conn.execute("SELECT id FROM people WHERE created_by = ?", (user_id,)).fetchone()[0]
+    return tools, person
+
+
+def _summary(app, user_id):
+    with app.app_context():
+        from db import get_db
+        return reports.financial_summary(get_db(), user_id), reports.brand_summary(get_db(), user_id)
+
+
+def _assert_consistent(app):
+    with app.app_context():
+        from db import get_db
+        assert reports.check_report_tables(get_db()) == []
+
+
+def test_summaries_follow_every_write(app, client, user_id):
+    tools, person = _seed(client, app, user_id)
+    (inventory, lent, buckets), brands = _summary(app, user_id)
+    assert inventory == {'total_tools': 4, 'total_value': 1365.6, 'avg_value': 341.4}
+    assert lent == {'tools_lent_out': 0, 'value_lent_out': 0}
+    assert [(b['value_range'], b['count']) for b in buckets] == [
+        ('No Value Set', 1), ('$0 - $50', 1), ('$101 - $250', 1), ('$1000+', 1)]
+    assert [(b['brand'], b['tool_count'], b['total_value']) for b in brands] == [
+        ('DeWalt', 2, 165.5), ('Stanley', 1, 0)]
+
+    client.post(f"/lend/{tools['Drill']}", data={'person_id': person})
+    client.post(f"/edit/{tools['Drill']}", data={'name': 'Drill', 'value': '150', 'brand': 'Makita'})
+    (inventory, lent, _), brands = _summary(app, user_id)
+    assert lent == {'tools_lent_out': 1, 'value_lent_out': 150}
+    assert {b['brand'] for b in brands} == {'Makita', 'DeWalt', 'Stanley'}
+
+    client.post(f"/return/{tools['Drill']}")
+    client.post(f"/delete/{tools['Saw']}")
+    (inventory, lent, _), brands = _summary(app, user_id)
+    assert inventory['total_tools'] == 3
+    assert lent == {'tools_lent_out': 0, 'value_lent_out': 0}
+    assert 'DeWalt' not in {b['brand'] for b in brands}
+    _assert_consistent(app)
+
+
+def test_report_pages_render(client, app, user_id):
+    _seed(client, app, user_id)
+    resp = client.get('/report/financial')
+    assert resp.status_code == 200
+    assert b'1365.60' in resp.data
+    resp = client.get('/brand-report')
+    assert resp.status_code == 200
+    assert b'DeWalt' in resp.data
+
+
+def test_checker_reports_and_repairs_drift(app, user_id, client):
+    _seed(client, app, user_id)
+    with app.app_context():
+        from db import get_db
+        conn = get_db()
+        conn.execute("UPDATE report_totals SET total_tools = total_tools + 5 WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM report_brands WHERE user_id = ? AND brand = 'Stanley'", (user_id,))
+        problems = reports.check_report_tables(conn)
+        assert any('total_tools' in p for p in problems)
+        assert any('Stanley' in p for p in problems)
+        reports.rebuild_report_tables(conn)
+        conn.commit()
+        assert reports.check_report_tables(conn) == []
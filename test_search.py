@@ -0,0 +1,95 @@
+import sqlite3
+import pytest
+import search
+
+
+def _ids(client, term):
+    resp = client.get('/api/tools', query_string={'search': term})
+    assert resp.status_code == 200
+    return [t['id'] for t in resp.get_json()['tools']]
+
+
+def _add_tool(client, **fields):
+    client.post('/add', data=fields)
+    return client.get('/api/tools').get_json()['tools'][-1]['id']
+
+
+def test_match_query():
+    assert search.match_query('dew drill') == '"dew"* "drill"*'
+    assert search.match_query('16-100') == '"16"* "100"*'
+    assert search.match_query(' "*) ') == ''
+
+
+def test_search_prefix_and_ranking(client):
+    saw = _add_tool(client, name='Circular saw', brand='Makita')
+    drill = _add_tool(client, name='Hammer drill', brand='DeWalt', description='makes holes')
+    hammer = _add_tool(client, name='Claw hammer', brand='Stanley', serial_number='HM-001')
+
+    assert sorted(_ids(client, 'ham')) == [drill, hammer]
+    assert _ids(client, 'dew dri') == [drill]
+    assert _ids(client, 'hm') == [hammer]
+    # A brand hit outranks a description hit
+    assert _ids(client, 'mak') == [saw, drill]
+
+
+def test_search_index_follows_writes(app, client):
+    tool_id = _add_tool(client, name='Torque wrench')
+    client.post('/add_person', data={'name': 'Alice Borrower'})
+    with app.app_context():
+        from db import get_db
+        person_id = get_db().execute("SELECT id FROM people WHERE name = 'Alice Borrower'").fetchone()[0]
+
+    client.post(f'/lend/{tool_id}', data={'person_id': person_id})
+    assert _ids(client, 'alice') == [tool_id]
+
+    client.post(f'/people/{person_id}/edit', data={'name': 'Alicia Borrower'})
+    assert _ids(client, 'alicia') == [tool_id]
+
+    client.post(f'/return/{tool_id}')
+    assert _ids(client, 'alicia') == []
+
+    client.post(f'/edit/{tool_id}', data={'name': 'Impact driver'})
+    assert _ids(client, 'torque') == []
+    assert _ids(client, 'impact') == [tool_id]
+
+
+def test_search_adds_substring_matches_after_word_starts(client):
+    hammer = _add_tool(client, name='Claw hammer', serial_number='HM001')
+    bit = _add_tool(client, name='Drill bit', model_number='X001')
+    drill = _add_tool(client, name='Drill 001')
+
+    # The word-start match ranks first, the matches inside words follow
+    assert _ids(client, '001') == [drill, hammer, bit]
+    assert _ids(client, 'law') == [hammer]
+    assert _ids(client, 'hm0') == [hammer]
+    assert _ids(client, 'zzz') == []
+
+
+def test_search_like_fallback(app, client):
+    tool_id = _add_tool(client, name='Orbital sander')
+    app.extensions['tool_search_fts'] = False
+    try:
+        assert _ids(client, 'bital') == [tool_id]
+    finally:
+        app.extensions['tool_search_fts'] = True
+
+
+def test_rebuild_matches_triggers():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+        CREATE TABLE tools (id INTEGER PRIMARY KEY, name TEXT, description TEXT, brand TEXT,
+                            model_number TEXT, serial_number TEXT);
+        CREATE TABLE people (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE loans (id INTEGER PRIMARY KEY, tool_id INTEGER, person_id INTEGER, returned_on TEXT);
+        INSERT INTO tools VALUES (1, 'Drill', '', 'Bosch', '', '');
+        INSERT INTO people VALUES (1, 'Bob');
+        INSERT INTO loans VALUES (1, 1, 1, NULL);
+    """)
+    if not search.ensure_search_index(conn):
+        pytest.skip('FTS5 not available')
+    conn.execute("INSERT INTO tools VALUES (2, 'Saw', '', 'Ryobi', '', '')")
+    conn.execute("INSERT INTO loans VALUES (2, 2, 1, NULL)")
+    synced = conn.execute("SELECT rowid, * FROM tools_fts ORDER BY rowid").fetchall()
+    search.rebuild_search_index(conn)
+    assert conn.execute("SELECT rowid, * FROM tools_fts ORDER BY rowid").fetchall() == synced
+    assert [r[-1] for r in synced] == ['Bob', 'Bob']
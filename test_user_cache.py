@@ -0,0 +1,52 @@
+
+import auth
+from auth import User, UserCache
+
+
+def test_user_has_no_instance_dict():
+    user = User('u1', 'u1@example.com', 'One')
+    assert not hasattr(user, '__dict__')
+    assert user.get_id() == 'u1' and user.is_authenticated and not user.is_anonymous
+    assert user == User('u1', 'other@example.com', 'Other')
+
+
+def test_cache_is_lru_bounded():
+    cache = UserCache(maxsize=2, ttl=60)
+    for uid in ('a', 'b'):
+        cache.put(User(uid, f'{uid}@example.com', uid))
+    assert cache.get('a') is not None  # 'b' is now least recently used
+    cache.put(User('c', 'c@example.com', 'c'))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats() == {'size': 2, 'hits': 3, 'misses': 1}
+
+
+def test_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, 'monotonic', lambda: now[0])
+    cache = UserCache(maxsize=10, ttl=5)
+    cache.put(User('a', 'a@example.com', 'a'))
+    now[0] += 4
+    assert cache.get('a') is not None
+    now[0] += 2
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_authenticated_requests_load_the_user_once(app, client, user_id):
+    cache = auth.get_user_cache(app)
+    cache.clear()
+    before = cache.stats()
+    for _ in range(3):
+        assert client.get('/api/tools').status_code == 200
+    after = cache.stats()
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 2
+
+
+def test_login_invalidates_cached_user(app, client, user_id):
+    client.get('/api/tools')
+    with app.test_request_context():
+        assert User.get(user_id).name == 'Test User'
+        auth.create_or_update_user({'sub': user_id, 'email': f'{user_id}@example.com', 'name': 'Renamed'})
+        assert User.get(user_id).name == 'Renamed'